@@ -1,14 +1,39 @@
 import hashlib
-import streamlit as st
+import os
+import sys
 from supabase import create_client
 from postgrest.exceptions import APIError
 
+from kpi_rollup import ROLLUP_KEY_COLS, diff_rollup_contrib
+
+ROLLUP_TABLE = "kpi_rollups"
+
+
+def _secret(name: str, default=None):
+    """
+    設定值：在 Streamlit 內執行時讀 st.secrets，其餘（CLI / 排程）讀同名環境變數。
+    不主動 import streamlit，讓無介面流程啟動時不必載入整套 UI。
+    """
+    st = sys.modules.get("streamlit")
+    if st is not None:
+        try:
+            v = st.secrets.get(name)
+            if v:
+                return v
+        except Exception:
+            pass  # 沒有 secrets.toml
+    return os.environ.get(name, default)
+
+
+def _bucket() -> str:
+    return _secret("SUPABASE_BUCKET", "work-efficiency-exports")
+
 
 def _sb():
-    url = st.secrets.get("SUPABASE_URL")
-    key = st.secrets.get("SUPABASE_SERVICE_ROLE_KEY")
+    url = _secret("SUPABASE_URL")
+    key = _secret("SUPABASE_SERVICE_ROLE_KEY")
     if not url or not key:
-        raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in secrets")
+        raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in secrets / environment")
     return create_client(url, key)
 
 
@@ -23,7 +48,7 @@ def upload_export_bytes(*, content: bytes, object_path: str) -> str:
     We do: upload -> if conflict/exists then update.
     """
     sb = _sb()
-    bucket = st.secrets.get("SUPABASE_BUCKET", "work-efficiency-exports")
+    bucket = _bucket()
 
     file_options = {
         "contentType": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
@@ -43,6 +68,144 @@ def upload_export_bytes(*, content: bytes, object_path: str) -> str:
 
 
 def insert_audit_run(payload: dict) -> dict:
+    """
+    寫入一筆留存；payload 若帶 rollup_contrib，同步累加到 kpi_rollups。
+    彙總失敗不影響留存本身（回傳列帶 rollup_error，可事後 rebuild_rollups 修復）。
+    """
     sb = _sb()
     res = sb.schema("public").table("audit_runs").insert(payload).execute()
-    return res.data[0] if res.data else {}
+    row = res.data[0] if res.data else {}
+    try:
+        apply_rollup_contrib(payload.get("rollup_contrib") or [], sign=1, sb=sb)
+    except Exception as e:
+        row["rollup_error"] = str(e)
+    return row
+
+
+def insert_incremental_audit_run(payload: dict, new_by_date: dict, store) -> dict:
+    """
+    增量模式的留存：new_by_date 為本次重算各日期的貢獻（kpi_rollup.contrib_by_date），
+    rollup_contrib = 本次 − 這些日期先前已計入的貢獻（store：partial_store.PartialStore，見 credit_rollup）。
+    同一天重傳 / 補傳 / 連動重算都只計入差額，刪除此留存時扣回的也是差額。
+    """
+    def persist(old_by_date: dict) -> dict:
+        new = [r for rows in new_by_date.values() for r in rows]
+        old = [r for rows in old_by_date.values() for r in rows]
+        return insert_audit_run({**payload, "rollup_contrib": diff_rollup_contrib(new, old)})
+
+    return store.credit_rollup(new_by_date, persist)
+
+
+def delete_audit_run(run_id: str):
+    """刪除一筆留存，並從 kpi_rollups 扣回該次貢獻。"""
+    sb = _sb()
+    table = sb.schema("public").table("audit_runs")
+    res = table.select("rollup_contrib").eq("id", run_id).limit(1).execute()
+    contrib = (res.data[0].get("rollup_contrib") if res.data else None) or []
+    table.delete().eq("id", run_id).execute()
+    apply_rollup_contrib(contrib, sign=-1, sb=sb)
+
+
+def delete_audit_runs(run_ids: list) -> dict:
+    """
+    批次刪除多筆留存（一次 Storage remove([...]) + 一次 DB in_ 刪除 + 一次彙總扣回）。
+    回傳各階段結果，呼叫端可據以回報部分失敗：
+      deleted          實際刪除的紀錄 ID
+      failed           要求刪除但 DB 未刪除的紀錄 ID
+      storage_removed  已移除的 Storage 物件
+      storage_missing  Storage 中找不到（已不存在）的物件
+      errors           各階段錯誤訊息
+    """
+    out = {"deleted": [], "failed": [], "storage_removed": [], "storage_missing": [], "errors": []}
+    ids = [str(x) for x in dict.fromkeys(run_ids or [])]
+    if not ids:
+        return out
+
+    sb = _sb()
+    table = sb.schema("public").table("audit_runs")
+    rows = table.select("id,export_object_path,rollup_contrib").in_("id", ids).execute().data or []
+    found = {str(r["id"]): r for r in rows}
+    out["failed"] = [i for i in ids if i not in found]
+
+    paths = [r["export_object_path"] for r in rows if r.get("export_object_path")]
+    if paths:
+        try:
+            removed = remove_storage_objects(paths, sb=sb)
+        except Exception as e:
+            # Storage 整批失敗 → 不刪 DB，保留路徑供重試
+            out["errors"].append(f"Storage：{e}")
+            out["failed"] = ids
+            return out
+        out["storage_removed"] = removed
+        out["storage_missing"] = [p for p in paths if p not in set(removed)]
+
+    try:
+        res = table.delete().in_("id", list(found)).execute()
+        deleted = {str(r["id"]) for r in (res.data or [])}
+    except Exception as e:
+        out["errors"].append(f"DB：{e}")
+        deleted = set()
+    out["deleted"] = [i for i in found if i in deleted]
+    out["failed"] += [i for i in found if i not in deleted]
+
+    contrib = [c for i in out["deleted"] for c in (found[i].get("rollup_contrib") or [])]
+    try:
+        apply_rollup_contrib(contrib, sign=-1, sb=sb)
+    except Exception as e:
+        out["errors"].append(f"月/週彙總：{e}")
+    return out
+
+
+def remove_storage_objects(object_paths: list, *, sb=None) -> list:
+    """一次呼叫移除多個 Storage 物件；回傳實際移除的路徑。"""
+    if not object_paths:
+        return []
+    sb = sb or _sb()
+    bucket = _bucket()
+    res = sb.storage.from_(bucket).remove(list(object_paths)) or []
+    return [r.get("name") for r in res if isinstance(r, dict) and r.get("name")]
+
+
+# ========= KPI 月 / 週彙總（增量維護） =========
+def apply_rollup_contrib(contrib: list, *, sign: int = 1, sb=None):
+    """
+    本次貢獻以 sign（+1 新增 / -1 刪除）加減進 kpi_rollups；同鍵先合併，
+    加減由資料庫函式 apply_kpi_rollup 原子完成（DDL 見 kpi_rollup），人日數歸零的列一併刪除。
+    """
+    rows = diff_rollup_contrib(contrib or [], []) if sign > 0 else diff_rollup_contrib([], contrib or [])
+    if not rows:
+        return
+    sb = sb or _sb()
+    for i in range(0, len(rows), 500):
+        sb.rpc("apply_kpi_rollup", {"contrib": rows[i:i + 500]}).execute()
+
+
+def rebuild_rollups() -> int:
+    """由 audit_runs 全部留存的 rollup_contrib 重建 kpi_rollups（補資料 / 修復用；單一交易，見 rebuild_kpi_rollups）。"""
+    res = _sb().rpc("rebuild_kpi_rollups", {}).execute()
+    return int(res.data or 0)
+
+
+def fetch_rollups(*, app_name: str, period_type: str = "month", since: str | None = None,
+                  page_size: int = 1000) -> list:
+    """讀出某模組某期間類型的彙總列；分頁讀取（PostgREST 單次最多回傳 1000 列）。"""
+    sb = _sb()
+    out = []
+    offset = 0
+    while True:
+        q = (
+            sb.schema("public").table(ROLLUP_TABLE)
+            .select("*")
+            .eq("app_name", app_name)
+            .eq("period_type", period_type)
+        )
+        if since:
+            q = q.gte("period_start", since)
+        for c in ROLLUP_KEY_COLS[1:]:
+            q = q.order(c)
+        rows = q.range(offset, offset + page_size - 1).execute().data or []
+        out.extend(rows)
+        if len(rows) < page_size:
+            break
+        offset += page_size
+    return out
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+無介面批次執行（夜間排程用）：不開 Streamlit，直接對一批匯出檔產出 KPI 報表
+
+用法：
+    python batch_cli.py qc    exports/驗收/*.xlsx -o out/
+    python batch_cli.py shelf exports/上架/       -o out/ --format xlsx,parquet --workers 4
+    python batch_cli.py qc    a.xlsx b.xlsx --merge --persist --operator nightly
+
+- 輸入可為檔案、目錄（取其下所有 .xlsx/.xlsm/.xls/.xlsb/.csv）或 glob
+- 每個檔案在獨立 worker process 計算（--workers，預設 CPU 數）；--merge 則合併成一次計算（跨檔去重）
+- 輸出：xlsx（與頁面下載相同的報表）/ parquet（各結果表一檔，需安裝 pyarrow）
+- --persist：同頁面一樣寫入 audit_runs + Storage + kpi_rollups
+  （Supabase 設定讀環境變數 SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY / SUPABASE_BUCKET）
+- 不 import streamlit，排程啟動不必載入 UI
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import glob
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import pandas as pd
+
+EXPORT_EXTS = (".xlsx", ".xlsm", ".xls", ".xlsb", ".csv")
+OUTPUT_FORMATS = ("xlsx", "parquet")
+
+# 模組別：app_name 與頁面留存一致；tables 為要輸出 parquet 的結果表
+MODULES = {
+    "qc": {
+        "app_name": "驗收作業效能（KPI）",
+        "xlsx_suffix": "驗收KPI",
+        "tables": ["full_df", "ampm_df", "idle_df"],
+        "storage_dir": "qc_runs",
+    },
+    "shelf": {
+        "app_name": "上架產能分析（Putaway KPI）",
+        "xlsx_suffix": "上架績效",
+        "tables": ["summary_df", "detail_df", "ampm_df"],
+        "storage_dir": "putaway_runs",
+    },
+}
+
+
+# ===== 輸入 =====
+def expand_inputs(patterns: List[str]) -> List[str]:
+    """檔案 / 目錄 / glob → 去重後的檔案清單（依路徑排序）"""
+    found: Dict[str, None] = {}
+    for p in patterns:
+        if os.path.isdir(p):
+            cands = [os.path.join(p, fn) for fn in os.listdir(p)]
+        elif any(ch in p for ch in "*?["):
+            cands = glob.glob(p, recursive=True)
+        else:
+            cands = [p]
+        for c in sorted(cands):
+            if os.path.isfile(c) and c.lower().endswith(EXPORT_EXTS) and not os.path.basename(c).startswith("~$"):
+                found[os.path.abspath(c)] = None
+    return list(found)
+
+
+# ===== 計算（worker process 內執行） =====
+def run_engine(module: str, files: List[tuple], params: dict) -> dict:
+    """files = [(檔名, bytes), ...]；單檔走原入口，多檔走跨檔去重入口"""
+    if module == "qc":
+        from qc_core import run_qc_efficiency, run_qc_efficiency_files
+        include_source = bool(params.get("include_source"))
+        if len(files) == 1:
+            return run_qc_efficiency(files[0][1], files[0][0], params.get("skip_rules"), include_source=include_source)
+        return run_qc_efficiency_files(files, params.get("skip_rules"), max_workers=1, include_source=include_source)
+
+    from shelf_core import ShelfParams, run_shelf_efficiency, run_shelf_efficiency_files
+    shelf_params = ShelfParams.of(params)  # 只取上架用得到的鍵
+    if len(files) == 1:
+        return run_shelf_efficiency(files[0][1], files[0][0], shelf_params)
+    return run_shelf_efficiency_files(files, shelf_params, max_workers=1)
+
+
+def process_job(module: str, paths: List[str], params: dict) -> dict:
+    """讀檔 + 計算；例外不往外拋，回傳 error 讓其他檔案繼續"""
+    t0 = time.perf_counter()
+    try:
+        files = []
+        for p in paths:
+            with open(p, "rb") as f:
+                files.append((os.path.basename(p), f.read()))
+        t1 = time.perf_counter()
+        result = run_engine(module, files, params)
+        t2 = time.perf_counter()
+        return {"paths": paths, "result": result, "read_s": t1 - t0, "compute_s": t2 - t1,
+                "source_sha256": hashlib.sha256(b"".join(b for _, b in files)).hexdigest()}
+    except Exception as e:
+        return {"paths": paths, "error": f"{type(e).__name__}: {e}", "read_s": 0.0,
+                "compute_s": time.perf_counter() - t0}
+
+
+# ===== 輸出 =====
+def _parquet_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """object 欄（混型別 / datetime.time）轉字串，避免 pyarrow 型別推斷失敗"""
+    out = df.copy()
+    for c in out.columns:
+        if out[c].dtype == object:
+            out[c] = out[c].map(lambda v: None if v is None or (isinstance(v, float) and pd.isna(v)) else str(v))
+    out.columns = [str(c) for c in out.columns]
+    return out
+
+
+def write_outputs(module: str, stem: str, result: dict, out_dir: str, formats: List[str]) -> List[str]:
+    written = []
+    cfg = MODULES[module]
+    if "xlsx" in formats and result.get("xlsx_bytes"):
+        path = os.path.join(out_dir, f"{stem}_{cfg['xlsx_suffix']}.xlsx")
+        with open(path, "wb") as f:
+            f.write(result["xlsx_bytes"])
+        written.append(path)
+    if "parquet" in formats:
+        for key in cfg["tables"]:
+            df = result.get(key)
+            if df is None or df.empty:
+                continue
+            path = os.path.join(out_dir, f"{stem}_{key}.parquet")
+            _parquet_safe(df).to_parquet(path, index=False)
+            written.append(path)
+    return written
+
+
+# ===== 稽核留存（同頁面 payload） =====
+def _qc_payload(result: dict, params: dict) -> dict:
+    from kpi_rollup import build_rollup_contrib
+    target = float(params.get("target_eff", 20.0))
+    df = result.get("ampm_df", pd.DataFrame())
+    am = df[df["時段"] == "上午"] if "時段" in df.columns else df.iloc[0:0]
+    pm = df[df["時段"] == "下午"] if "時段" in df.columns else df.iloc[0:0]
+
+    def _avg(x):
+        return round(float(x["效率"].mean()), 2) if len(x) else None
+
+    return {
+        "params": {"target_eff": target, "skip_rules": params.get("skip_rules") or []},
+        "kpi_am": {"avg_eff": _avg(am), "people": int(len(am))},
+        "kpi_pm": {"avg_eff": _avg(pm), "people": int(len(pm))},
+        "rollup_contrib": build_rollup_contrib(df, app_name=MODULES["qc"]["app_name"], target_eff=target),
+    }
+
+
+def _shelf_payload(result: dict, params: dict) -> dict:
+    from kpi_rollup import build_rollup_contrib
+    from shelf_core import ShelfParams
+    shelf_params = ShelfParams.of(params)
+    target = shelf_params.target_eff
+    summary = result["summary_df"]
+    summary = summary[summary["記錄輸入人"].astype(str) != "整體合計"]
+    people = int(summary["記錄輸入人"].nunique())
+
+    def _rate(col):
+        return float((summary[col] >= target).sum() / people) if people else 0.0
+
+    return {
+        "params": shelf_params.audit(),
+        "kpi_am": {"people": people, "pass_rate": _rate("效率")},
+        "kpi_pm": {"people": people, "pass_rate": _rate("下午效率_件每小時")},
+        "rollup_contrib": build_rollup_contrib(
+            result.get("ampm_df"),
+            app_name=MODULES["shelf"]["app_name"],
+            target_eff=target,
+            minutes_col="工時_分鐘",
+            eff_col="效率_件每小時",
+        ),
+    }
+
+
+def persist_run(module: str, job: dict, params: dict, operator: str | None) -> dict:
+    from audit_store import insert_audit_run, upload_export_bytes
+
+    cfg = MODULES[module]
+    result = job["result"]
+    export_path = None
+    if result.get("xlsx_bytes"):
+        export_path = upload_export_bytes(
+            content=result["xlsx_bytes"],
+            object_path=f"{cfg['storage_dir']}/{dt.datetime.now():%Y%m%d}/{uuid.uuid4().hex}.xlsx",
+        )
+    body = _qc_payload(result, params) if module == "qc" else _shelf_payload(result, params)
+    body["params"]["source"] = "batch_cli"
+    if result.get("ingest"):
+        body["params"]["ingest"] = result["ingest"]
+    if result.get("metrics"):
+        body["params"]["metrics"] = result["metrics"]
+    payload = {
+        "app_name": cfg["app_name"],
+        "operator": operator,
+        "source_filename": " + ".join(os.path.basename(p) for p in job["paths"]),
+        "source_sha256": job["source_sha256"],
+        "export_object_path": export_path,
+        **body,
+    }
+    return insert_audit_run(payload)
+
+
+# ===== 主流程 =====
+def load_skip_rules(path: str | None) -> list:
+    """JSON：[{"user": "10137", "t_start": "15:00", "t_end": "15:40"}, ...]"""
+    if not path:
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        rules = json.load(f)
+    if not isinstance(rules, list):
+        raise Exception("排除規則檔需為 JSON 陣列。")
+    return rules
+
+
+def build_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="驗收 / 上架 KPI 無介面批次執行")
+    ap.add_argument("module", choices=sorted(MODULES), help="qc＝驗收、shelf＝上架")
+    ap.add_argument("inputs", nargs="+", help="檔案、目錄或 glob")
+    ap.add_argument("-o", "--out-dir", default="kpi_out", help="輸出目錄（預設 kpi_out）")
+    ap.add_argument("--format", default="xlsx", help="輸出格式，逗號分隔：xlsx,parquet")
+    ap.add_argument("--workers", type=int, default=None, help="worker process 數（預設 CPU 數；1＝不開子 process）")
+    ap.add_argument("--merge", action="store_true", help="所有檔案合併成一次計算（跨檔去重）")
+    ap.add_argument("--persist", action="store_true", help="寫入稽核留存（audit_runs / Storage / kpi_rollups）")
+    ap.add_argument("--operator", default=None, help="留存的分析執行人")
+    ap.add_argument("--skip-rules", default=None, help="驗收排除規則 JSON 檔（qc）")
+    ap.add_argument("--include-source", action="store_true", help="報表附完整來源分頁（qc；較慢、較耗記憶體）")
+    ap.add_argument("--target-eff", type=float, default=None, help="達標效率（件/時）")
+    ap.add_argument("--idle-threshold", type=int, default=None, help="上架空窗門檻（分鐘，shelf）")
+    ap.add_argument("--exclude-keywords", default=None, help="上架『到』排除關鍵字，逗號分隔（shelf；預設同頁面）")
+    return ap
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    formats = [f.strip().lower() for f in args.format.split(",") if f.strip()]
+    bad = [f for f in formats if f not in OUTPUT_FORMATS]
+    if bad:
+        print(f"不支援的輸出格式：{', '.join(bad)}（可用：{', '.join(OUTPUT_FORMATS)}）", file=sys.stderr)
+        return 2
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("找不到任何匯出檔（.xlsx/.xlsm/.xls/.xlsb/.csv）。", file=sys.stderr)
+        return 2
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    params: dict = {"skip_rules": load_skip_rules(args.skip_rules), "include_source": args.include_source}
+    if args.target_eff is not None:
+        params["target_eff"] = args.target_eff
+    if args.idle_threshold is not None:
+        params["idle_threshold"] = args.idle_threshold
+    if args.exclude_keywords is not None:
+        params["exclude_keywords"] = args.exclude_keywords.split(",")
+
+    jobs = [paths] if args.merge else [[p] for p in paths]
+    workers = max(1, min(args.workers or (os.cpu_count() or 1), len(jobs)))
+
+    t_all = time.perf_counter()
+    if workers == 1:
+        results = (process_job(args.module, j, params) for j in jobs)
+        ex = None
+    else:
+        # spawn：與 batch_ingest 一致，避免 fork 複製到鎖
+        ex = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+        results = ex.map(process_job, [args.module] * len(jobs), jobs, [params] * len(jobs))
+
+    failed = 0
+    try:
+        for job in results:
+            name = " + ".join(os.path.basename(p) for p in job["paths"])
+            if "error" in job:
+                failed += 1
+                print(f"✗ {name}  {job['error']}", file=sys.stderr)
+                continue
+
+            t0 = time.perf_counter()
+            stem = os.path.splitext(os.path.basename(job["paths"][0]))[0]
+            if len(job["paths"]) > 1:
+                stem += f"_等{len(job['paths'])}檔"
+            written = write_outputs(args.module, stem, job["result"], args.out_dir, formats)
+            write_s = time.perf_counter() - t0
+
+            note = ""
+            if args.persist:
+                try:
+                    row = persist_run(args.module, job, params, args.operator)
+                    note = f"  留存 ID={row.get('id')}"
+                    if row.get("rollup_error"):
+                        note += f"（彙總更新失敗：{row['rollup_error']}）"
+                except Exception as e:
+                    failed += 1
+                    note = f"  留存失敗：{e}"
+            print(f"✓ {name}  讀檔 {job['read_s']:.2f}s｜計算 {job['compute_s']:.2f}s｜輸出 {write_s:.2f}s"
+                  f"｜{len(written)} 檔{note}")
+    finally:
+        if ex is not None:
+            ex.shutdown()
+
+    print(f"完成 {len(jobs) - failed}/{len(jobs)}，總耗時 {time.perf_counter() - t_all:.2f}s（workers={workers}）")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
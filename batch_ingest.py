@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多檔批次讀入：平行解析 + 跨檔去重
+- 每個檔案在獨立 worker process 解析（openpyxl 解析是 CPU-bound，thread 會卡 GIL）
+- 重疊匯出（例如 1~15 日與 10~20 日兩份）中重複出現的掃描事件，
+  以關鍵欄位（人員、時間、由/到、品號）正規化後的 hash 去重
+  → 跨檔取「多重集合聯集」：同一事件在單一檔內出現 n 次就保留 n 次，不會誤刪同秒重複作業
+- 同名分頁跨檔合併成一張，之後交給引擎當成一份檔案計算
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+ITEM_CANDIDATES = ["品號", "商品編號", "商品代號", "料號", "貨號", "SKU", "商品"]
+
+# 小量檔案在本 process 直接解析較快（spawn 子 process 需重新 import pandas）
+PARALLEL_MIN_FILES = 2
+PARALLEL_MIN_BYTES = 2 * 1024 * 1024
+
+
+def _pick(cols, candidates) -> str | None:
+    cols_norm = [str(c).strip() for c in cols]
+    for cand in candidates:
+        if cand in cols_norm:
+            return cols[cols_norm.index(cand)]
+    for cand in candidates:
+        for i, c in enumerate(cols_norm):
+            if cand in c:
+                return cols[i]
+    return None
+
+
+def parse_files(
+    files: Sequence[Tuple[str, bytes]],
+    reader: Callable[[bytes, str], Dict[str, pd.DataFrame]],
+    max_workers: int | None = None,
+) -> List[Dict[str, pd.DataFrame]]:
+    """
+    files：[(檔名, bytes), ...]；reader(bytes, 檔名) → {分頁名: DataFrame}
+    reader 必須是可 import 的模組層級函式（子 process 以 pickle 傳遞）。
+    回傳順序與 files 相同。
+    """
+    files = list(files)
+    total = sum(len(b) for _, b in files)
+    workers = max_workers or min(len(files), os.cpu_count() or 1)
+    if len(files) < PARALLEL_MIN_FILES or total < PARALLEL_MIN_BYTES or workers <= 1:
+        return [reader(b, name) for name, b in files]
+
+    # spawn：Streamlit 伺服器是多執行緒 process，fork 可能連同鎖一起複製而卡死
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as ex:
+        futs = [ex.submit(reader, b, name) for name, b in files]
+        return [f.result() for f in futs]
+
+
+def event_hash(df: pd.DataFrame, key_candidates: Dict[str, List[str]]) -> pd.Series | None:
+    """
+    關鍵欄位正規化後的列 hash（uint64）；找不到人員或時間欄時回傳 None（該表不去重）。
+    - 人員：字串去空白、去前導 0（xlsx 讀成數字、csv 讀成字串時仍一致）
+    - 時間：轉 datetime
+    - 由 / 到 / 品號：字串去空白、轉大寫
+    """
+    cols = list(df.columns)
+    ucol = _pick(cols, key_candidates["user"])
+    tcol = _pick(cols, key_candidates["time"])
+    if ucol is None or tcol is None:
+        return None
+
+    def _s(col):
+        return df[col].astype(str).str.strip()
+
+    parts = {
+        "u": _s(ucol).str.lstrip("0"),
+        "t": pd.to_datetime(df[tcol], errors="coerce", format="mixed"),
+    }
+    for key in ("from", "to", "item"):
+        col = _pick(cols, key_candidates.get(key, []))
+        if col is not None:
+            parts[key] = _s(col).str.upper()
+    return pd.util.hash_pandas_object(pd.DataFrame(parts, index=df.index), index=False)
+
+
+def merge_sheets(
+    sheet_dicts: Sequence[Dict[str, pd.DataFrame]],
+    key_candidates: Dict[str, List[str]],
+) -> Tuple[Dict[str, pd.DataFrame], dict]:
+    """
+    多檔 {分頁: df} → 去重後的單一 {分頁: df}（同名分頁跨檔合併，順序依檔案先後）。
+    回傳 (sheets, stats)；stats = {"files", "rows_in", "duplicates"}。
+    """
+    kept_count: Dict[int, int] = {}
+    merged: Dict[str, List[pd.DataFrame]] = {}
+    rows_in = dups = 0
+
+    for sheets in sheet_dicts:
+        file_count: Dict[int, int] = {}
+        for name, df in sheets.items():
+            if df is None or df.empty:
+                merged.setdefault(name, [])
+                continue
+            rows_in += len(df)
+            h = event_hash(df, key_candidates)
+            if h is None:
+                merged.setdefault(name, []).append(df)
+                continue
+            # 同一檔內第 k 次出現的事件，只有在先前檔案保留不到 k 次時才保留
+            occ = h.groupby(h).cumcount().to_numpy()
+            prev = np.fromiter((kept_count.get(x, 0) for x in h.to_numpy()), dtype=np.int64, count=len(h))
+            keep = occ >= prev
+            dups += int((~keep).sum())
+            merged.setdefault(name, []).append(df.loc[keep])
+            for x, n in h.value_counts().items():
+                file_count[x] = file_count.get(x, 0) + int(n)
+        for x, n in file_count.items():
+            if n > kept_count.get(x, 0):
+                kept_count[x] = n
+
+    out = {}
+    for name, parts in merged.items():
+        if not parts:
+            out[name] = pd.DataFrame()
+        elif len(parts) == 1:
+            out[name] = parts[0]
+        else:
+            out[name] = pd.concat(parts, ignore_index=True)
+    return out, {"files": len(sheet_dicts), "rows_in": rows_in, "duplicates": dups}
+
+
+def load_many(
+    files: Sequence[Tuple[str, bytes]],
+    reader: Callable[[bytes, str], Dict[str, pd.DataFrame]],
+    key_candidates: Dict[str, List[str]],
+    max_workers: int | None = None,
+) -> Tuple[Dict[str, pd.DataFrame], dict]:
+    """平行解析 → 跨檔去重合併；單檔時等同直接 reader()。"""
+    files = list(files)
+    if len(files) == 1:
+        sheets = reader(files[0][1], files[0][0])
+        return sheets, {"files": 1, "rows_in": int(sum(len(d) for d in sheets.values() if d is not None)), "duplicates": 0}
+    return merge_sheets(parse_files(files, reader, max_workers), key_candidates)
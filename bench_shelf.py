@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上架彙總 / 長表的逐列版 vs 向量化版效能比較（shelf_core 改寫的對照）
+- 資料：合成的每人每日明細（欄位 / 型別同 shelf_core.compute_daily 的結果），不需上傳檔
+- 比較三項：彙總效率欄（_eff_col）、明細_時段（build_detail_long）、報表_區塊的工作區間
+- 逐列版為改寫前的實作，只留在這裡當對照；每項取 repeat 次的最小耗時，並檢查兩版結果逐值相同
+
+命令列：
+    python bench_shelf.py [--worker-days 50000] [--repeat 3]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from shelf_core import INPUT_USER_CANDIDATES, _eff, _eff_col, build_detail_long
+
+
+# ===== 合成資料 =====
+def synthetic_daily(worker_days: int = 50_000, workers: int = 500, seed: int = 0) -> pd.DataFrame:
+    """合成的每人每日明細（欄位 / 型別同 compute_daily 的結果），效能比較用"""
+    rng = np.random.default_rng(seed)
+    days = -(-worker_days // workers)
+    user = np.repeat([f"{20200000000 + i}" for i in range(workers)], days)[:worker_days]
+    day = np.tile(pd.date_range("2025-01-01", periods=days, freq="D").to_numpy(), workers)[:worker_days]
+    am_n, pm_n = rng.integers(0, 120, worker_days), rng.integers(0, 200, worker_days)
+    am_m, pm_m = rng.integers(30, 330, worker_days), rng.integers(30, 600, worker_days)
+    brk = rng.choice([0, 15, 30, 45, 60], worker_days)
+    am_first = day + np.timedelta64(7, "h") + rng.integers(0, 3600, worker_days).astype("timedelta64[s]")
+    pm_first = day + np.timedelta64(13, "h") + np.timedelta64(30, "m") + rng.integers(0, 3600, worker_days).astype("timedelta64[s]")
+    eff = lambda n, m: _eff_col(pd.Series(n), pd.Series(m)).to_numpy()
+    gaps = np.array(["", "10:00:00 ~ 10:20:00", "14:05:00 ~ 14:31:00；16:10:00 ~ 16:40:00"], dtype=object)
+    return pd.DataFrame({
+        INPUT_USER_CANDIDATES[0]: pd.array(user, dtype="str"), "對應姓名": pd.array([""] * worker_days, dtype="str"),
+        "日期": pd.Series(day).dt.date,
+        "第一筆時間": am_first, "最後一筆時間": pm_first + pm_m.astype("timedelta64[m]"),
+        "當日筆數": am_n + pm_n, "當日工時_分鐘_扣休": am_m + pm_m, "效率_件每小時": eff(am_n + pm_n, am_m + pm_m),
+        "上午_第一筆": am_first, "上午_最後一筆": am_first + am_m.astype("timedelta64[m]"), "上午_筆數": am_n,
+        "上午_工時_分鐘": am_m, "上午_效率_件每小時": eff(am_n, am_m),
+        "上午_空窗分鐘": rng.integers(0, 40, worker_days), "上午_空窗時段": gaps[rng.integers(0, 2, worker_days)],
+        "下午_第一筆": pm_first, "下午_最後一筆": pm_first + pm_m.astype("timedelta64[m]"), "下午_筆數": pm_n,
+        "下午_休息分鐘": brk, "下午_命中規則": np.array([f"規則{b}" for b in brk], dtype=object),
+        "下午_工時_分鐘_扣休": pm_m, "下午_效率_件每小時": eff(pm_n, pm_m),
+        "下午_空窗分鐘_扣休": rng.integers(0, 60, worker_days), "下午_空窗時段": gaps[rng.integers(0, 3, worker_days)],
+    })
+
+
+# ===== 改寫前的逐列版 =====
+def _rowwise_eff(df: pd.DataFrame, n: str, m: str) -> pd.Series:
+    """改寫前的逐列版（只供比較）"""
+    return df.apply(lambda r: _eff(r[n], r[m]), axis=1)
+
+
+def _rowwise_detail_long(daily: pd.DataFrame, user_col: str) -> pd.DataFrame:
+    """改寫前的逐列版（只供比較）"""
+    rows = []
+    for _, r in daily.iterrows():
+        for seg, cnt in (("上午", "上午_筆數"), ("下午", "下午_筆數")):
+            if r[cnt] <= 0:
+                continue
+            am = seg == "上午"
+            rows.append({
+                user_col: r[user_col], "對應姓名": r["對應姓名"], "日期": r["日期"], "時段": seg,
+                "第一筆時間": r[f"{seg}_第一筆"], "最後一筆時間": r[f"{seg}_最後一筆"], "筆數": int(r[cnt]),
+                "工時_分鐘": int(r["上午_工時_分鐘" if am else "下午_工時_分鐘_扣休"]),
+                "休息分鐘": 0 if am else int(r["下午_休息分鐘"]),
+                "空窗分鐘": int(r["上午_空窗分鐘" if am else "下午_空窗分鐘_扣休"]),
+                "空窗時段": r[f"{seg}_空窗時段"], "效率_件每小時": r[f"{seg}_效率_件每小時"],
+                "命中規則": "上午不扣休" if am else r["下午_命中規則"],
+            })
+    return pd.DataFrame(rows).sort_values([user_col, "日期", "時段", "第一筆時間"])
+
+
+def _rowwise_span(df: pd.DataFrame) -> pd.Series:
+    """改寫前的逐列版（只供比較）"""
+    return df.apply(lambda r: (
+        ("" if pd.isna(r["第一筆時間"]) else str(r["第一筆時間"].time())) + " ~ " +
+        ("" if pd.isna(r["最後一筆時間"]) else str(r["最後一筆時間"].time()))
+    ), axis=1)
+
+
+# ===== 比較 =====
+def benchmark(worker_days: int = 50_000, repeat: int = 3) -> pd.DataFrame:
+    """效率欄 / 明細_時段 / 工作區間：逐列版與向量化版的耗時（取 repeat 次最小值）與結果是否相同"""
+    daily = synthetic_daily(worker_days)
+    user_col = INPUT_USER_CANDIDATES[0]
+    long = build_detail_long(daily, user_col)
+    clock = lambda ts: ts.dt.time.astype(str).where(ts.notna(), "")
+    tasks = {
+        "效率欄 ×3": (
+            lambda: [_rowwise_eff(daily, n, m) for n, m in (("上午_筆數", "上午_工時_分鐘"), ("下午_筆數", "下午_工時_分鐘_扣休"),
+                                                             ("當日筆數", "當日工時_分鐘_扣休"))],
+            lambda: [_eff_col(daily[n], daily[m]) for n, m in (("上午_筆數", "上午_工時_分鐘"), ("下午_筆數", "下午_工時_分鐘_扣休"),
+                                                                ("當日筆數", "當日工時_分鐘_扣休"))],
+        ),
+        "明細_時段": (lambda: _rowwise_detail_long(daily, user_col), lambda: build_detail_long(daily, user_col)),
+        "工作區間": (lambda: _rowwise_span(long), lambda: clock(long["第一筆時間"]) + " ~ " + clock(long["最後一筆時間"])),
+    }
+
+    def best(fn):
+        t, out = None, None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            out = fn()
+            t = min(t or 1e9, time.perf_counter() - t0)
+        return t, out
+
+    def same(a, b):
+        if isinstance(a, list):
+            return all(same(x, y) for x, y in zip(a, b))
+        try:
+            (pd.testing.assert_frame_equal if isinstance(a, pd.DataFrame) else pd.testing.assert_series_equal)(
+                a, b, check_dtype=False, check_names=False)
+            return True
+        except AssertionError:
+            return False
+
+    rows = []
+    for task, (old, new) in tasks.items():
+        t_old, r_old = best(old)
+        t_new, r_new = best(new)
+        rows.append({"項目": task, "每人每日列數": worker_days, "逐列_秒": round(t_old, 3), "向量化_秒": round(t_new, 4),
+                     "倍數": round(t_old / t_new, 1) if t_new else None, "結果相同": same(r_old, r_new)})
+    return pd.DataFrame(rows)
+
+
+# ===== 命令列 =====
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="上架彙總 / 長表：逐列版 vs 向量化版")
+    ap.add_argument("--worker-days", type=int, default=50_000, help="合成的每人每日列數")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    res = benchmark(args.worker_days, repeat=args.repeat)
+    with pd.option_context("display.width", 200):
+        print(res.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+兩個引擎的效能基準（合成資料，結果存 JSON 供不同 commit 之間比較）
+- 資料：synthetic_logs 以固定 seed 產生的驗收 / 上架匯出檔（預設 1 萬 / 10 萬 / 100 萬列，CSV），
+  同一組參數每次內容相同；名冊用合成名冊（WORK_EFF_ROSTER 暫時指過去）
+- 量測：run_qc_efficiency / run_shelf_efficiency 的總牆鐘時間、峰值 RSS，
+  以及結果 "metrics" 的各階段（讀檔 / 過濾 / 空窗偵測 / 彙總 / 匯出）牆鐘 / CPU 時間
+- 上傳快取一律關閉（WORK_EFF_UPLOAD_CACHE_MB=0），每次都是完整解析
+- 重複 repeat 次，比較時取中位數；每次的原始數字也都留在 JSON
+- 結果檔：<輸出目錄>/<時間>_<commit>.json（commit 有未提交修改時加 +dirty）
+
+命令列：
+    python benchmark.py run [--sizes 10k,100k,1m] [--engines qc,shelf] [--fmt csv|xlsx]
+                            [--repeat 3] [--days 5] [--seed 1] [--out bench_results]
+    python benchmark.py compare 舊.json 新.json [--threshold 0.1]
+    （100 萬列的 xlsx 光產生檔案就要數分鐘，大檔建議用 csv）
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from compute_pool import STAGE_LABELS
+from mem_probe import peak_mb, reset_peak, rss_mb
+from synthetic_logs import generate, roster_env, spec_for_rows, to_bytes
+
+DEFAULT_SIZES = "10k,100k,1m"
+DEFAULT_OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+SCHEMA = 1
+TOTAL = "total"  # 整體（非階段）的鍵
+
+
+def parse_size(text: str) -> int:
+    """10k / 100K / 1m / 250000 → 列數"""
+    t = text.strip().lower().replace("_", "")
+    mult = {"k": 1_000, "m": 1_000_000}.get(t[-1:], 1)
+    try:
+        return int(float(t[:-1] if mult > 1 else t) * mult)
+    except ValueError:
+        raise Exception(f"無法辨識的列數：{text}")
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def commit_id() -> str:
+    head = _git("rev-parse", "--short", "HEAD") or "unknown"
+    return head + ("+dirty" if _git("status", "--porcelain", "--untracked-files=no") else "")
+
+
+def _engines() -> Dict[str, Callable[[bytes, str], dict]]:
+    import qc_core
+    import shelf_core
+    return {"qc": qc_core.run_qc_efficiency, "shelf": shelf_core.run_shelf_efficiency}
+
+
+# ===== 量測 =====
+def measure(fn: Callable[[bytes, str], dict], data: bytes, filename: str) -> Dict[str, Any]:
+    """跑一次 → {wall_s, peak_mb, stages: {階段: {wall_s, cpu_s, rows_in, rows_out}}}"""
+    gc.collect()
+    reset_peak()
+    base = rss_mb()
+    t0 = time.perf_counter()
+    res = fn(data, filename)
+    wall = time.perf_counter() - t0
+    stages = {r["stage"]: {k: r.get(k) for k in ("wall_s", "cpu_s", "rows_in", "rows_out")}
+              for r in res.get("metrics") or []}
+    return {"wall_s": round(wall, 3), "peak_mb": round(peak_mb(), 1), "base_mb": round(base, 1), "stages": stages}
+
+
+def run_suite(sizes: List[int], engines: List[str], fmt: str = "csv", repeat: int = 3, days: int = 5,
+              seed: int = 1, log: Callable[[str], None] = print) -> Dict[str, Any]:
+    """各引擎 × 各列數：產生資料一次，量 repeat 次"""
+    os.environ["WORK_EFF_UPLOAD_CACHE_MB"] = "0"
+    runners = _engines()
+    results = []
+    for kind in engines:
+        if kind not in runners:
+            raise Exception(f"不支援的引擎：{kind}（可用 {'、'.join(runners)}）")
+        for rows in sizes:
+            spec = spec_for_rows(kind, rows, days=days, seed=seed)
+            t0 = time.perf_counter()
+            data = to_bytes(generate(spec), fmt)
+            log(f"[{kind} {rows:,} 列] 產生 {len(data) / 1e6:.1f} MB（{time.perf_counter() - t0:.1f} 秒）")
+            runs = []
+            with roster_env(spec):
+                for i in range(repeat):
+                    r = measure(runners[kind], data, f"synthetic_{kind}.{fmt}")
+                    log(f"  第 {i + 1} 次：{r['wall_s']:.2f} 秒，峰值 {r['peak_mb']:.0f} MB")
+                    runs.append(r)
+            results.append({"engine": kind, "rows": rows, "workers": spec.workers, "days": spec.days,
+                            "file_mb": round(len(data) / 1e6, 2), "runs": runs})
+            del data
+    return {
+        "schema": SCHEMA,
+        "commit": commit_id(),
+        "created": dt.datetime.now().isoformat(timespec="seconds"),
+        "config": {"fmt": fmt, "repeat": repeat, "days": days, "seed": seed},
+        "env": {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+                "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+
+
+def save(report: Dict[str, Any], out_dir: str = DEFAULT_OUT) -> str:
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = dt.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(out_dir, f"{stamp}_{report['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    return path
+
+
+# ===== 整理 / 比較 =====
+def summarize(report: Dict[str, Any]) -> pd.DataFrame:
+    """每個（引擎, 列數, 階段）一列：牆鐘 / CPU 秒數取各次中位數；階段 total 另含峰值 RSS"""
+    rows = []
+    for res in report["results"]:
+        runs = res["runs"]
+        key = {"引擎": res["engine"], "列數": res["rows"]}
+        rows.append({**key, "階段": TOTAL, "牆鐘_秒": round(statistics.median(r["wall_s"] for r in runs), 3),
+                     "CPU_秒": None, "峰值_MB": statistics.median(r["peak_mb"] for r in runs)})
+        stages = dict.fromkeys(s for r in runs for s in r["stages"])
+        for st in stages:
+            vals = [r["stages"][st] for r in runs if st in r["stages"]]
+            rows.append({**key, "階段": st, "牆鐘_秒": round(statistics.median(v["wall_s"] for v in vals), 3),
+                         "CPU_秒": round(statistics.median(v["cpu_s"] for v in vals), 3), "峰值_MB": None})
+    return pd.DataFrame(rows, columns=["引擎", "列數", "階段", "牆鐘_秒", "CPU_秒", "峰值_MB"])
+
+
+def _label(df: pd.DataFrame) -> pd.DataFrame:
+    return df.assign(階段=df["階段"].map(lambda s: "合計" if s == TOTAL else STAGE_LABELS.get(s, s)))
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.1) -> pd.DataFrame:
+    """兩份結果對齊（引擎, 列數, 階段）：新 / 舊 倍數；超過 1+threshold 標「變慢」，低於 1−threshold 標「變快」"""
+    a = summarize(old)[["引擎", "列數", "階段", "牆鐘_秒", "峰值_MB"]]
+    b = summarize(new)[["引擎", "列數", "階段", "牆鐘_秒", "峰值_MB"]]
+    keys = ["引擎", "列數", "階段"]
+    order = pd.concat([a[keys], b[keys]]).drop_duplicates()  # 保留原本的階段順序
+    out = order.merge(a, on=keys, how="left").merge(b, on=keys, how="left", suffixes=("_舊", "_新"))
+    ratio = out["牆鐘_秒_新"] / out["牆鐘_秒_舊"].where(out["牆鐘_秒_舊"] > 0)
+    out["倍數"] = ratio.round(2)
+    out["判定"] = np.select([ratio > 1 + threshold, ratio < 1 - threshold], ["變慢", "變快"], "")
+    return _label(out)
+
+
+# ===== 命令列 =====
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="驗收 / 上架引擎效能基準（合成資料）")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rp = sub.add_parser("run", help="跑基準並寫出 JSON")
+    rp.add_argument("--sizes", default=DEFAULT_SIZES, help=f"列數（逗號分隔，預設 {DEFAULT_SIZES}）")
+    rp.add_argument("--engines", default="qc,shelf")
+    rp.add_argument("--fmt", choices=["csv", "xlsx"], default="csv")
+    rp.add_argument("--repeat", type=int, default=3)
+    rp.add_argument("--days", type=int, default=5)
+    rp.add_argument("--seed", type=int, default=1)
+    rp.add_argument("--out", default=DEFAULT_OUT, help="結果目錄")
+    cp = sub.add_parser("compare", help="比較兩份結果 JSON")
+    cp.add_argument("old")
+    cp.add_argument("new")
+    cp.add_argument("--threshold", type=float, default=0.1, help="倍數超過 1±此值才標示（預設 0.1）")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "compare":
+        reports = []
+        for p in (args.old, args.new):
+            with open(p, encoding="utf-8") as f:
+                reports.append(json.load(f))
+        print(f"舊：{reports[0]['commit']}（{reports[0]['created']}）  新：{reports[1]['commit']}（{reports[1]['created']}）")
+        table = compare(reports[0], reports[1], args.threshold)
+    else:
+        sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+        engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+        report = run_suite(sizes, engines, fmt=args.fmt, repeat=args.repeat, days=args.days, seed=args.seed)
+        print(f"結果：{save(report, args.out)}")
+        table = _label(summarize(report))
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(table.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,10 @@
 from __future__ import annotations
 
+import datetime as dt
 import io
+import os
+import time
+import uuid
 from dataclasses import dataclass
 from typing import List, Optional, Sequence
 
@@ -265,6 +269,16 @@ def table_block(
                 st.dataframe(detail_df, use_container_width=True, hide_index=True)
 
 
+def perf_panel(records: Optional[list], title: str = "⏱️ 效能"):
+    """各計算階段的時間 / 列數 / 記憶體（引擎回傳的 metrics 紀錄，見 run_metrics）；預設收合"""
+    if not records:
+        return
+    from run_metrics import table as metrics_table
+    with st.expander(title, expanded=False):
+        st.dataframe(metrics_table(records), use_container_width=True, hide_index=True)
+        st.caption("CPU 為整個計算 process 的時間；記憶體變化為階段前後 RSS 差（負值代表有釋放）")
+
+
 # =========================================================
 # Downloads
 # =========================================================
@@ -276,3 +290,196 @@ def download_excel(xlsx_bytes: bytes, filename: str = "KPI報表.xlsx"):
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         use_container_width=False,
     )
+
+
+# =========================================================
+# Shared compute pool
+# =========================================================
+def _cancel_pool_job(job_id: str):
+    from compute_pool import get_pool
+    get_pool().cancel(job_id)
+
+
+def run_in_pool(fn, *args, label: str = "", with_progress: bool = False, on_partial=None, preview=None,
+                **kwargs):
+    """
+    把重運算送進伺服器共用的計算池（compute_pool），等候時顯示排隊序位 / 執行秒數。
+    with_progress=True：fn 需接受 progress 參數；顯示階段進度條與「取消」按鈕，
+      job 送出部分結果時呼叫 on_partial(partial)（畫在進度條下方，完成後清除）。
+    preview=(preview_fn, args, render)：正式 job 送出後，另送一個短 job 算概估結果（同樣不佔本頁 GIL），
+      算完且正式 job 尚未送出部分結果時呼叫 render(結果)；正式 job 結束時一併取消 / 移除，失敗則略過。
+    回傳 fn 的結果；失敗時拋出 Exception，排隊已滿時拋出 compute_pool.PoolBusy，
+    取消時拋出 compute_pool.JobCancelled。fn 需為可 import 的模組層級函式。
+    等候中頁面被重跑（輪詢中斷）時 job 會被取消並在結束時移除（ComputePool.abandon）。
+    """
+    from compute_pool import JOB_DONE, JOB_QUEUED, JOB_RUNNING, PoolBusy, get_pool
+
+    pool = get_pool()
+    owner = st.session_state.setdefault("_pool_owner", uuid.uuid4().hex)  # 每個瀏覽器 session 一個
+    job_id = pool.submit(fn, *args, label=label, owner=owner, with_progress=with_progress, **kwargs)
+    preview_id = None
+    if preview is not None:
+        preview_fn, preview_args, render_preview = preview
+        try:
+            # 不掛 owner：跟著正式 job 的生命週期，不佔同一 session「一次一個」的名額；排在正式 job 之後
+            preview_id = pool.submit(preview_fn, *preview_args, label=f"{label}（預覽）")
+        except PoolBusy:
+            pass  # 排隊已滿就不預覽
+
+    box = st.empty()
+    cancel_slot = st.empty()
+    partial_slot = st.empty()
+    if with_progress:
+        # 按下後 Streamlit 會重跑頁面：callback 先取消 job，本次等候隨之中止
+        cancel_slot.button("⏹️ 取消計算", key=f"cancel_{job_id}", on_click=_cancel_pool_job, args=(job_id,))
+    seen_partial = 0
+    try:
+        while True:
+            if preview_id is not None and pool.status(preview_id)["state"] not in (JOB_QUEUED, JOB_RUNNING):
+                pid, preview_id = preview_id, None
+                if pool.status(pid)["state"] == JOB_DONE and seen_partial == 0:
+                    try:
+                        with partial_slot.container():
+                            render_preview(pool.result(pid))
+                    except Exception:
+                        partial_slot.empty()  # 預覽失敗不影響完整計算
+                pool.forget(pid)
+            s = pool.status(job_id)
+            if s["state"] == JOB_QUEUED:
+                box.info(f"⏳ 排隊中：第 {s['position']} 位（執行中 {s['running']}/{s['workers']}，已等 {s['waited_s']:.0f} 秒）")
+            elif s["state"] == JOB_RUNNING:
+                if with_progress:
+                    stage = s["stage_label"] or "準備中"
+                    box.progress(min(max(s["pct"], 0.0), 1.0),
+                                 text=f"⚙️ {label or '計算'}：{stage}（{s['pct']:.0%}，{s['elapsed_s']:.0f} 秒）")
+                else:
+                    box.info(f"⚙️ {label or '計算'}中…（{s['elapsed_s']:.0f} 秒）")
+                if on_partial is not None and s["partial_seq"] > seen_partial:
+                    seen_partial = s["partial_seq"]
+                    with partial_slot.container():
+                        on_partial(pool.partial(job_id))
+            else:
+                break
+            time.sleep(0.5)
+    finally:
+        # 等候中被重跑（改了 widget / 換頁）會中斷輪詢：job 還在排隊 / 執行就取消，結束後即移除
+        # 先處理 job 再清畫面（重跑中清畫面本身也可能再被中斷）
+        if pool.status(job_id)["state"] in (JOB_QUEUED, JOB_RUNNING):
+            pool.abandon(job_id)
+        if preview_id is not None:
+            pool.abandon(preview_id)
+        box.empty()
+        cancel_slot.empty()
+        partial_slot.empty()
+
+    try:
+        return pool.result(job_id)
+    finally:
+        pool.forget(job_id)
+
+
+# =========================================================
+# Admin：單次計算 profiler
+# =========================================================
+def _admin_password() -> Optional[str]:
+    """管理員密碼：st.secrets 的 ADMIN_PASSWORD，或環境變數 WORK_EFF_ADMIN_PASSWORD；都沒設就不顯示管理員工具"""
+    try:
+        v = st.secrets.get("ADMIN_PASSWORD")
+        if v:
+            return str(v)
+    except Exception:
+        pass  # 沒有 secrets.toml
+    return os.environ.get("WORK_EFF_ADMIN_PASSWORD") or None
+
+
+def current_delete_password():
+    """
+    依月份取得刪除密碼（刪除留存 / 重建彙總等不可逆操作共用）
+    Key 格式：DELETE_PASSWORD_YYYYMM
+    """
+    ym = dt.datetime.now().strftime("%Y%m")
+    key = f"DELETE_PASSWORD_{ym}"
+    return key, st.secrets.get(key)
+
+
+class RunProfiler:
+    """
+    一次計算（可能跨計算池與頁面）的 profiler；mode 為 None 時 pool / call 直接執行，沒有任何包裝。
+    pool(fn, ...)：同 run_in_pool，啟用時整個 job 在子 process 內以 profiler.profile_call 執行
+    call(fn, ...)：頁面內的步驟（例如上架頁的彙總 / 匯出）
+    finish(title)：合併各段 profile 存進 session，提供下載，並關掉「下一次計算」開關
+    """
+
+    def __init__(self, page_key: str, mode: Optional[str] = None):
+        self.page_key = page_key
+        self.mode = mode
+        self.report = None
+
+    def _add(self, report):
+        self.report = report if self.report is None else self.report.merge(report)
+
+    def pool(self, fn, *args, **kwargs):
+        if not self.mode:
+            return run_in_pool(fn, *args, **kwargs)
+        from profiler import profile_call
+        result, report = run_in_pool(profile_call, fn, *args, profile_mode=self.mode, **kwargs)
+        self._add(report)
+        return result
+
+    def call(self, fn, *args, **kwargs):
+        if not self.mode:
+            return fn(*args, **kwargs)
+        from profiler import profile_call
+        result, report = profile_call(fn, *args, profile_mode=self.mode, **kwargs)
+        self._add(report)
+        return result
+
+    def finish(self, title: str):
+        if self.report is None:
+            return
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        st.session_state[f"_profile_{self.page_key}"] = {
+            "name": f"profile_{self.page_key}_{stamp}",
+            "wall_s": self.report.wall_s,
+            "html": self.report.html(title).encode("utf-8"),
+            "pstats": self.report.pstats_bytes(),
+        }
+        st.session_state[f"_profile_disarm_{self.page_key}"] = True  # 下一次重跑時關掉開關
+        self.report = None
+        profile_downloads(self.page_key)
+
+
+def profile_downloads(page_key: str):
+    """最近一次 profile 的下載鈕（火焰圖 HTML / pstats）"""
+    prof = st.session_state.get(f"_profile_{page_key}")
+    if not prof:
+        return
+    st.caption(f"🔬 最近一次 profile：{prof['name']}（{prof['wall_s']:.1f} 秒）")
+    c1, c2 = st.columns(2)
+    c1.download_button("火焰圖（HTML）", prof["html"], file_name=f"{prof['name']}.html", mime="text/html",
+                       key=f"_profile_html_{page_key}_{prof['name']}")
+    c2.download_button("pstats", prof["pstats"], file_name=f"{prof['name']}.pstats",
+                       mime="application/octet-stream", key=f"_profile_pstats_{page_key}_{prof['name']}")
+
+
+def profiler_controls(page_key: str) -> RunProfiler:
+    """
+    側欄「管理員工具」（在 with st.sidebar 內呼叫）：密碼正確才顯示「下一次計算啟用 profiler」開關與模式。
+    回傳本次計算用的 RunProfiler（未啟用時 mode=None）；算完 finish() 會自動把開關關掉。
+    """
+    expected = _admin_password()
+    if not expected:
+        return RunProfiler(page_key)
+    arm_key = f"_profile_arm_{page_key}"
+    if st.session_state.pop(f"_profile_disarm_{page_key}", False):
+        st.session_state[arm_key] = False  # 元件建立前改值才允許
+    with st.expander("🛠️ 管理員工具", expanded=bool(st.session_state.get(arm_key))):
+        if st.text_input("管理員密碼", type="password", key="_admin_pwd") != expected:
+            return RunProfiler(page_key)
+        from profiler import MODES
+        armed = st.toggle("🔬 下一次計算啟用 profiler", key=arm_key,
+                          help="只套用在下一次「產出 KPI」；算完提供火焰圖與 pstats 下載，開關自動關閉")
+        mode = st.radio("模式", list(MODES), format_func=MODES.get, key=f"_profile_mode_{page_key}",
+                        disabled=not armed)
+        profile_downloads(page_key)
+    return RunProfiler(page_key, mode if armed else None)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+伺服器共用的計算 process pool（所有 Streamlit session 共用一個）
+- 各頁面的 pandas 重運算送到子 process 執行，不再和其他 session 的 script thread 搶 GIL
+- 同時執行數上限（workers），其餘排隊（FIFO）；排隊 + 執行中超過上限時拒收（admission limit）
+- 每個 job 有狀態（queued / running / done / error / cancelled）與排隊序位，頁面可輪詢顯示
+- 非同步進度：with_progress=True 時，job 函式會收到 progress(stage, pct, partial=None) 參數，
+  回報階段（讀檔 / 過濾 / 空窗偵測 / 彙總 / 匯出）與百分比，並可先送出部分結果（例如 KPI 先於 Excel）
+- 取消：排隊中直接移除；執行中則在 job 下一次回報進度時中止（拋出 JobCancelled）
+- 放棄（abandon）：頁面等候中被重跑時取消 job，並在結束時直接移除，不留下沒人取的結果
+
+設定（環境變數）：
+    WORK_EFF_POOL_WORKERS      同時執行的子 process 數（預設 CPU 數 - 1，至少 1）
+    WORK_EFF_POOL_MAX_PENDING  排隊 + 執行中的 job 上限（預設 workers × 4）
+
+job 函式必須是可 import 的模組層級函式（spawn 子 process 以 pickle 傳遞）。
+本模組不 import streamlit；模組層級單例即為整個伺服器 process 共用。
+"""
+from __future__ import annotations
+
+import itertools
+import multiprocessing as mp
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_ERROR = "error"
+JOB_CANCELLED = "cancelled"
+
+# 引擎回報的階段代碼 → 頁面顯示文字
+STAGE_LABELS = {
+    "parse": "讀檔解析",
+    "filter": "過濾",
+    "idle": "空窗偵測",
+    "aggregate": "彙總",
+    "export": "匯出報表",
+}
+
+FINISHED_KEEP_SEC = 30 * 60  # 完成的 job 保留多久（供頁面重整後取回結果）
+
+
+class PoolBusy(Exception):
+    """排隊已滿或同一使用者已有 job 在排 / 在跑"""
+
+
+class JobCancelled(Exception):
+    """job 已被取消（由 progress 回報時拋出，中止子 process 內的計算）"""
+
+
+class JobProgress:
+    """
+    傳進子 process 的進度回報器（可 pickle：內含 Manager queue / Event 代理）
+    progress(stage, pct, partial=None)：pct 為 0~1；partial 為可 pickle 的部分結果 dict
+    """
+
+    def __init__(self, job_id: str, queue, cancel_event):
+        self.job_id = job_id
+        self._queue = queue
+        self._cancel = cancel_event
+
+    def __call__(self, stage: str, pct: float, partial: Optional[dict] = None):
+        if self._cancel.is_set():
+            raise JobCancelled("計算已取消。")
+        self._queue.put((self.job_id, stage, float(pct), partial))
+
+
+@dataclass
+class Job:
+    id: str
+    label: str
+    owner: Optional[str]
+    fn: Callable
+    args: tuple
+    kwargs: dict
+    seq: int
+    state: str = JOB_QUEUED
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Any = None
+    error: Optional[str] = None
+    stage: Optional[str] = None
+    pct: float = 0.0
+    partial: Optional[dict] = None
+    partial_seq: int = 0
+    cancel_event: Any = None
+    discard: bool = False      # 頁面已不再等候：進入終止狀態即移除（見 abandon）
+
+
+def _default_workers() -> int:
+    v = os.environ.get("WORK_EFF_POOL_WORKERS")
+    if v:
+        return max(1, int(v))
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+class ComputePool:
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.workers = workers or _default_workers()
+        env_pending = os.environ.get("WORK_EFF_POOL_MAX_PENDING")
+        self.max_pending = max_pending or (int(env_pending) if env_pending else self.workers * 4)
+        self._lock = threading.RLock()  # done callback 可能在 submit 當下同步觸發
+        self._jobs: Dict[str, Job] = {}
+        self._queue: deque = deque()
+        self._running = 0
+        self._seq = itertools.count()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._progress_q = None
+
+    # ---------- 提交 / 查詢 ----------
+    def submit(self, fn: Callable, *args, label: str = "", owner: Optional[str] = None,
+               with_progress: bool = False, **kwargs) -> str:
+        """with_progress=True：fn 需接受 progress 關鍵字參數（見 JobProgress）"""
+        with self._lock:
+            self._gc()
+            active = [j for j in self._jobs.values() if j.state in (JOB_QUEUED, JOB_RUNNING)]
+            if owner is not None and any(j.owner == owner for j in active):
+                raise PoolBusy("你已有一個計算在排隊或執行中，請等待完成後再送出。")
+            if len(active) >= self.max_pending:
+                raise PoolBusy(f"目前計算排隊已滿（{len(active)}/{self.max_pending}），請稍後再試。")
+            job = Job(id=uuid.uuid4().hex, label=label, owner=owner, fn=fn,
+                      args=args, kwargs=kwargs, seq=next(self._seq))
+            if with_progress:
+                self._ensure_manager()
+                job.cancel_event = self._manager.Event()
+                job.kwargs["progress"] = JobProgress(job.id, self._progress_q, job.cancel_event)
+            self._jobs[job.id] = job
+            self._queue.append(job.id)
+            self._pump()
+            return job.id
+
+    def status(self, job_id: str) -> dict:
+        """
+        {"state", "position"(排隊第幾位，1 起算；非排隊中為 0), "queued", "running", "waited_s", "elapsed_s",
+         "stage", "stage_label", "pct", "partial_seq", "error"}
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return {"state": None}
+            now = time.time()
+            position = (list(self._queue).index(job_id) + 1) if job.state == JOB_QUEUED else 0
+            return {
+                "state": job.state,
+                "label": job.label,
+                "position": position,
+                "queued": len(self._queue),
+                "running": self._running,
+                "workers": self.workers,
+                "waited_s": (job.started_at or now) - job.submitted_at,
+                "elapsed_s": ((job.finished_at or now) - job.started_at) if job.started_at else 0.0,
+                "stage": job.stage,
+                "stage_label": STAGE_LABELS.get(job.stage, job.stage or ""),
+                "pct": job.pct,
+                "partial_seq": job.partial_seq,
+                "error": job.error,
+            }
+
+    def partial(self, job_id: str) -> Optional[dict]:
+        """job 最近一次送出的部分結果（沒有則 None）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job.partial if job is not None else None
+
+    def cancel(self, job_id: str) -> bool:
+        """取消 job：排隊中立即移除；執行中則通知子 process 於下一次回報進度時中止"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in (JOB_QUEUED, JOB_RUNNING):
+                return False
+            if job.state == JOB_QUEUED:
+                self._queue.remove(job_id)
+                job.state = JOB_CANCELLED
+                job.error = "計算已取消。"
+                job.finished_at = time.time()
+                job.fn = job.args = job.kwargs = None
+                return True
+            if job.cancel_event is None:
+                return False  # 未開進度回報的 job 無法中途取消
+            job.cancel_event.set()
+            return True
+
+    def result(self, job_id: str, timeout: Optional[float] = None, poll: float = 0.2):
+        """阻塞等候結果；job 失敗時拋出 Exception（訊息同子 process 的例外）"""
+        t0 = time.time()
+        while True:
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    raise KeyError(job_id)
+                if job.state == JOB_DONE:
+                    return job.result
+                if job.state == JOB_ERROR:
+                    raise Exception(job.error)
+                if job.state == JOB_CANCELLED:
+                    raise JobCancelled(job.error)
+            if timeout is not None and time.time() - t0 > timeout:
+                raise TimeoutError(job_id)
+            time.sleep(poll)
+
+    def forget(self, job_id: str):
+        """取回結果後可移除，釋放記憶體（排隊 / 執行中的 job 不受影響）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.state in (JOB_DONE, JOB_ERROR, JOB_CANCELLED):
+                del self._jobs[job_id]
+
+    def abandon(self, job_id: str):
+        """
+        頁面不再等候（等候中被重跑中斷）：取消 job，進入終止狀態即 forget，結果不保留。
+        執行中的 job 要到下一次回報進度才真正停下，先解除 owner，同一 session 不必等它結束才能再送出
+        """
+        with self._lock:
+            self.cancel(job_id)
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if job.state in (JOB_DONE, JOB_ERROR, JOB_CANCELLED):
+                self.forget(job_id)
+            else:
+                job.owner, job.discard = None, True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "max_pending": self.max_pending,
+                    "running": self._running, "queued": len(self._queue)}
+
+    # ---------- 內部 ----------
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn：Streamlit 伺服器是多執行緒 process，fork 可能連同鎖一起複製而卡死
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context("spawn"))
+        return self._executor
+
+    def _ensure_manager(self):
+        """（持鎖呼叫）進度 queue 與取消旗標走 Manager 代理，子 process 才拿得到"""
+        if self._manager is None:
+            self._manager = mp.get_context("spawn").Manager()
+            self._progress_q = self._manager.Queue()
+            threading.Thread(target=self._drain_progress, name="compute-pool-progress", daemon=True).start()
+
+    def _drain_progress(self):
+        while True:
+            try:
+                job_id, stage, pct, partial = self._progress_q.get()
+            except (EOFError, OSError):
+                return  # Manager 已關閉
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job.state != JOB_RUNNING:
+                    continue
+                job.stage, job.pct = stage, max(job.pct, min(pct, 1.0))
+                if partial is not None:
+                    job.partial = partial
+                    job.partial_seq += 1
+
+    def _pump(self):
+        """（持鎖呼叫）有空位就把排隊中的 job 送進 executor"""
+        while self._queue and self._running < self.workers:
+            job = self._jobs[self._queue.popleft()]
+            job.state = JOB_RUNNING
+            job.started_at = time.time()
+            self._running += 1
+            try:
+                fut = self._ensure_executor().submit(job.fn, *job.args, **job.kwargs)
+            except BrokenProcessPool:
+                # 子 process 異常終止（例如 OOM）→ 重建 executor 再送一次
+                self._executor = None
+                fut = self._ensure_executor().submit(job.fn, *job.args, **job.kwargs)
+            fut.add_done_callback(lambda f, jid=job.id: self._on_done(jid, f))
+
+    def _on_done(self, job_id: str, fut):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            self._running -= 1
+            if job is not None:
+                job.finished_at = time.time()
+                try:
+                    job.result = fut.result()
+                    job.state = JOB_DONE
+                except JobCancelled as e:
+                    job.error = str(e)
+                    job.state = JOB_CANCELLED
+                except BrokenProcessPool:
+                    job.error = "計算子程序異常終止（可能記憶體不足），請重新送出。"
+                    job.state = JOB_ERROR
+                    self._executor = None
+                except Exception as e:
+                    job.error = str(e) or repr(e)
+                    job.state = JOB_ERROR
+                job.fn = job.args = job.kwargs = None  # 釋放上傳檔 bytes
+                job.cancel_event = None
+                if job.discard:
+                    del self._jobs[job_id]
+            self._pump()
+
+    def _gc(self):
+        now = time.time()
+        for jid in [j.id for j in self._jobs.values()
+                    if j.finished_at and now - j.finished_at > FINISHED_KEEP_SEC]:
+            del self._jobs[jid]
+
+
+_POOL: Optional[ComputePool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> ComputePool:
+    """伺服器 process 共用的單例"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ComputePool()
+        return _POOL
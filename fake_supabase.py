@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本機 Supabase 替身（記憶體內；負載測試 / 離線試跑頁面用，不連外）
+- 實作本專案用到的部分：
+    資料表 schema().table()：insert / select / upsert(on_conflict) / delete
+                           + eq / neq / in_ / gte / lte / match / order / limit / range，execute().data
+    函式 rpc(name, params)：apply_kpi_rollup / rebuild_kpi_rollups（同 kpi_rollup 說明中的 SQL 函式）
+    Storage storage.from_(bucket)：upload（已存在 → APIError 409，同真的 client）/ update / remove / download
+- 寫入前 payload 先經過 JSON 來回轉換：真的 client 送不出去的型別（例如 datetime.time）這裡一樣會失敗
+- insert 自動補 id（uuid）與 created_at（UTC ISO 字串）
+- latency_ms：每次 execute / Storage 呼叫先等這麼久（模擬網路往返）
+- 多 thread 共用一個實例（內部有鎖）
+
+用法：
+    with installed(latency_ms=50) as fake:      # 換掉 supabase.create_client 與 audit_store 內的參照
+        ...執行頁面 / batch_cli...
+    fake.tables["audit_runs"], fake.objects
+"""
+from __future__ import annotations
+
+import contextlib
+import datetime as dt
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+def _roundtrip(obj):
+    return json.loads(json.dumps(obj))
+
+
+class _Query:
+    """單一資料表的查詢（鏈式呼叫，execute 時才動到資料）"""
+
+    def __init__(self, db: "FakeSupabase", table: str):
+        self._db, self._table = db, table
+        self._op, self._payload, self._cols = "select", None, "*"
+        self._filters: List[Callable[[dict], bool]] = []
+        self._order: List[Tuple[str, bool]] = []
+        self._slice: Tuple[int, Optional[int]] = (0, None)
+        self._conflict: List[str] = []
+
+    # ---- 動作（同真的 client：每個動作各自一個新查詢，同一個 table 物件可重複使用） ----
+    def _action(self, op: str, payload=None, cols: str = "*") -> "_Query":
+        q = _Query(self._db, self._table)
+        q._op, q._payload, q._cols = op, payload, cols
+        return q
+
+    def select(self, cols: str = "*"):
+        return self._action("select", cols=cols)
+
+    def insert(self, payload):
+        return self._action("insert", payload)
+
+    def upsert(self, payload, on_conflict: str = "id"):
+        q = self._action("upsert", payload)
+        q._conflict = [c.strip() for c in on_conflict.split(",") if c.strip()]
+        return q
+
+    def delete(self):
+        return self._action("delete")
+
+    # ---- 條件 ----
+    def eq(self, col, v):
+        self._filters.append(lambda r: r.get(col) == v)
+        return self
+
+    def neq(self, col, v):
+        self._filters.append(lambda r: r.get(col) != v)
+        return self
+
+    def in_(self, col, values):
+        vs = list(values)
+        self._filters.append(lambda r: r.get(col) in vs)
+        return self
+
+    def gte(self, col, v):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) >= v)
+        return self
+
+    def lte(self, col, v):
+        self._filters.append(lambda r: r.get(col) is not None and r.get(col) <= v)
+        return self
+
+    def match(self, d: dict):
+        for k, v in d.items():
+            self.eq(k, v)
+        return self
+
+    def order(self, col, desc: bool = False):
+        self._order.append((col, desc))
+        return self
+
+    def limit(self, n: int):
+        self._slice = (self._slice[0], self._slice[0] + n)
+        return self
+
+    def range(self, start: int, end: int):
+        self._slice = (start, end + 1)
+        return self
+
+    # ---- 執行 ----
+    def _project(self, r: dict) -> dict:
+        if self._cols.strip() == "*":
+            return dict(r)
+        return {c.strip(): r.get(c.strip()) for c in self._cols.split(",")}
+
+    def execute(self) -> _Result:
+        self._db._wait()
+        payload = None if self._payload is None else _roundtrip(self._payload)
+        with self._db._lock:
+            rows = self._db.tables.setdefault(self._table, [])
+            hit = [r for r in rows if all(f(r) for f in self._filters)]
+            if self._op == "select":
+                for col, desc in reversed(self._order):
+                    hit.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+                a, b = self._slice
+                return _Result([self._project(r) for r in hit[a:b]])
+            if self._op == "delete":
+                ids = {id(r) for r in hit}
+                rows[:] = [r for r in rows if id(r) not in ids]
+                return _Result(hit)
+            items = payload if isinstance(payload, list) else [payload]
+            out = []
+            for item in items:
+                cur = None
+                if self._op == "upsert":
+                    cur = next((r for r in rows if all(r.get(c) == item.get(c) for c in self._conflict)), None)
+                if cur is not None:
+                    cur.update(item)
+                    out.append(dict(cur))
+                    continue
+                row = {"id": str(uuid.uuid4()), "created_at": dt.datetime.now(dt.timezone.utc).isoformat(), **item}
+                rows.append(row)
+                out.append(dict(row))
+            return _Result(out)
+
+
+# ---- rpc：資料庫函式（語意同 kpi_rollup 說明中的 SQL） ----
+def _apply_kpi_rollup(db: "FakeSupabase", params: dict):
+    from kpi_rollup import merge_rollup_rows, rollup_key
+
+    rows = db.tables.setdefault("kpi_rollups", [])
+    upserts, deletes = merge_rollup_rows(rows, params.get("contrib") or [], 1)
+    index = {rollup_key(r): r for r in rows}
+    now = dt.datetime.now(dt.timezone.utc).isoformat()
+    for u in upserts:
+        cur = index.get(rollup_key(u))
+        if cur is None:
+            rows.append({"id": str(uuid.uuid4()), "created_at": now, **u, "updated_at": now})
+        else:
+            cur.update(u, updated_at=now)
+    gone = set(deletes)
+    rows[:] = [r for r in rows if rollup_key(r) not in gone and (r.get("worker_days") or 0) > 0]
+    return None
+
+
+def _rebuild_kpi_rollups(db: "FakeSupabase", params: dict):
+    db.tables["kpi_rollups"] = []
+    for run in sorted(db.tables.get("audit_runs", []), key=lambda r: r.get("created_at") or ""):
+        if run.get("rollup_contrib"):
+            _apply_kpi_rollup(db, {"contrib": run["rollup_contrib"]})
+    return len(db.tables["kpi_rollups"])
+
+
+_FUNCTIONS: Dict[str, Callable[["FakeSupabase", dict], Any]] = {
+    "apply_kpi_rollup": _apply_kpi_rollup,
+    "rebuild_kpi_rollups": _rebuild_kpi_rollups,
+}
+
+
+class _Rpc:
+    def __init__(self, db: "FakeSupabase", name: str, params: Optional[dict]):
+        self._db, self._name, self._params = db, name, params or {}
+
+    def execute(self) -> _Result:
+        self._db._wait()
+        fn = _FUNCTIONS.get(self._name)
+        if fn is None:
+            raise APIError({"message": f"Could not find the function public.{self._name}", "code": "PGRST202"})
+        params = _roundtrip(self._params)
+        with self._db._lock:  # 同真的資料庫函式：整個呼叫是一個交易
+            return _Result(fn(self._db, params))
+
+
+class _Schema:
+    def __init__(self, db: "FakeSupabase"):
+        self._db = db
+
+    def table(self, name: str) -> _Query:
+        return _Query(self._db, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _Rpc:
+        return _Rpc(self._db, name, params)
+
+
+class _Bucket:
+    def __init__(self, db: "FakeSupabase", bucket: str):
+        self._db, self._bucket = db, bucket
+
+    def upload(self, path: str, content: bytes, file_options: Optional[dict] = None):
+        self._db._wait()
+        with self._db._lock:
+            key = (self._bucket, path)
+            if key in self._db.objects:
+                raise APIError({"message": "The resource already exists", "code": "409", "details": "Conflict"})
+            self._db.objects[key] = bytes(content)
+        return {"path": path}
+
+    def update(self, path: str, content: bytes, file_options: Optional[dict] = None):
+        self._db._wait()
+        with self._db._lock:
+            self._db.objects[(self._bucket, path)] = bytes(content)
+        return {"path": path}
+
+    def remove(self, paths: List[str]) -> List[dict]:
+        self._db._wait()
+        with self._db._lock:
+            removed = [p for p in paths if self._db.objects.pop((self._bucket, p), None) is not None]
+        return [{"name": p} for p in removed]
+
+    def download(self, path: str) -> bytes:
+        self._db._wait()
+        with self._db._lock:
+            if (self._bucket, path) not in self._db.objects:
+                raise Exception(f"Object not found: {path}")
+            return self._db.objects[(self._bucket, path)]
+
+
+class _Storage:
+    def __init__(self, db: "FakeSupabase"):
+        self._db = db
+
+    def from_(self, bucket: str) -> _Bucket:
+        return _Bucket(self._db, bucket)
+
+
+class FakeSupabase:
+    """create_client(url, key) 回傳值的替身；tables：{表名: [列]}，objects：{(bucket, 路徑): bytes}"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.tables: Dict[str, List[dict]] = {}
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+        self.calls = 0
+        self._lock = threading.RLock()
+        self.storage = _Storage(self)
+
+    def _wait(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+
+    def schema(self, name: str = "public") -> _Schema:
+        return _Schema(self)
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _Rpc:
+        return _Rpc(self, name, params)
+
+
+@contextlib.contextmanager
+def installed(client: Optional[FakeSupabase] = None, latency_ms: float = 0.0) -> Iterator[FakeSupabase]:
+    """期間內 create_client（supabase 與 audit_store 的參照）都回傳同一個替身；離開時還原"""
+    import supabase
+    import audit_store
+
+    fake = client or FakeSupabase(latency_ms)
+    factory = lambda *a, **kw: fake
+    saved: Dict[str, Any] = {"sb": supabase.create_client, "audit": audit_store.create_client}
+    env = {k: os.environ.get(k) for k in ("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY")}
+    supabase.create_client = factory
+    audit_store.create_client = factory
+    # audit_store._sb 會先檢查設定是否存在
+    os.environ.setdefault("SUPABASE_URL", "http://fake-supabase.local")
+    os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "fake")
+    try:
+        yield fake
+    finally:
+        supabase.create_client = saved["sb"]
+        audit_store.create_client = saved["audit"]
+        for k, v in env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
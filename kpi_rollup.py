@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+KPI 歷史彙總（月 / 週 × 模組 × 班別 × 人員）
+- 每次留存時，由「人員 × 日期 × 時段」明細算出本次對各期間的貢獻（contrib），隨留存一起保存
+- 新增留存：彙總 += contrib；刪除留存：彙總 -= contrib → 不需重掃全部歷史
+- 效率分位數以固定寬度（1 件/時）直方圖累加，可增可減
+- 增量模式（同一資料集逐日累加）：重算的日期可能先前已計入（重傳修正、亂序補日、跨日連動），
+  contrib 改為「本次各日期的貢獻 − 先前已計入的貢獻」（contrib_by_date / diff_rollup_contrib，
+  已計入的值由 PartialStore.credit_rollup 記錄），同一天重傳不會重複累加
+
+Supabase 資料表 kpi_rollups：
+    period_type  text      -- "month" / "week"
+    period_start date      -- 月初 / 週一
+    app_name     text
+    shift        text      -- "上午" / "下午"
+    worker       text
+    worker_name  text
+    worker_days  int       -- 人日數
+    count_sum    numeric   -- 筆數合計
+    minutes_sum  numeric   -- 工時分鐘合計
+    pass_days    int       -- 達標人日數
+    eff_hist     jsonb     -- {"效率整數": 人日數}
+    updated_at   timestamptz
+    unique (period_type, period_start, app_name, shift, worker)
+
+audit_runs 需要的欄位（既有部署先執行，否則每次 insert_audit_run 都會失敗）：
+    alter table audit_runs add column if not exists rollup_contrib jsonb;
+
+加 / 減與重建都在資料庫內完成（多位主管同時留存 / 刪除不會互相蓋掉；重建期間儀表板仍讀得到舊值）。
+contrib 每個鍵只能出現一次（audit_store.apply_rollup_contrib 會先合併同鍵）：
+
+    create or replace function apply_kpi_rollup(contrib jsonb) returns void
+    language sql as $$
+      insert into kpi_rollups as r (period_type, period_start, app_name, shift, worker, worker_name,
+                                    worker_days, count_sum, minutes_sum, pass_days, eff_hist, updated_at)
+      select c.period_type, c.period_start, c.app_name, c.shift, c.worker, coalesce(c.worker_name, ''),
+             c.worker_days, c.count_sum, c.minutes_sum, c.pass_days,
+             (select coalesce(jsonb_object_agg(h.b, h.n::int), '{}')
+                from jsonb_each_text(coalesce(c.eff_hist, '{}')) h(b, n) where h.n::int > 0),
+             now()
+      from jsonb_to_recordset(contrib) as c(
+             period_type text, period_start date, app_name text, shift text, worker text, worker_name text,
+             worker_days int, count_sum numeric, minutes_sum numeric, pass_days int, eff_hist jsonb)
+      on conflict (period_type, period_start, app_name, shift, worker) do update set
+        worker_name = case when excluded.worker_days > 0 and excluded.worker_name <> ''
+                           then excluded.worker_name else r.worker_name end,
+        worker_days = r.worker_days + excluded.worker_days,
+        count_sum   = r.count_sum + excluded.count_sum,
+        minutes_sum = r.minutes_sum + excluded.minutes_sum,
+        pass_days   = r.pass_days + excluded.pass_days,
+        eff_hist    = (select coalesce(jsonb_object_agg(h.b, h.n), '{}') from (
+                         select b, sum(n::int) as n
+                         from (select * from jsonb_each_text(r.eff_hist)
+                               union all select * from jsonb_each_text(excluded.eff_hist)) x(b, n)
+                         group by b having sum(n::int) > 0) h),
+        updated_at  = now();
+      delete from kpi_rollups where worker_days <= 0;
+    $$;
+
+    -- 由 audit_runs 依留存順序重放 rollup_contrib；單一交易，重建中其他寫入會等待、讀取看到舊值
+    create or replace function rebuild_kpi_rollups() returns int
+    language plpgsql as $$
+    declare
+      c jsonb;
+      n int;
+    begin
+      lock table kpi_rollups in exclusive mode;
+      delete from kpi_rollups;
+      for c in select rollup_contrib from audit_runs
+               where jsonb_array_length(coalesce(rollup_contrib, '[]')) > 0 order by created_at loop
+        perform apply_kpi_rollup(c);
+      end loop;
+      select count(*) into n from kpi_rollups;
+      return n;
+    end $$;
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+PERIOD_TYPES = ("month", "week")
+ROLLUP_KEY_COLS = ["period_type", "period_start", "app_name", "shift", "worker"]
+ROLLUP_SUM_COLS = ["worker_days", "count_sum", "minutes_sum", "pass_days"]
+ROLLUP_COLS = ROLLUP_KEY_COLS + ["worker_name"] + ROLLUP_SUM_COLS + ["eff_hist"]
+
+EFF_HIST_MAX = 200  # 效率直方圖上限（件/時），超過者歸入最後一格
+
+
+def _period_starts(dates: pd.Series, period_type: str) -> pd.Series:
+    if period_type == "month":
+        return dates.dt.to_period("M").dt.start_time.dt.strftime("%Y-%m-%d")
+    return (dates - pd.to_timedelta(dates.dt.weekday, unit="D")).dt.strftime("%Y-%m-%d")
+
+
+def build_rollup_contrib(
+    long_df: pd.DataFrame,
+    *,
+    app_name: str,
+    target_eff: float,
+    user_col: str = "記錄輸入人",
+    name_col: str = "姓名",
+    shift_col: str = "時段",
+    date_col: str = "日期",
+    count_col: str = "筆數",
+    minutes_col: str = "總分鐘",
+    eff_col: str = "效率",
+) -> List[dict]:
+    """
+    由「人員 × 日期 × 時段」長表產生本次留存對月 / 週彙總的貢獻列。
+    回傳 list[dict]（可直接存進 audit_runs.rollup_contrib）。
+    """
+    if long_df is None or long_df.empty:
+        return []
+    need = [user_col, shift_col, date_col, count_col, minutes_col, eff_col]
+    if any(c not in long_df.columns for c in need):
+        return []
+
+    df = pd.DataFrame({
+        "shift": long_df[shift_col].astype(str).str.strip(),
+        "worker": long_df[user_col].astype(str).str.strip(),
+        "worker_name": (long_df[name_col].fillna("").astype(str) if name_col in long_df.columns else ""),
+        "date": pd.to_datetime(long_df[date_col], errors="coerce"),
+        "count": pd.to_numeric(long_df[count_col], errors="coerce").fillna(0),
+        "minutes": pd.to_numeric(long_df[minutes_col], errors="coerce").fillna(0),
+        "eff": pd.to_numeric(long_df[eff_col], errors="coerce"),
+    })
+    df = df[df["date"].notna() & df["worker"].ne("") & df["worker"].ne("整體合計")]
+    if df.empty:
+        return []
+    df["pass"] = (df["eff"] >= float(target_eff)).astype(int)
+    df["bin"] = np.floor(df["eff"].clip(lower=0, upper=EFF_HIST_MAX))
+
+    keys = ["period_start", "shift", "worker"]
+    rows: List[dict] = []
+    for period_type in PERIOD_TYPES:
+        d = df.assign(period_start=_period_starts(df["date"], period_type))
+        agg = d.groupby(keys, sort=True).agg(
+            worker_name=("worker_name", "last"),
+            worker_days=("date", "size"),
+            count_sum=("count", "sum"),
+            minutes_sum=("minutes", "sum"),
+            pass_days=("pass", "sum"),
+        )
+        hists: Dict[tuple, Dict[str, int]] = {}
+        for (ps, sh, wk, b), n in d.dropna(subset=["bin"]).groupby(keys + ["bin"]).size().items():
+            hists.setdefault((ps, sh, wk), {})[str(int(b))] = int(n)
+
+        for (ps, sh, wk), r in agg.iterrows():
+            rows.append({
+                "period_type": period_type, "period_start": ps, "app_name": app_name,
+                "shift": sh, "worker": wk, "worker_name": r["worker_name"],
+                "worker_days": int(r["worker_days"]),
+                "count_sum": round(float(r["count_sum"]), 2),
+                "minutes_sum": round(float(r["minutes_sum"]), 2),
+                "pass_days": int(r["pass_days"]),
+                "eff_hist": hists.get((ps, sh, wk), {}),
+            })
+    return rows
+
+
+def contrib_by_date(long_df: pd.DataFrame, dates: List[str], *, date_col: str = "日期", **kw) -> Dict[str, List[dict]]:
+    """
+    各日期（"YYYY-MM-DD"）各自的貢獻列；參數同 build_rollup_contrib。
+    dates 中沒有任何列的日期對應空 list（先前計入的值要整筆扣回）。
+    """
+    out: Dict[str, List[dict]] = {d: [] for d in dates}
+    if long_df is None or long_df.empty or date_col not in long_df.columns:
+        return out
+    day = pd.to_datetime(long_df[date_col], errors="coerce").dt.strftime("%Y-%m-%d")
+    for d in dates:
+        rows = long_df[day == d]
+        if not rows.empty:
+            out[d] = build_rollup_contrib(rows, date_col=date_col, **kw)
+    return out
+
+
+def diff_rollup_contrib(new: List[dict], old: List[dict]) -> List[dict]:
+    """
+    new − old（同鍵的加總欄與直方圖逐格相減；直方圖格值可為負）；差額全為 0 的鍵略去。
+    結果照一般 contrib 以 merge_rollup_rows / apply_rollup_contrib 套用，刪除留存時同樣整筆扣回。
+    """
+    index: Dict[tuple, dict] = {}
+    for sign, rows in ((1, new), (-1, old)):
+        for c in rows:
+            k = rollup_key(c)
+            cur = index.get(k)
+            if cur is None:
+                cur = {col: c.get(col) for col in ROLLUP_KEY_COLS}
+                cur.update({"worker_name": "", "eff_hist": {}}, **{s: 0 for s in ROLLUP_SUM_COLS})
+                index[k] = cur
+            for s in ROLLUP_SUM_COLS:
+                cur[s] = round(cur[s] + sign * float(c.get(s) or 0), 2)
+            for b, n in (c.get("eff_hist") or {}).items():
+                cur["eff_hist"][b] = cur["eff_hist"].get(b, 0) + sign * int(n)
+            if sign > 0 or not cur["worker_name"]:
+                cur["worker_name"] = c.get("worker_name") or cur["worker_name"]
+
+    rows = []
+    for cur in index.values():
+        cur["eff_hist"] = {b: n for b, n in cur["eff_hist"].items() if n != 0}
+        if any(cur[s] for s in ROLLUP_SUM_COLS) or cur["eff_hist"]:
+            cur["worker_days"], cur["pass_days"] = int(cur["worker_days"]), int(cur["pass_days"])
+            rows.append(cur)
+    return rows
+
+
+def rollup_key(row: dict) -> tuple:
+    return tuple(str(row.get(c)) for c in ROLLUP_KEY_COLS)
+
+
+def merge_rollup_rows(existing: List[dict], contrib: List[dict], sign: int = 1) -> Tuple[List[dict], List[tuple]]:
+    """
+    把 contrib 以 sign（+1 新增 / -1 刪除）累加到既有彙總列。
+    回傳 (要 upsert 的列, 人日數歸零要刪除的鍵)；只回傳本次有異動的鍵。
+    """
+    index = {rollup_key(r): {c: r.get(c) for c in ROLLUP_COLS} for r in existing}
+    touched: Dict[tuple, None] = {}
+    for c in contrib:
+        k = rollup_key(c)
+        cur = index.get(k)
+        if cur is None:
+            cur = {col: c.get(col) for col in ROLLUP_KEY_COLS}
+            cur.update({"worker_name": c.get("worker_name") or "", "eff_hist": {}})
+            cur.update({s: 0 for s in ROLLUP_SUM_COLS})
+        for s in ROLLUP_SUM_COLS:
+            cur[s] = round(float(cur.get(s) or 0) + sign * float(c.get(s) or 0), 2)
+        hist = dict(cur.get("eff_hist") or {})
+        for b, n in (c.get("eff_hist") or {}).items():
+            v = int(hist.get(b, 0)) + sign * int(n)
+            if v > 0:
+                hist[b] = v
+            else:
+                hist.pop(b, None)
+        cur["eff_hist"] = hist
+        if sign > 0 and c.get("worker_name"):
+            cur["worker_name"] = c["worker_name"]
+        index[k] = cur
+        touched[k] = None
+
+    upserts, deletes = [], []
+    for k in touched:
+        r = index[k]
+        if (r.get("worker_days") or 0) <= 0:
+            deletes.append(k)
+        else:
+            r["worker_days"] = int(r["worker_days"])
+            r["pass_days"] = int(r["pass_days"])
+            upserts.append(r)
+    return upserts, deletes
+
+
+def hist_quantile(hist: Dict[str, int] | None, q: float) -> float | None:
+    """由效率直方圖取分位數（精度 1 件/時，回傳該格下緣）。"""
+    if not hist:
+        return None
+    items = sorted((int(b), int(n)) for b, n in hist.items() if int(n) > 0)
+    total = sum(n for _, n in items)
+    if total <= 0:
+        return None
+    need = q * total
+    acc = 0
+    for b, n in items:
+        acc += n
+        if acc >= need:
+            return float(b)
+    return float(items[-1][0])
+
+
+def rollup_frame(rows: List[dict]) -> pd.DataFrame:
+    """彙總列 → 儀表板用 DataFrame（含效率、達標率、P50/P90）。"""
+    cols = ["期間", "模組別", "班別", "記錄輸入人", "姓名", "人日數", "筆數", "工時_分鐘",
+            "效率", "達標人日", "達標率", "效率P50", "效率P90"]
+    if not rows:
+        return pd.DataFrame(columns=cols)
+    df = pd.DataFrame(rows)
+    minutes = pd.to_numeric(df["minutes_sum"], errors="coerce")
+    out = pd.DataFrame({
+        "期間": pd.to_datetime(df["period_start"], errors="coerce"),
+        "模組別": df["app_name"],
+        "班別": df["shift"],
+        "記錄輸入人": df["worker"],
+        "姓名": df["worker_name"].fillna(""),
+        "人日數": pd.to_numeric(df["worker_days"], errors="coerce").fillna(0).astype(int),
+        "筆數": pd.to_numeric(df["count_sum"], errors="coerce").fillna(0),
+        "工時_分鐘": minutes.fillna(0),
+        "達標人日": pd.to_numeric(df["pass_days"], errors="coerce").fillna(0).astype(int),
+    })
+    out["效率"] = (out["筆數"] / minutes.where(minutes > 0) * 60.0).round(2)
+    out["達標率"] = (out["達標人日"] / out["人日數"].where(out["人日數"] > 0)).round(4)
+    out["效率P50"] = [hist_quantile(h, 0.5) for h in df["eff_hist"]]
+    out["效率P90"] = [hist_quantile(h, 0.9) for h in df["eff_hist"]]
+    return out[cols].sort_values(["期間", "模組別", "班別", "記錄輸入人"])
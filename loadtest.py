@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+頁面並行負載測試（模擬月底多位主管同時上傳、產出 KPI）
+- 以 Streamlit 的 AppTest 無介面執行真正的頁面腳本（驗收 / 上架），每個 session 一個 AppTest、各自一個 thread：
+  首次載入 → 「上傳」合成匯出檔（synthetic_logs，每個 session 不同 seed）→ 按「🚀 產出 KPI」→ 等頁面跑完
+- 上傳：AppTest 沒有 file_uploader 操作，測試期間 st.file_uploader 換成讀 session_state 的替身（各 session 各自的檔案）
+- Supabase：fake_supabase 的記憶體替身（--supabase-latency-ms 模擬網路往返）；留存成功與否照頁面訊息判定
+- 計算走真正的共用計算池（compute_pool）：WORK_EFF_POOL_WORKERS / WORK_EFF_POOL_MAX_PENDING 照常生效，
+  排隊已滿（PoolBusy）的 session 記為「被拒」
+- 量測：
+    延遲      每個 session 按下按鈕到頁面跑完（含排隊、計算、匯出、留存）→ p50 / p95 / 最大
+    throughput 完成的 session 數 / 分鐘、處理列數 / 秒（整段測試的牆鐘時間）
+    記憶體    本 process ＋ 計算池子 process 的 RSS 合計（每 0.2 秒取樣）峰值；
+              每 session 平均 = (峰值 − 開始前) / 同時進行的 session 數
+
+命令列：
+    python loadtest.py [--sessions 8] [--concurrency 8] [--page qc|shelf|both] [--rows 20000]
+                       [--fmt csv|xlsx] [--ramp 0] [--supabase-latency-ms 50] [--timeout 900] [--json 檔案]
+結束碼：全部成功 0；有被拒 / 錯誤 / 逾時 1
+"""
+from __future__ import annotations
+
+import argparse
+import concurrent.futures as cf
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import fake_supabase
+from mem_probe import tree_rss_mb
+from synthetic_logs import make, roster_env, spec_for_rows
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+UPLOADS_KEY = "_loadtest_uploads"
+RUN_BUTTON = "產出 KPI"
+
+
+@dataclass(frozen=True)
+class PageSpec:
+    key: str
+    kind: str               # synthetic_logs 的種類
+    path: str
+    done: str               # 計算完成的 st.success 文字片段
+    audited: str            # 留存成功的 st.success 文字片段
+
+
+PAGES = {
+    "qc": PageSpec("qc", "qc", os.path.join(HERE, "pages", "1_驗收達標效率.py"), "已成功留存", "已成功留存"),
+    "shelf": PageSpec("shelf", "shelf", os.path.join(HERE, "pages", "2_總上組上架產能.py"), "已完成 KPI 計算", "已留存"),
+}
+
+
+# ===== 上傳替身 =====
+class _Upload:
+    """st.file_uploader 回傳物件的替身（頁面只用 .name / .getvalue()）"""
+
+    def __init__(self, name: str, data: bytes):
+        self.name, self._data = name, data
+        self.size = len(data)
+
+    def getvalue(self) -> bytes:
+        return self._data
+
+
+@contextlib.contextmanager
+def fake_uploader() -> Iterator[None]:
+    """期間內 st.file_uploader 回傳各 session 的 session_state[UPLOADS_KEY]"""
+    import streamlit as st
+
+    original = st.file_uploader
+
+    def uploader(label, *args, accept_multiple_files=False, **kwargs):
+        files = st.session_state.get(UPLOADS_KEY) or []
+        if accept_multiple_files:
+            return files or []
+        return files[0] if files else None
+
+    st.file_uploader = uploader
+    try:
+        yield
+    finally:
+        st.file_uploader = original
+
+
+# ===== 記憶體取樣 =====
+class RssSampler:
+    """背景 thread 定時取 process 樹 RSS，記峰值"""
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.baseline = tree_rss_mb()
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="loadtest-rss", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, tree_rss_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, tree_rss_mb())
+
+
+# ===== 單一 session =====
+@dataclass
+class SessionResult:
+    page: str
+    index: int
+    rows: int
+    status: str = "錯誤"          # 成功 / 被拒 / 錯誤 / 逾時
+    load_s: Optional[float] = None
+    latency_s: Optional[float] = None
+    audited: bool = False
+    message: str = ""
+
+
+def _texts(elements) -> List[str]:
+    return [str(e.value) for e in elements]
+
+
+def run_session(page: PageSpec, index: int, data: bytes, filename: str, rows: int,
+                timeout: float, start_delay: float = 0.0) -> SessionResult:
+    from streamlit.testing.v1 import AppTest
+
+    res = SessionResult(page.key, index, rows)
+    if start_delay > 0:
+        time.sleep(start_delay)
+    try:
+        at = AppTest.from_file(page.path, default_timeout=timeout)
+        at.session_state[UPLOADS_KEY] = [_Upload(filename, data)]
+        t0 = time.perf_counter()
+        at.run()
+        res.load_s = round(time.perf_counter() - t0, 3)
+        button = next((b for b in at.button if RUN_BUTTON in str(b.label)), None)
+        if button is None:
+            res.message = "找不到「產出 KPI」按鈕"
+            return res
+        t0 = time.perf_counter()
+        button.click().run()
+        res.latency_s = round(time.perf_counter() - t0, 3)
+    except RuntimeError as e:  # AppTest 逾時
+        res.status, res.message = ("逾時" if "timed out" in str(e).lower() else "錯誤"), str(e)[:200]
+        return res
+    except Exception as e:
+        res.message = f"{type(e).__name__}: {e}"[:200]
+        return res
+
+    success = _texts(at.success)
+    errors = _texts(at.error) + [str(x.value) for x in at.exception]
+    # PoolBusy 顯示成 st.warning(f"⏳ {e}")：開頭的 emoji 會被 streamlit 拆到 icon
+    busy = [str(w.value) for w in at.warning if "⏳" in f"{w.icon}{w.value}"]
+    res.audited = any(page.audited in s for s in success)
+    if busy:
+        res.status, res.message = "被拒", busy[0][:200]
+    elif errors:
+        res.message = "；".join(errors)[:200]
+    elif any(page.done in s for s in success):
+        res.status = "成功"
+    else:
+        res.message = "頁面沒有完成訊息"
+    return res
+
+
+# ===== 整體 =====
+@dataclass
+class LoadReport:
+    sessions: int
+    concurrency: int
+    rows: int
+    fmt: str
+    wall_s: float = 0.0
+    baseline_mb: float = 0.0
+    peak_mb: float = 0.0
+    supabase_calls: int = 0
+    audit_rows: int = 0
+    results: List[SessionResult] = field(default_factory=list)
+
+    def summary(self) -> pd.DataFrame:
+        """各頁面（＋全部）一列：成功 / 被拒 / 錯誤、延遲百分位、throughput、記憶體"""
+        df = pd.DataFrame([asdict(r) for r in self.results])
+        active = max(1, min(self.sessions, self.concurrency))
+        per_session = round((self.peak_mb - self.baseline_mb) / active, 1)
+        groups = [(p, df[df["page"] == p]) for p in df["page"].unique()]
+        if len(groups) > 1:
+            groups.append(("全部", df))
+        rows = []
+        for name, g in groups:
+            ok = g[g["status"] == "成功"]
+            lat = ok["latency_s"].to_numpy(float)
+            rows.append({
+                "頁面": name, "session數": len(g), "成功": len(ok),
+                "被拒": int((g["status"] == "被拒").sum()),
+                "錯誤_逾時": int(g["status"].isin(["錯誤", "逾時"]).sum()),
+                "留存": int(g["audited"].sum()),
+                "延遲_p50_秒": round(float(np.percentile(lat, 50)), 2) if len(lat) else None,
+                "延遲_p95_秒": round(float(np.percentile(lat, 95)), 2) if len(lat) else None,
+                "延遲_最大_秒": round(float(lat.max()), 2) if len(lat) else None,
+                "首次載入_p50_秒": round(float(g["load_s"].dropna().median()), 2) if g["load_s"].notna().any() else None,
+                "每分鐘完成": round(len(ok) / self.wall_s * 60, 2) if self.wall_s else None,
+                "列數_每秒": round(ok["rows"].sum() / self.wall_s, 0) if self.wall_s else None,
+                "峰值_MB": round(self.peak_mb, 1),
+                "每session_MB": per_session,
+            })
+        return pd.DataFrame(rows)
+
+    def to_dict(self) -> dict:
+        return {**{k: v for k, v in asdict(self).items() if k != "results"},
+                "summary": self.summary().to_dict("records"),
+                "results": [asdict(r) for r in self.results]}
+
+
+def run_load(sessions: int = 8, concurrency: int = 8, pages: List[str] = ("qc",), rows: int = 20_000,
+             fmt: str = "csv", ramp: float = 0.0, supabase_latency_ms: float = 0.0, timeout: float = 900.0,
+             log=print) -> LoadReport:
+    """產生各 session 的檔案 → 同時跑 → 彙整；頁面依 session 序號輪流分配"""
+    plan = []
+    for i in range(sessions):
+        page = PAGES[pages[i % len(pages)]]
+        spec = spec_for_rows(page.kind, rows, seed=1000 + i)
+        plan.append((page, spec))
+    log(f"產生 {sessions} 份合成檔（每份 {rows:,} 列，{fmt}）…")
+    files = [make(spec, fmt) for _, spec in plan]
+
+    report = LoadReport(sessions, concurrency, rows, fmt)
+    # 合成代碼的名冊：在計算池啟動前設好，子 process 才繼承得到
+    with roster_env(*(spec for _, spec in plan)), fake_supabase.installed(latency_ms=supabase_latency_ms) as sb, \
+            fake_uploader(), RssSampler() as rss:
+        t0 = time.perf_counter()
+        with cf.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="session") as ex:
+            futs = [ex.submit(run_session, page, i, data, f"synthetic_{page.kind}_{i}.{fmt}", rows, timeout,
+                              ramp * i / sessions if ramp else 0.0)
+                    for i, ((page, _), data) in enumerate(zip(plan, files))]
+            for fut in cf.as_completed(futs):
+                r = fut.result()
+                report.results.append(r)
+                log(f"  session {r.index:>3}（{r.page}）{r.status}"
+                    + (f"｜{r.latency_s:.1f} 秒" if r.latency_s is not None else "")
+                    + (f"｜{r.message}" if r.message else ""))
+        report.wall_s = round(time.perf_counter() - t0, 3)
+    report.results.sort(key=lambda r: r.index)
+    report.baseline_mb, report.peak_mb = round(rss.baseline, 1), round(rss.peak, 1)
+    report.supabase_calls = sb.calls
+    report.audit_rows = len(sb.tables.get("audit_runs", []))
+    return report
+
+
+# ===== 命令列 =====
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Streamlit 頁面並行負載測試（AppTest ＋ 本機 Supabase 替身）")
+    ap.add_argument("--sessions", type=int, default=8, help="總 session 數")
+    ap.add_argument("--concurrency", type=int, default=8, help="同時進行的 session 數")
+    ap.add_argument("--page", choices=["qc", "shelf", "both"], default="qc")
+    ap.add_argument("--rows", type=int, default=20_000, help="每份上傳檔的列數")
+    ap.add_argument("--fmt", choices=["csv", "xlsx"], default="csv")
+    ap.add_argument("--ramp", type=float, default=0.0, help="在這麼多秒內陸續開始（0 為同時開始）")
+    ap.add_argument("--supabase-latency-ms", type=float, default=50.0, help="Supabase 替身每次呼叫的延遲")
+    ap.add_argument("--timeout", type=float, default=900.0, help="單一 session 按下按鈕後的逾時秒數")
+    ap.add_argument("--json", help="另存完整結果（JSON）")
+    args = ap.parse_args(argv)
+
+    # 棄用提示、thread 沒有 ScriptRunContext 等每個 session 都會印；
+    # 設定檔在第一次 AppTest run 才解析、解析完會照 logger.level 重設，所以先寫進設定再套用
+    from streamlit import config as st_config
+    from streamlit.logger import set_log_level
+    st_config.set_option("logger.level", "error")
+    set_log_level(logging.ERROR)
+    pages = ["qc", "shelf"] if args.page == "both" else [args.page]
+    report = run_load(args.sessions, args.concurrency, pages, args.rows, args.fmt, args.ramp,
+                      args.supabase_latency_ms, args.timeout)
+    print(f"\n{args.sessions} 個 session（同時 {args.concurrency}）｜總時間 {report.wall_s:.1f} 秒｜"
+          f"記憶體 {report.baseline_mb:.0f} → 峰值 {report.peak_mb:.0f} MB｜Supabase 呼叫 {report.supabase_calls} 次")
+    with pd.option_context("display.width", 250, "display.max_columns", None):
+        print(report.summary().to_string(index=False))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, ensure_ascii=False, indent=1)
+    return 0 if all(r.status == "成功" for r in report.results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+記憶體量測：各計算階段的峰值 RSS（評估小容器能跑多大的檔）
+- StageMemory 包在引擎的 progress 回報器外面：階段（讀檔 / 過濾 / 空窗偵測 / 彙總 / 匯出）切換時
+  記下該階段的起訖 RSS 與峰值 RSS，再把回報轉給原本的 progress
+- 峰值取 /proc/self/status 的 VmHWM；每個階段開始時寫 /proc/self/clear_refs 重設，
+  得到「該階段內」的峰值。非 Linux 或無法重設時改用 getrusage 的累計峰值（只會遞增）
+- tree_rss_mb()：本 process 加所有子孫 process（計算池）的 RSS 合計（負載測試取樣用）
+
+命令列：
+    python mem_probe.py 檔案 [檔案 ...] [--include-source]
+    （單檔走 run_qc_efficiency，多檔走 run_qc_efficiency_files；印出各階段 RSS 表）
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+from compute_pool import STAGE_LABELS
+
+_STATUS = "/proc/self/status"
+_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def _status_mb(field: str) -> Optional[float]:
+    try:
+        with open(_STATUS) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024  # kB → MB
+    except OSError:
+        pass
+    return None
+
+
+def _maxrss_mb() -> float:
+    import resource
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 / (1024 if sys.platform == "darwin" else 1)  # macOS 單位是 bytes
+
+
+def rss_mb() -> float:
+    """目前 RSS（MB）"""
+    cur = _status_mb("VmRSS")
+    return cur if cur is not None else _maxrss_mb()
+
+
+def _children(pid: int) -> List[int]:
+    out: List[int] = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children") as f:
+                out += [int(x) for x in f.read().split()]
+    except OSError:
+        pass
+    return out
+
+
+def tree_rss_mb(pid: Optional[int] = None) -> float:
+    """process 與所有子孫 process 的 RSS 合計（MB；例如伺服器 + 計算池子 process）；非 Linux 只算自己"""
+    pid = pid or os.getpid()
+    total, todo, seen = 0.0, [pid], set()
+    while todo:
+        p = todo.pop()
+        if p in seen:
+            continue
+        seen.add(p)
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) / 1024
+                        break
+        except OSError:
+            if p == pid:
+                return rss_mb()
+            continue
+        todo += _children(p)
+    return total
+
+
+def peak_mb() -> float:
+    """上次 reset_peak 以來的峰值 RSS（MB）"""
+    hwm = _status_mb("VmHWM")
+    return hwm if hwm is not None else _maxrss_mb()
+
+
+def reset_peak() -> bool:
+    """峰值歸零（從目前 RSS 重新起算）；不支援時回傳 False"""
+    try:
+        with open(_CLEAR_REFS, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class StageMemory:
+    """
+    progress(stage, pct, partial=None) 包裝：逐階段記錄 RSS
+    用法：
+        mem = StageMemory(progress)
+        run_qc_efficiency(b, name, rules, progress=mem)
+        mem.table()
+    """
+
+    def __init__(self, progress: Optional[Callable] = None):
+        self._progress = progress
+        self.rows: List[dict] = []
+        self._stage: Optional[str] = None
+        self._start = 0.0
+        self.resettable = reset_peak()
+        self.baseline = rss_mb()
+
+    def _close(self):
+        if self._stage is not None:
+            self.rows.append({"階段": STAGE_LABELS.get(self._stage, self._stage),
+                              "開始_MB": round(self._start, 1), "結束_MB": round(rss_mb(), 1),
+                              "峰值_MB": round(peak_mb(), 1)})
+
+    def __call__(self, stage: str, pct: float, partial: Optional[dict] = None):
+        if stage != self._stage:
+            self._close()
+            reset_peak()
+            self._stage, self._start = stage, rss_mb()
+        if self._progress is not None:
+            self._progress(stage, pct, partial)
+
+    def table(self) -> pd.DataFrame:
+        """各階段 RSS 表（呼叫時結束目前階段）；另含 增量_MB = 峰值 − 計算前基準"""
+        self._close()
+        self._stage = None
+        out = pd.DataFrame(self.rows, columns=["階段", "開始_MB", "結束_MB", "峰值_MB"])
+        out["增量_MB"] = (out["峰值_MB"] - self.baseline).round(1)
+        return out
+
+
+# ===== 命令列 =====
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="驗收效率計算的各階段峰值 RSS")
+    ap.add_argument("files", nargs="+", help="匯出檔（Excel / CSV）")
+    ap.add_argument("--include-source", action="store_true", help="報表附各來源分頁（完整欄位）")
+    args = ap.parse_args(argv)
+
+    import qc_core
+    files = [(os.path.basename(p), open(p, "rb").read()) for p in args.files]
+    mem = StageMemory()
+    if len(files) == 1:
+        qc_core.run_qc_efficiency(files[0][1], files[0][0], progress=mem, include_source=args.include_source)
+    else:
+        qc_core.run_qc_efficiency_files(files, progress=mem, include_source=args.include_source)
+    table = mem.table()
+    print(f"計算前 RSS {mem.baseline:.1f} MB" + ("" if mem.resettable else "（無法重設峰值：峰值為累計值）"))
+    print(table.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,9 @@ import streamlit as st
 import pandas as pd
 from supabase import create_client
 
-from common_ui import inject_logistics_theme, set_page, card_open, card_close
+from common_ui import inject_logistics_theme, set_page, card_open, card_close, current_delete_password
+from audit_store import fetch_rollups, rebuild_rollups
+from kpi_rollup import rollup_frame
 
 
 def sb():
@@ -42,6 +44,17 @@ def main():
         ops = sorted([x for x in df.get("operator", pd.Series([])).dropna().unique()])
         operator = st.selectbox("分析執行人（Operator）", ["全部"] + ops)
 
+        st.markdown("#### 作業人員彙總")
+        period_label = st.radio("彙總期間", ["月", "週"], horizontal=True)
+        # 重建會重寫全部彙總 → 同刪除留存，需本月刪除密碼
+        _, expected_pwd = current_delete_password()
+        rebuild_pwd = st.text_input("輸入本月刪除密碼以重建", type="password", key="rebuild_rollups_pwd")
+        unlocked = bool(expected_pwd) and rebuild_pwd == expected_pwd
+        if st.button("🔁 重建月/週彙總", disabled=not unlocked, use_container_width=True):
+            with st.spinner("由歷次留存重建中..."):
+                n = rebuild_rollups()
+            st.success(f"✅ 已重建 {n:,} 筆彙總")
+
     dff = df[df["app_name"] == app_name].copy()
     if operator != "全部":
         dff = dff[dff["operator"] == operator].copy()
@@ -78,7 +91,33 @@ def main():
     )
     card_close()
 
-    st.info("如果你要做到『作業人員』AM/PM 對比（而非 Operator），我可以下一步把「每次計算的彙總人員表」也寫入 Supabase，這樣主管就能指定某位作業員做長期對比。")
+    # ===== 作業人員 AM/PM（讀 kpi_rollups 月/週彙總，不掃全部歷史）=====
+    period_type = "month" if period_label == "月" else "week"
+    rdf = rollup_frame(fetch_rollups(app_name=app_name, period_type=period_type))
+    if rdf.empty:
+        st.info("此模組尚無作業人員彙總（新留存會自動累加；舊資料可按側欄『重建月/週彙總』）。")
+        return
+
+    rdf["人員"] = rdf["姓名"].where(rdf["姓名"].astype(str).str.len() > 0, rdf["記錄輸入人"])
+    workers = sorted(rdf["人員"].dropna().unique().tolist())
+    who = st.selectbox("作業人員", ["全部"] + workers)
+    wdf = rdf if who == "全部" else rdf[rdf["人員"] == who]
+
+    card_open(f"📈 作業人員 AM / PM 效率（{period_label}彙總）")
+    trend_w = (
+        wdf.groupby(["期間", "班別"], as_index=False)[["筆數", "工時_分鐘"]].sum()
+        .assign(效率=lambda x: (x["筆數"] / x["工時_分鐘"].where(x["工時_分鐘"] > 0) * 60.0).round(2))
+    )
+    st.line_chart(trend_w, x="期間", y="效率", color="班別")
+    card_close()
+
+    card_open(f"📄 作業人員彙總明細（{period_label}）")
+    st.dataframe(
+        wdf.drop(columns=["人員"]).sort_values(["期間", "班別", "效率"], ascending=[False, True, False]),
+        use_container_width=True,
+        hide_index=True,
+    )
+    card_close()
 
 
 if __name__ == "__main__":
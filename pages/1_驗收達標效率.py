@@ -13,10 +13,39 @@ from common_ui import (
     download_excel,
     card_open,
     card_close,
+    perf_panel,
+    profiler_controls,
 )
+from compute_pool import JobCancelled, PoolBusy
 
-from qc_core import run_qc_efficiency
-from audit_store import sha256_bytes, upload_export_bytes, insert_audit_run
+from qc_core import (
+    run_qc_efficiency,
+    run_qc_efficiency_files,
+    run_qc_incremental,
+    run_qc_incremental_files,
+    preview_qc_kpis,
+    clean_skip_rules,
+)
+from partial_store import PartialStore
+from audit_store import sha256_bytes, upload_export_bytes, insert_audit_run, insert_incremental_audit_run
+from kpi_rollup import build_rollup_contrib, contrib_by_date
+
+
+def render_partial_kpis(partial: dict, caption: str = "📊 KPI 先行預覽（報表產出中）"):
+    """計算池送出的部分結果（Excel 產出前）或快速預覽 → 先顯示 AM/PM 概況"""
+    df = (partial or {}).get("ampm_df")
+    if df is None or df.empty or "時段" not in df.columns:
+        return
+    st.caption(caption)
+    cols = st.columns(2)
+    for col, (shift, title) in zip(cols, [("上午", "AM 班"), ("下午", "PM 班")]):
+        sdf = df[df["時段"] == shift]
+        with col:
+            render_kpis([
+                KPI(f"{title} 人數", f"{len(sdf):,}"),
+                KPI("總驗收筆數", f"{sdf['筆數'].sum():,}"),
+                KPI("平均效率", f"{sdf['效率'].mean():.2f}" if len(sdf) else "-"),
+            ])
 
 
 def main():
@@ -59,16 +88,37 @@ def main():
                 hide_index=True,
             )
 
+        preview = st.toggle("⚡ 預覽模式（先顯示概估 KPI）", value=True,
+                            help="只讀人員 / 時間 / 到 欄位，先算筆數與首末筆工時；完整計算完成後自動取代")
+
+        include_source = st.checkbox("報表附完整來源分頁", value=False,
+                                     help="預設只讀計算用欄位（人員、時間、由/到、品號、姓名）；勾選後報表附各來源分頁全部欄位＋空窗欄，較慢、較耗記憶體")
+
+        st.markdown("#### 📅 增量模式（逐日累加）")
+        incremental = st.toggle("只上傳新一天的檔案，累加到資料集", value=False)
+        dataset = st.text_input("資料集名稱", value=f"{dt.date.today():%Y-%m}", disabled=not incremental)
+        store = None
+        if incremental:
+            # 排除規則不同 → 部分彙總不同 → 視為不同資料集
+            store = PartialStore("qc", dataset, {"skip_rules": clean_skip_rules(st.session_state.skip_rules)})
+            st.caption(f"已累計 {len(store.dates())} 天")
+            if st.button("🗑️ 清空此資料集", use_container_width=True):
+                store.clear()
+                st.rerun()
+
+        profiler = profiler_controls("qc")
+
     # ======================
     # 上傳資料
     # ======================
     card_open("📤 上傳作業原始資料（驗收）")
     uploaded = st.file_uploader(
-        "上傳驗收作業原始資料",
+        "上傳驗收作業原始資料（可多選，重疊區間自動去重）",
         type=["xlsx", "xls", "csv"],
+        accept_multiple_files=True,
         label_visibility="collapsed",
     )
-    run = st.button("🚀 產出 KPI", type="primary", disabled=uploaded is None)
+    run = st.button("🚀 產出 KPI", type="primary", disabled=not uploaded)
     card_close()
 
     if not run:
@@ -78,17 +128,56 @@ def main():
     # ======================
     # 計算
     # ======================
-    with st.spinner("KPI 計算中，請稍候..."):
-        result = run_qc_efficiency(
-            uploaded.getvalue(),
-            uploaded.name,
-            st.session_state.skip_rules,
-        )
+    files = [(f.name, f.getvalue()) for f in uploaded]
+    rules = st.session_state.skip_rules
+    pool_kw = dict(label="KPI 計算", with_progress=True, on_partial=render_partial_kpis)
+    if preview:
+        # 概估 KPI 另送一個短 job（正式計算先送出，不必等它）；正式 job 送出彙總後即由正式 KPI 取代
+        pool_kw["preview"] = (preview_qc_kpis, (files, rules), lambda ampm_df: render_partial_kpis(
+            {"ampm_df": ampm_df}, caption="⚡ 概估 KPI（完整計算中，完成後自動更新）"))
+    try:
+        # 送進伺服器共用計算池，不佔用本頁 script thread 的 GIL；彙總完成即先顯示 KPI
+        # 管理員開啟 profiler 時整個 job 在 profiler 下執行（未開啟時 profiler.pool 即 run_in_pool）
+        if len(files) > 1:
+            # 多檔：跨檔去重後合併計算（計算池內不再另開子 process）
+            if store is None:
+                result = profiler.pool(run_qc_efficiency_files, files, rules, max_workers=1,
+                                       include_source=include_source, **pool_kw)
+            else:
+                result = profiler.pool(run_qc_incremental_files, files, rules, store=store, max_workers=1, **pool_kw)
+        elif store is None:
+            result = profiler.pool(run_qc_efficiency, files[0][1], files[0][0], rules,
+                                   include_source=include_source, **pool_kw)
+        else:
+            result = profiler.pool(run_qc_incremental, files[0][1], files[0][0], rules, store=store, **pool_kw)
+    except PoolBusy as e:
+        st.warning(f"⏳ {e}")
+        return
+    except JobCancelled:
+        st.info("已取消本次計算。")
+        return
+    profiler.finish("驗收作業效能")
+
+    ingest = result.get("ingest")
+    if ingest:
+        st.info(f"📚 合併 {ingest['files']} 個檔案｜讀入 {ingest['rows_in']:,} 列｜跨檔重複 {ingest['duplicates']:,} 筆已剔除")
 
     df = result.get("ampm_df", pd.DataFrame())
     idle_df = result.get("idle_df", pd.DataFrame())
     target = float(result.get("target_eff", 20.0))
 
+    inc = None
+    if store is not None:
+        inc = {
+            "dataset": store.dataset,
+            "dates": [f"{d:%Y-%m-%d}" for d in result["dates"]],
+            "affected_dates": [f"{d:%Y-%m-%d}" for d in result["affected_dates"]],
+        }
+        st.info(
+            f"📅 資料集「{inc['dataset']}」累計 {len(inc['dates'])} 天"
+            f"（{inc['dates'][0]} ~ {inc['dates'][-1]}）｜本次重算：{'、'.join(inc['affected_dates']) or '無'}"
+        )
+
     if df.empty or "時段" not in df.columns:
         st.error("資料缺少『時段』欄位，無法區分 AM / PM 班別")
         return
@@ -144,6 +233,8 @@ def main():
         download_excel(result["xlsx_bytes"], result.get("xlsx_name", "驗收作業KPI.xlsx"))
         card_close()
 
+    perf_panel(result.get("metrics"))
+
     # ======================
     # 稽核留存
     # ======================
@@ -161,20 +252,30 @@ def main():
         payload = {
             "app_name": "驗收作業效能（KPI）",
             "operator": operator or None,
-            "source_filename": uploaded.name,
-            "source_sha256": sha256_bytes(uploaded.getvalue()),
+            "source_filename": " + ".join(name for name, _ in files),
+            "source_sha256": sha256_bytes(b"".join(content for _, content in files)),
             "params": {
                 "top_n": top_n,
                 "target_eff": target,
                 "skip_rules": st.session_state.skip_rules,
+                "incremental": inc,
+                "ingest": ingest,
+                "metrics": result.get("metrics"),
             },
             "kpi_am": {"avg_eff": am_df["效率"].mean(), "people": len(am_df)},
             "kpi_pm": {"avg_eff": pm_df["效率"].mean(), "people": len(pm_df)},
             "export_object_path": export_path,
         }
 
-        row = insert_audit_run(payload)
+        rollup_kw = dict(app_name="驗收作業效能（KPI）", target_eff=target)
+        if inc is None:
+            row = insert_audit_run({**payload, "rollup_contrib": build_rollup_contrib(df, **rollup_kw)})
+        else:
+            # 增量模式：重算日期可能先前已計入（重傳 / 補日 / 跨日連動），只計入與已計入值的差額
+            row = insert_incremental_audit_run(payload, contrib_by_date(df, inc["affected_dates"], **rollup_kw), store)
         st.success(f"✅ 已成功留存本次分析（ID：{row.get('id')}）")
+        if row.get("rollup_error"):
+            st.warning(f"⚠️ 月/週彙總更新失敗（可至人員對比頁重建）：{row['rollup_error']}")
 
     except Exception as e:
         st.error("❌ 稽核留存失敗")
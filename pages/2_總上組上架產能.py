@@ -1,11 +1,8 @@
-import io
-import re
 import uuid
 import datetime as dt
-from typing import Dict, List, Tuple, Optional
+from typing import List, Tuple, Optional
 
 import streamlit as st
-import pandas as pd
 
 from common_ui import (
     inject_logistics_theme,
@@ -15,474 +12,80 @@ from common_ui import (
     bar_topN,
     card_open,
     card_close,
+    RunProfiler,
+    perf_panel,
+    profiler_controls,
 )
 
-from audit_store import sha256_bytes, upload_export_bytes, insert_audit_run
+from audit_store import sha256_bytes, upload_export_bytes, insert_audit_run, insert_incremental_audit_run
+from partial_store import PartialStore
+from kpi_rollup import build_rollup_contrib, contrib_by_date
+from compute_pool import JobCancelled, PoolBusy
+from shelf_core import TO_EXCLUDE_KEYWORDS, ShelfParams, exclude_keywords, preview_shelf_kpis, run_shelf_job
 
 # =========================
 # Session Keys（確保匯出不清空 KPI）
 # =========================
-RESULT_KEY = "putaway_kpi_result_v1"
+RESULT_KEY = "putaway_kpi_result_v2"
 AUDIT_SIG_KEY = "putaway_last_audit_sig_v1"
 
 
 # =========================
-# 規則（依上架 v8.9）
+# 計算引擎：shelf_core（與批次 batch_cli 共用）
+# 規則（依上架 v8.9）：時段 / 休息規則 / 空窗排除帶 / 排除關鍵字 → ShelfParams
+# run_shelf_job：讀檔 → 每人每日 → 彙總 / 長表 / KPI → Excel，整段在計算池子 process 內完成
 # =========================
-TO_EXCLUDE_KEYWORDS = ["CGS", "JCPL", "QC99", "GREAT0001X", "GX010", "PD99"]
-TO_EXCLUDE_PATTERN = re.compile("|".join(re.escape(k) for k in TO_EXCLUDE_KEYWORDS), flags=re.IGNORECASE)
-
-INPUT_USER_CANDIDATES = ["記錄輸入人", "記錄輸入者", "建立人", "輸入人"]
-REV_DT_CANDIDATES = [
-    "修訂日期", "修訂時間", "修訂日", "異動時間", "修改時間",
-    "修訂日期時間", "修訂日期時間(系統)", "修訂日期時間（系統）",
-]
-
-TARGET_EFF = 20
-IDLE_MIN_THRESHOLD = 10
-
-AM_START, AM_END = dt.time(7, 0, 0), dt.time(12, 30, 0)
-PM_START, PM_END = dt.time(13, 30, 0), dt.time(23, 59, 59)
-
-NAME_MAP = {
-    "20200924001": "黃雅君", "20210805001": "郭中合", "20220505002": "阮文青明",
-    "20221221001": "阮文全", "20221222005": "謝忠龍", "20230119001": "陶春青",
-    "20240926001": "陳莉娜", "20241011002": "林雙慧", "20250502001": "吳詩敏",
-    "20250617001": "阮文譚", "20250617003": "喬家寶", "20250901009": "張寶萱",
-    "G01": "0", "20201109003": "吳振凱", "09963": "黃謙凱",
-    "20240313003": "阮曰忠", "20201109001": "梁冠如", "10003": "李茂銓",
-    "20200922002": "葉欲弘", "20250923019": "阮氏紅深", "9963": "黃謙凱",
-    "11399": "陳哲沅",
-}
-
-BREAK_RULES = [
-    (dt.time(20,45,0), dt.time(22,30,0),  0, "首≥20:45 且 末≤22:30 → 0 分鐘"),
-    (dt.time(18,30,0), dt.time(20,30,0),  0, "首≥18:30 且 末≤20:30 → 0 分鐘"),
-    (dt.time(15,30,0), dt.time(18, 0,0),  0, "首≥15:30 且 末≤18:00 → 0 分鐘"),
-    (dt.time(13,30,0), dt.time(15,35,0),  0, "首≥13:30 且 末≤15:35 → 0 分鐘"),
-    (dt.time(20,45,0), dt.time(23, 0,0),  0, "首≥20:45 且 末≤23:00 → 0 分鐘"),
-    (dt.time(20, 0,0), dt.time(22, 0,0), 15, "首≥20:00 且 末≤22:00 → 15 分鐘"),
-    (dt.time(18,30,0), dt.time(22, 0,0), 15, "首≥18:30 且 末≤22:00 → 15 分鐘"),
-    (dt.time(19, 0,0), dt.time(22,30,0), 15, "首≥19:00 且 末≤22:30 → 15 分鐘"),
-    (dt.time(13,30,0), dt.time(18, 0,0), 15, "首≥13:30 且 末≤18:00 → 15 分鐘"),
-    (dt.time(16, 0,0), dt.time(20,40,0), 30, "首≥16:00 且 末≤20:40 → 30 分鐘"),
-    (dt.time(15,30,0), dt.time(20,30,0), 30, "首≥15:30 且 末≤20:30 → 30 分鐘"),
-    (dt.time(17, 0,0), dt.time(22,30,0), 45, "首≥17:00 且 末≤22:30 → 45 分鐘"),
-    (dt.time(15,45,0), dt.time(22,30,0), 45, "首≥15:45 且 末≤22:30 → 45 分鐘"),
-    (dt.time(13,30,0), dt.time(20,29,0), 45, "首≥13:30 且 末≤20:29 → 45 分鐘"),
-    (dt.time(13,30,0), dt.time(23, 0,0), 60, "首≥13:30 且 末≤23:00 → 60 分鐘"),
-    (dt.time(11, 0,0), dt.time(17, 0,0), 75, "首≥11:00 且 末≤17:00 → 75 分鐘"),
-    (dt.time( 8, 0,0), dt.time(17, 0,0), 90, "首≥08:00 且 末≤17:00 → 90 分鐘"),
-    (dt.time(10,50,0), dt.time(23, 0,0),120, "首≥10:50 且 末≤23:00 → 120 分鐘"),
-    (dt.time( 8, 0,0), dt.time(23, 0,0),135, "首≥08:00 且 末≤23:00 → 135 分鐘"),
-]
-
-EXCLUDE_IDLE_RANGES = [
-    (dt.time(10, 0, 0), dt.time(10, 15, 0)),
-    (dt.time(12,30, 0), dt.time(13, 30, 0)),
-    (dt.time(15,30, 0), dt.time(15, 45, 0)),
-    (dt.time(18, 0, 0), dt.time(18, 30, 0)),
-    (dt.time(20,30, 0), dt.time(20, 45, 0)),
-]
 
 
-# =========================
-# 讀檔：xlsx/xlsm/xls/csv
-# =========================
-def read_excel_any_quiet_bytes(name: str, content: bytes) -> Dict[str, pd.DataFrame]:
-    ext = (name.split(".")[-1] or "").lower()
-
-    if ext in ("xlsx", "xlsm"):
-        xl = pd.ExcelFile(io.BytesIO(content), engine="openpyxl")
-        return {sn: pd.read_excel(xl, sheet_name=sn) for sn in xl.sheet_names}
-
-    # 舊版 .xls：需要 requirements.txt 安裝 xlrd==2.0.1
-    if ext == "xls":
-        xl = pd.ExcelFile(io.BytesIO(content), engine="xlrd")
-        return {sn: pd.read_excel(xl, sheet_name=sn) for sn in xl.sheet_names}
-
-    if ext == "csv":
-        for enc in ("utf-8-sig", "cp950", "big5"):
-            try:
-                return {"CSV": pd.read_csv(io.BytesIO(content), encoding=enc)}
-            except Exception:
-                continue
-        raise Exception("CSV 讀取失敗（請確認編碼）。")
-
-    raise Exception("目前僅支援 .xlsx/.xlsm/.xls/.csv")
-
-
-# =========================
-# 工具
-# =========================
-def _strip_cols(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df.columns = [str(c).strip() for c in df.columns]
-    return df
-
-def find_first_column(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
-    cols = [str(c).strip() for c in df.columns]
-    s = set(cols)
-    for name in candidates:
-        if name in s:
-            return name
-    norm_map = {re.sub(r"[（）\(\)\s]", "", c): c for c in cols}
-    for name in candidates:
-        key = re.sub(r"[（）\(\)\s]", "", name)
-        if key in norm_map:
-            return norm_map[key]
-    return None
-
-def normalize_to_qc(series: pd.Series) -> pd.Series:
-    s = series.astype(str).str.strip().str.upper()
-    return s.eq("QC")
-
-def to_not_excluded_mask(series: pd.Series) -> pd.Series:
-    s = series.astype(str).str.strip()
-    return ~s.str.contains(TO_EXCLUDE_PATTERN, na=False)
-
-def prepare_filtered_df(df: pd.DataFrame) -> pd.DataFrame:
-    if df is None or df.empty:
-        return pd.DataFrame()
-    df = _strip_cols(df)
-    if "由" not in df.columns or "到" not in df.columns:
-        return pd.DataFrame()
-    return df[normalize_to_qc(df["由"]) & to_not_excluded_mask(df["到"])].copy()
-
-def break_minutes_for_span(first_dt: pd.Timestamp, last_dt: pd.Timestamp) -> Tuple[int, str]:
-    if pd.isna(first_dt) or pd.isna(last_dt):
-        return 0, "無時間資料"
-    stt, edt = first_dt.time(), last_dt.time()
-    for st_ge, ed_le, mins, tag in BREAK_RULES:
-        if (stt >= st_ge) and (edt <= ed_le):
-            return int(mins), str(tag)
-    return 0, "未命中規則"
-
-def _subtract_exclusions(s_dt: pd.Timestamp, e_dt: pd.Timestamp, exclude_ranges):
-    if s_dt >= e_dt or not exclude_ranges:
-        return [(s_dt, e_dt)]
-    segments = [(s_dt, e_dt)]
-    for ex_s_t, ex_e_t in exclude_ranges:
-        ex_s = pd.Timestamp.combine(s_dt.date(), ex_s_t)
-        ex_e = pd.Timestamp.combine(s_dt.date(), ex_e_t)
-        new_segments = []
-        for a, b in segments:
-            if b <= ex_s or a >= ex_e:
-                new_segments.append((a, b))
-            else:
-                if a < ex_s:
-                    new_segments.append((a, ex_s))
-                if b > ex_e:
-                    new_segments.append((ex_e, b))
-        segments = [(x, y) for (x, y) in new_segments if x < y]
-    return segments
-
-def _compute_idle(series_dt: pd.Series, min_minutes=IDLE_MIN_THRESHOLD, exclude_ranges=EXCLUDE_IDLE_RANGES) -> Tuple[int, str]:
-    if series_dt.size < 2:
-        return 0, ""
-    s = series_dt.sort_values()
-    total_min, ranges_txt = 0, []
-    prev = s.iloc[0]
-    for cur in s.iloc[1:]:
-        if cur <= prev:
-            prev = cur
-            continue
-        for a, b in _subtract_exclusions(prev, cur, exclude_ranges or []):
-            gap_min = int(round((b - a).total_seconds() / 60.0))
-            if gap_min >= min_minutes:
-                total_min += gap_min
-                ranges_txt.append(f"{a.time()} ~ {b.time()}")
-        prev = cur
-    return int(total_min), "；".join(ranges_txt)
-
-def _span_metrics(series_dt: pd.Series):
-    if series_dt.empty:
-        return pd.NaT, pd.NaT, 0
-    return series_dt.min(), series_dt.max(), int(series_dt.size)
-
-def _eff(n, m):
-    return round((n / m * 60.0), 2) if m and m > 0 else 0.0
-
-def compute_am_pm_for_group(g: pd.DataFrame) -> pd.Series:
-    times = g["__dt__"]
-
-    # AM（不扣休）
-    t_am = times[times.dt.time.between(AM_START, AM_END)]
-    am_first, am_last, am_cnt = _span_metrics(t_am)
-    am_mins = int(round(((am_last - am_first).total_seconds() / 60.0))) if am_cnt > 0 else 0
-    am_eff = _eff(am_cnt, am_mins)
-    am_idle_min, am_idle_ranges = _compute_idle(t_am)
-
-    # PM（扣休）
-    t_pm = times[times.dt.time.between(PM_START, PM_END)]
-    pm_first, pm_last, pm_cnt = _span_metrics(t_pm)
-    if pm_cnt > 0:
-        pm_break, pm_rule = break_minutes_for_span(pm_first, pm_last)
-        raw_pm_mins = (pm_last - pm_first).total_seconds() / 60.0
-        pm_mins = max(int(round(raw_pm_mins - pm_break)), 0)
-    else:
-        pm_break, pm_rule, pm_mins = 0, "無時間資料", 0
-    pm_eff = _eff(pm_cnt, pm_mins)
-    pm_idle_min, pm_idle_ranges = _compute_idle(t_pm)
-
-    # Whole（扣休）
-    whole_first, whole_last, day_cnt = _span_metrics(times)
-    if day_cnt > 0:
-        whole_break, br_tag_whole = break_minutes_for_span(whole_first, whole_last)
-        raw_whole_mins = (whole_last - whole_first).total_seconds() / 60.0
-        whole_mins = max(int(round(raw_whole_mins - whole_break)), 0)
-    else:
-        whole_break, br_tag_whole, whole_mins = 0, "無時間資料", 0
-    whole_eff = _eff(day_cnt, whole_mins)
-
-    return pd.Series({
-        "第一筆時間": whole_first, "最後一筆時間": whole_last, "當日筆數": int(day_cnt),
-        "休息分鐘_整體": int(whole_break), "命中規則": br_tag_whole,
-        "當日工時_分鐘_扣休": int(whole_mins), "效率_件每小時": whole_eff,
-
-        "上午_第一筆": am_first, "上午_最後一筆": am_last, "上午_筆數": int(am_cnt),
-        "上午_工時_分鐘": int(am_mins), "上午_效率_件每小時": am_eff,
-        "上午_空窗分鐘": int(am_idle_min), "上午_空窗時段": am_idle_ranges,
-
-        "下午_第一筆": pm_first, "下午_最後一筆": pm_last, "下午_筆數": int(pm_cnt),
-        "下午_休息分鐘": int(pm_break), "下午_命中規則": pm_rule,
-        "下午_工時_分鐘_扣休": int(pm_mins), "下午_效率_件每小時": pm_eff,
-        "下午_空窗分鐘_扣休": int(pm_idle_min), "下午_空窗時段": pm_idle_ranges,
-    })
-
-
-# =========================
-# 匯出 Excel（bytes）
-# =========================
-def autosize_columns(ws, df: pd.DataFrame):
-    from openpyxl.utils import get_column_letter
-    cols = list(df.columns) if df is not None else []
-    for i, col in enumerate(cols, start=1):
-        if df is not None and not df.empty:
-            sample = [len(str(x)) for x in df[col].head(800).tolist()]
-            max_len = max([len(str(col))] + sample)
-        else:
-            max_len = max(len(str(col)), 8)
-        ws.column_dimensions[get_column_letter(i)].width = min(max_len + 2, 60)
-
-def shade_rows_by_efficiency(ws, header_name="效率_件每小時", green="C6EFCE", red="FFC7CE"):
-    from openpyxl.styles import PatternFill
-    eff_col = None
-    for c in range(1, ws.max_column + 1):
-        if str(ws.cell(row=1, column=c).value).strip() == header_name:
-            eff_col = c
-            break
-    if eff_col is None:
-        return
-    green_fill = PatternFill(start_color=green, end_color=green, fill_type="solid")
-    red_fill = PatternFill(start_color=red, end_color=red, fill_type="solid")
-    for r in range(2, ws.max_row + 1):
-        v = ws.cell(row=r, column=eff_col).value
-        try:
-            val = float(v) if v is not None and str(v).strip() != "" else None
-        except Exception:
-            val = None
-        if val is None:
-            continue
-        fill = green_fill if val >= TARGET_EFF else red_fill
-        for c in range(1, ws.max_column + 1):
-            ws.cell(row=r, column=c).fill = fill
-
-def build_excel_bytes(user_col: str, summary_out: pd.DataFrame, daily: pd.DataFrame, detail_long: pd.DataFrame) -> bytes:
-    out = io.BytesIO()
-    with pd.ExcelWriter(out, engine="openpyxl", datetime_format="yyyy-mm-dd hh:mm:ss", date_format="yyyy-mm-dd") as writer:
-        sum_cols = [
-            user_col, "對應姓名", "総日數",
-            "總筆數", "總工時_分鐘_扣休", "效率_件每小時",
-            "上午筆數", "上午工時_分鐘", "上午效率_件每小時",
-            "下午筆數", "下午工時_分鐘_扣休", "下午效率_件每小時",
-        ]
-        summary_out[sum_cols].to_excel(writer, index=False, sheet_name="彙總")
-        ws_sum = writer.sheets["彙總"]
-        autosize_columns(ws_sum, summary_out[sum_cols])
-        shade_rows_by_efficiency(ws_sum, "效率_件每小時")
-
-        det_cols = [
-            user_col, "對應姓名", "日期",
-            "第一筆時間", "最後一筆時間", "當日筆數",
-            "休息分鐘_整體", "當日工時_分鐘_扣休", "效率_件每小時",
-            "上午_第一筆", "上午_最後一筆", "上午_筆數", "上午_工時_分鐘", "上午_效率_件每小時",
-            "上午_空窗分鐘", "上午_空窗時段",
-            "下午_第一筆", "下午_最後一筆", "下午_筆數", "下午_休息分鐘",
-            "下午_工時_分鐘_扣休", "下午_效率_件每小時",
-            "下午_空窗分鐘_扣休", "下午_空窗時段",
-        ]
-        daily.sort_values([user_col, "日期", "第一筆時間"])[det_cols].to_excel(writer, index=False, sheet_name="明細")
-        ws_det = writer.sheets["明細"]
-        autosize_columns(ws_det, daily[det_cols])
-        shade_rows_by_efficiency(ws_det, "效率_件每小時")
-
-        if detail_long is not None and not detail_long.empty:
-            long_cols = [
-                user_col, "對應姓名", "日期", "時段",
-                "第一筆時間", "最後一筆時間",
-                "筆數", "工時_分鐘", "休息分鐘",
-                "空窗分鐘", "空窗時段",
-                "效率_件每小時", "命中規則",
-            ]
-            detail_long[long_cols].to_excel(writer, index=False, sheet_name="明細_時段")
-            ws_long = writer.sheets["明細_時段"]
-            autosize_columns(ws_long, detail_long[long_cols])
-            shade_rows_by_efficiency(ws_long, "效率_件每小時")
-
-        # 休息規則
-        rules_rows = []
-        for i, (st_ge, ed_le, mins, tag) in enumerate(BREAK_RULES, start=1):
-            rules_rows.append({
-                "優先序": i,
-                "首時間條件(>=)": st_ge.strftime("%H:%M:%S"),
-                "末時間條件(<=)": ed_le.strftime("%H:%M:%S"),
-                "休息分鐘": int(mins),
-                "規則說明": str(tag),
-            })
-        rules_df = pd.DataFrame(rules_rows, columns=["優先序", "首時間條件(>=)", "末時間條件(<=)", "休息分鐘", "規則說明"])
-        rules_df.to_excel(writer, index=False, sheet_name="休息規則")
-        autosize_columns(writer.sheets["休息規則"], rules_df)
-
-    return out.getvalue()
-
+def render_preview_kpis(preview: dict):
+    """快速預覽（只讀必要欄位）的概估 KPI；完整計算完成後由正式結果取代"""
+    kpi = preview["kpi"]
+    st.caption(f"⚡ 概估 KPI（{preview['total_count']:,} 筆；完整計算中，完成後自動更新）")
+    col_l, col_r = st.columns(2)
+    with col_l:
+        render_kpis([
+            KPI("總人數", f"{kpi['total_people']:,}"),
+            KPI("達標人數（整體效率）", f"{kpi['total_met']:,}"),
+            KPI("達標率（整體效率）", f"{kpi['total_rate']:.1%}"),
+        ])
+    with col_r:
+        render_kpis([
+            KPI("總人數", f"{kpi['pm_total']:,}"),
+            KPI("達標人數（下午效率）", f"{kpi['pm_met']:,}"),
+            KPI("達標率（下午效率）", f"{kpi['pm_rate']:.1%}"),
+        ])
 
-# =========================
-# 主流程：計算 + 存 session
-# =========================
-def compute_and_store(uploaded_name: str, uploaded_bytes: bytes, operator: str, top_n: int):
-    sheets = read_excel_any_quiet_bytes(uploaded_name, uploaded_bytes)
-
-    kept_all = []
-    for sn, df in sheets.items():
-        k = prepare_filtered_df(df)
-        if not k.empty:
-            k["__sheet__"] = sn
-            kept_all.append(k)
-    if not kept_all:
-        raise Exception("無符合資料（可能缺『由/到』欄或過濾後為空）。")
-
-    data = pd.concat(kept_all, ignore_index=True)
-
-    user_col = find_first_column(data, INPUT_USER_CANDIDATES)
-    revdt_col = find_first_column(data, REV_DT_CANDIDATES)
-    if user_col is None:
-        raise Exception("找不到『記錄輸入人』欄位（候選：記錄輸入人/記錄輸入者/建立人/輸入人）。")
-    if revdt_col is None:
-        raise Exception("找不到『修訂日期/時間』欄位（候選：修訂日期/修訂時間/異動時間/修改時間…）。")
-
-    data["__dt__"] = pd.to_datetime(data[revdt_col], errors="coerce")
-    data["__code__"] = data[user_col].astype(str).str.strip()
-    data["對應姓名"] = data["__code__"].map(NAME_MAP).fillna("")
-    dt_data = data.dropna(subset=["__dt__"]).copy()
-    if dt_data.empty:
-        raise Exception("資料沒有可用的修訂日期時間，無法計算。")
-
-    dt_data["日期"] = dt_data["__dt__"].dt.date
-
-    daily = (
-        dt_data.groupby([user_col, "對應姓名", "日期"], dropna=False)
-        .apply(compute_am_pm_for_group)
-        .reset_index()
-    )
 
-    summary = (
-        daily.groupby([user_col, "對應姓名"], dropna=False, as_index=False)
-        .agg(
-            総日數=("日期", "nunique"),
-            總筆數=("當日筆數", "sum"),
-            總工時_分鐘_扣休=("當日工時_分鐘_扣休", "sum"),
-            上午筆數=("上午_筆數", "sum"),
-            上午工時_分鐘=("上午_工時_分鐘", "sum"),
-            下午筆數=("下午_筆數", "sum"),
-            下午工時_分鐘_扣休=("下午_工時_分鐘_扣休", "sum"),
-        )
+def compute_and_store(files: List[Tuple[str, bytes]], operator: str, top_n: int,
+                      store: Optional[PartialStore] = None, preview: bool = False,
+                      params: Optional[ShelfParams] = None, profiler: Optional[RunProfiler] = None):
+    params = ShelfParams.of(params)
+    profiler = profiler or RunProfiler("putaway")
+    # 整段（讀檔 / 每人每日 / 彙總 / Excel）送進伺服器共用計算池，本頁 script thread 只等結果
+    # 多檔時跨檔去重；計算池內不再另開子 process；管理員開啟 profiler 時整個 job 在 profiler 下執行
+    # 預覽模式：概估 KPI 另送一個短 job（正式計算先送出，不必等它）
+    res, ingest, affected = profiler.pool(
+        run_shelf_job, files, params, store=store, max_workers=1, label="KPI 計算", with_progress=True,
+        preview=(preview_shelf_kpis, (files, params), render_preview_kpis) if preview else None,
     )
-    summary["上午效率_件每小時"] = summary.apply(lambda r: _eff(r["上午筆數"], r["上午工時_分鐘"]), axis=1)
-    summary["下午效率_件每小時"] = summary.apply(lambda r: _eff(r["下午筆數"], r["下午工時_分鐘_扣休"]), axis=1)
-    summary["總工時_分鐘_扣休"] = summary["上午工時_分鐘"].fillna(0).astype(int) + summary["下午工時_分鐘_扣休"].fillna(0).astype(int)
-    summary["效率_件每小時"] = summary.apply(lambda r: _eff(r["總筆數"], r["總工時_分鐘_扣休"]), axis=1)
-
-    for c in ["總筆數", "總工時_分鐘_扣休", "上午筆數", "上午工時_分鐘", "下午筆數", "下午工時_分鐘_扣休"]:
-        summary[c] = summary[c].fillna(0).astype(int)
-
-    total_people = int(summary[user_col].nunique())
-    total_met = int((summary["效率_件每小時"] >= TARGET_EFF).sum())
-    total_rate = (total_met / total_people) if total_people > 0 else 0.0
-
-    pm_met = int((summary["下午效率_件每小時"] >= TARGET_EFF).sum())
-    pm_total = int(summary[user_col].nunique())
-    pm_rate = (pm_met / pm_total) if pm_total > 0 else 0.0
-
-    total_row = {
-        user_col: "整體合計", "對應姓名": "",
-        "総日數": int(summary["総日數"].sum()),
-        "總筆數": int(summary["總筆數"].sum()),
-        "總工時_分鐘_扣休": int(summary["總工時_分鐘_扣休"].sum()),
-        "上午筆數": int(summary["上午筆數"].sum()),
-        "上午工時_分鐘": int(summary["上午工時_分鐘"].sum()),
-        "下午筆數": int(summary["下午筆數"].sum()),
-        "下午工時_分鐘_扣休": int(summary["下午工時_分鐘_扣休"].sum()),
-        "效率_件每小時": _eff(int(summary["總筆數"].sum()), int(summary["總工時_分鐘_扣休"].sum())),
-        "上午效率_件每小時": _eff(int(summary["上午筆數"].sum()), int(summary["上午工時_分鐘"].sum())),
-        "下午效率_件每小時": _eff(int(summary["下午筆數"].sum()), int(summary["下午工時_分鐘_扣休"].sum())),
-    }
-    summary_out = pd.concat([summary, pd.DataFrame([total_row])], ignore_index=True)
-
-    # 明細_時段（長表）
-    long_rows = []
-    for _, r in daily.iterrows():
-        if r["上午_筆數"] > 0:
-            long_rows.append({
-                user_col: r[user_col], "對應姓名": r["對應姓名"], "日期": r["日期"], "時段": "上午",
-                "第一筆時間": r["上午_第一筆"], "最後一筆時間": r["上午_最後一筆"],
-                "筆數": int(r["上午_筆數"]),
-                "工時_分鐘": int(r["上午_工時_分鐘"]),
-                "休息分鐘": 0,
-                "空窗分鐘": int(r["上午_空窗分鐘"]),
-                "空窗時段": r["上午_空窗時段"],
-                "效率_件每小時": float(r["上午_效率_件每小時"]),
-                "命中規則": "上午不扣休",
-            })
-        if r["下午_筆數"] > 0:
-            long_rows.append({
-                user_col: r[user_col], "對應姓名": r["對應姓名"], "日期": r["日期"], "時段": "下午",
-                "第一筆時間": r["下午_第一筆"], "最後一筆時間": r["下午_最後一筆"],
-                "筆數": int(r["下午_筆數"]),
-                "工時_分鐘": int(r["下午_工時_分鐘_扣休"]),
-                "休息分鐘": int(r["下午_休息分鐘"]),
-                "空窗分鐘": int(r["下午_空窗分鐘_扣休"]),
-                "空窗時段": r["下午_空窗時段"],
-                "效率_件每小時": float(r["下午_效率_件每小時"]),
-                "命中規則": str(r["下午_命中規則"]),
-            })
-    detail_long = pd.DataFrame(long_rows)
-    if not detail_long.empty:
-        detail_long = detail_long.sort_values([user_col, "日期", "時段", "第一筆時間"])
-
-    xlsx_bytes = build_excel_bytes(user_col, summary_out, daily, detail_long)
+    profiler.finish("上架產能分析")
 
     # 存 session（KPI/圖表/匯出都從這裡讀，匯出不會清空）
     st.session_state[RESULT_KEY] = {
-        "user_col": user_col,
-        "summary": summary,
-        "summary_out": summary_out,
-        "daily": daily,
-        "detail_long": detail_long,
-        "xlsx_bytes": xlsx_bytes,
-        "kpi": {
-            "total_people": total_people,
-            "total_met": total_met,
-            "total_rate": total_rate,
-            "pm_total": pm_total,
-            "pm_met": pm_met,
-            "pm_rate": pm_rate,
-        },
+        "engine": res,
+        "store": store,  # 增量模式留存時扣除已計入彙總的貢獻
         "meta": {
             "operator": operator or None,
             "top_n": int(top_n),
-            "source_filename": uploaded_name,
-            "source_sha256": sha256_bytes(uploaded_bytes),
+            "source_filename": " + ".join(name for name, _ in files),
+            "source_sha256": sha256_bytes(b"".join(content for _, content in files)),
+            "export_base": files[0][0].rsplit(".", 1)[0] + (f"_等{len(files)}檔" if len(files) > 1 else ""),
+            "ingest": ingest,
+            "incremental": None if store is None else {
+                "dataset": store.dataset,
+                "dates": [f"{d:%Y-%m-%d}" for d in store.dates()],
+                "affected_dates": [f"{d:%Y-%m-%d}" for d in affected],
+            },
         },
     }
 
@@ -495,17 +98,16 @@ def try_audit_persist():
     if not result:
         return
 
-    meta = result["meta"]
-    # 用 (來源hash + top_n + operator) 當簽章避免重複寫入
-    sig = f"{meta['source_sha256']}|top_n={meta['top_n']}|op={meta.get('operator')}"
+    res, meta = result["engine"], result["meta"]
+    # 用 (來源hash + top_n + operator + 排除關鍵字) 當簽章避免重複寫入
+    sig = f"{meta['source_sha256']}|top_n={meta['top_n']}|op={meta.get('operator')}|exclude={list(res.params.exclude_keywords)}"
     if st.session_state.get(AUDIT_SIG_KEY) == sig:
         return  # 已寫過
 
-    xlsx_bytes = result["xlsx_bytes"]
-    kpi = result["kpi"]
+    kpi = res.kpi
 
     export_path = upload_export_bytes(
-        content=xlsx_bytes,
+        content=res.xlsx_bytes,
         object_path=f"putaway_runs/{dt.datetime.now():%Y%m%d}/{uuid.uuid4().hex}_putaway.xlsx",
     )
     payload = {
@@ -515,18 +117,24 @@ def try_audit_persist():
         "source_sha256": meta["source_sha256"],
         "params": {
             "top_n": meta["top_n"],
-            "target_eff": TARGET_EFF,
-            "filter": "由=QC 且 到不含關鍵字",
-            "am_range": "07:00-12:30",
-            "pm_range": "13:30-23:59:59",
-            "idle_min_threshold": IDLE_MIN_THRESHOLD,
-            "idle_exclude_ranges": [(a.strftime("%H:%M"), b.strftime("%H:%M")) for a, b in EXCLUDE_IDLE_RANGES],
+            **res.params.audit(),
+            "incremental": meta.get("incremental"),
+            "ingest": meta.get("ingest"),
+            "metrics": res.metrics.records(),
         },
         "kpi_am": {"people": int(kpi["total_people"]), "pass_rate": float(kpi["total_rate"])},
         "kpi_pm": {"people": int(kpi["pm_total"]), "pass_rate": float(kpi["pm_rate"])},
         "export_object_path": export_path,
     }
-    row = insert_audit_run(payload)
+    rollup_kw = dict(app_name="上架產能分析（Putaway KPI）", target_eff=res.params.target_eff, user_col=res.user_col,
+                     name_col="對應姓名", minutes_col="工時_分鐘", eff_col="效率_件每小時")
+    inc, store = meta.get("incremental"), result.get("store")
+    if inc is None or store is None:
+        row = insert_audit_run({**payload, "rollup_contrib": build_rollup_contrib(res.detail_long, **rollup_kw)})
+    else:
+        # 增量模式：重算日期可能先前已計入（重傳 / 補日），只計入與已計入值的差額
+        row = insert_incremental_audit_run(payload, contrib_by_date(res.detail_long, inc["affected_dates"], **rollup_kw),
+                                           store)
     st.session_state[AUDIT_SIG_KEY] = sig
     return row
 
@@ -545,32 +153,61 @@ def main():
         top_n = st.number_input("效率排行顯示人數（Top N）", 10, 100, 30, step=5)
         st.caption("上傳 .xls 需 requirements.txt 加：xlrd==2.0.1")
 
+        preview = st.toggle("⚡ 預覽模式（先顯示概估 KPI）", value=True,
+                            help="只讀人員 / 時間 / 由 / 到 欄位，先算筆數與首末筆工時；完整計算完成後自動取代")
+
+        exclude = exclude_keywords(st.text_input(
+            "『到』排除關鍵字（逗號分隔）", value=",".join(TO_EXCLUDE_KEYWORDS),
+            help="儲位含任一關鍵字（不分大小寫）的上架紀錄不列入計算",
+        ))
+
+        st.markdown("#### 📅 增量模式（逐日累加）")
+        params = ShelfParams(exclude_keywords=exclude)
+        incremental = st.toggle("只上傳新一天的檔案，累加到資料集", value=False)
+        dataset = st.text_input("資料集名稱", value=f"{dt.date.today():%Y-%m}", disabled=not incremental)
+        store = PartialStore("putaway", dataset, params.store_params()) if incremental else None
+        if incremental:
+            st.caption(f"已累計 {len(store.dates())} 天")
+            if st.button("🗑️ 清空此資料集", use_container_width=True):
+                store.clear()
+                st.rerun()
+
         if st.button("🧹 清除本頁結果", use_container_width=True):
             st.session_state.pop(RESULT_KEY, None)
             st.session_state.pop(AUDIT_SIG_KEY, None)
             st.rerun()
 
+        profiler = profiler_controls("putaway")
+
     # 上傳區
     card_open("📤 上傳作業原始資料（上架）")
     uploaded = st.file_uploader(
-        "上傳 Excel / CSV",
+        "上傳 Excel / CSV（可多選，重疊區間自動去重）",
         type=["xlsx", "xlsm", "xls", "csv"],
+        accept_multiple_files=True,
         label_visibility="collapsed",
     )
-    run = st.button("🚀 產出 KPI", type="primary", disabled=uploaded is None)
+    run = st.button("🚀 產出 KPI", type="primary", disabled=not uploaded)
     card_close()
 
     # 按下才計算；沒按也不 return（讓上次 KPI 保留）
     if run:
         try:
-            with st.spinner("計算中，請稍候..."):
-                compute_and_store(
-                    uploaded_name=uploaded.name,
-                    uploaded_bytes=uploaded.getvalue(),
-                    operator=operator,
-                    top_n=int(top_n),
-                )
+            # 等候時由 run_in_pool 顯示排隊序位 / 階段進度條與「取消」按鈕
+            compute_and_store(
+                files=[(f.name, f.getvalue()) for f in uploaded],
+                operator=operator,
+                top_n=int(top_n),
+                store=store,
+                preview=preview,
+                params=params,
+                profiler=profiler,
+            )
             st.success("✅ 已完成 KPI 計算")
+        except PoolBusy as e:
+            st.warning(f"⏳ {e}")  # 不 return：上次 KPI 照常顯示
+        except JobCancelled:
+            st.info("已取消本次計算。")
         except Exception as e:
             st.error("❌ 計算失敗")
             st.code(repr(e))
@@ -582,11 +219,20 @@ def main():
         st.info("請先上傳檔案並按『產出 KPI』。")
         return
 
-    user_col = result["user_col"]
-    summary = result["summary"]
-    xlsx_bytes = result["xlsx_bytes"]
-    kpi = result["kpi"]
-    meta = result["meta"]
+    res, meta = result["engine"], result["meta"]
+    user_col, summary, kpi = res.user_col, res.summary, res.kpi
+    target_eff = res.params.target_eff
+
+    ingest = meta.get("ingest") or {}
+    if ingest.get("files", 1) > 1:
+        st.info(f"📚 合併 {ingest['files']} 個檔案｜讀入 {ingest['rows_in']:,} 列｜跨檔重複 {ingest['duplicates']:,} 筆已剔除")
+
+    inc = meta.get("incremental")
+    if inc:
+        st.info(
+            f"📅 資料集「{inc['dataset']}」累計 {len(inc['dates'])} 天"
+            f"（{inc['dates'][0]} ~ {inc['dates'][-1]}）｜本次重算：{'、'.join(inc['affected_dates']) or '無'}"
+        )
 
     # 左右 AM/PM
     col_l, col_r = st.columns(2)
@@ -597,7 +243,7 @@ def main():
             KPI("總人數", f"{kpi['total_people']:,}"),
             KPI("達標人數（整體效率）", f"{kpi['total_met']:,}"),
             KPI("達標率（整體效率）", f"{kpi['total_rate']:.1%}"),
-            KPI("達標門檻", f"效率 ≥ {TARGET_EFF}"),
+            KPI("達標門檻", f"效率 ≥ {target_eff:g}"),
         ])
         card_close()
 
@@ -610,7 +256,7 @@ def main():
             x_col="姓名", y_col="效率",
             hover_cols=["筆數", "工時"],
             top_n=int(meta["top_n"]),
-            target=float(TARGET_EFF),
+            target=target_eff,
         )
         card_close()
 
@@ -620,7 +266,7 @@ def main():
             KPI("總人數", f"{kpi['pm_total']:,}"),
             KPI("達標人數（下午效率）", f"{kpi['pm_met']:,}"),
             KPI("達標率（下午效率）", f"{kpi['pm_rate']:.1%}"),
-            KPI("達標門檻", f"效率 ≥ {TARGET_EFF}"),
+            KPI("達標門檻", f"效率 ≥ {target_eff:g}"),
         ])
         card_close()
 
@@ -633,22 +279,24 @@ def main():
             x_col="姓名", y_col="效率",
             hover_cols=["筆數", "工時"],
             top_n=int(meta["top_n"]),
-            target=float(TARGET_EFF),
+            target=target_eff,
         )
         card_close()
 
     # ✅ 匯出：一行=按鈕；按下去 KPI 仍保留
     card_open("⬇️ 匯出 KPI 報表（Excel）")
-    default_name = f"{meta['source_filename'].rsplit('.', 1)[0]}_上架績效.xlsx"
+    default_name = f"{meta.get('export_base') or meta['source_filename'].rsplit('.', 1)[0]}_上架績效.xlsx"
     st.download_button(
-        label="⬇️ 匯出 Excel（彙總/明細/時段/規則）",
-        data=xlsx_bytes,
+        label="⬇️ 匯出 Excel（彙總/明細/時段/區塊/規則）",
+        data=res.xlsx_bytes,
         file_name=default_name,
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         use_container_width=True,
     )
     card_close()
 
+    perf_panel(res.metrics.records())
+
     # 留存（Supabase）
     st.divider()
     st.subheader("🧾 稽核留存狀態（Supabase）")
@@ -656,6 +304,8 @@ def main():
         row = try_audit_persist()
         if row:
             st.success(f"✅ 已留存本次分析（ID：{row.get('id','')}）")
+            if row.get("rollup_error"):
+                st.warning(f"⚠️ 月/週彙總更新失敗（可至人員對比頁重建）：{row['rollup_error']}")
         else:
             st.info("本次結果已留存（未重複寫入）。")
     except Exception as e:
@@ -1,10 +1,10 @@
 import streamlit as st
 import pandas as pd
-import datetime as dt
 from supabase import create_client
 from postgrest.exceptions import APIError
 
-from common_ui import inject_logistics_theme, set_page, card_open, card_close
+from common_ui import inject_logistics_theme, set_page, card_open, card_close, current_delete_password
+from audit_store import delete_audit_runs
 
 
 # ========= Supabase =========
@@ -25,30 +25,11 @@ def _human_api_error(e: Exception) -> str:
     return str(e)
 
 
-def current_delete_password():
-    """
-    依月份取得刪除密碼
-    Key 格式：DELETE_PASSWORD_YYYYMM
-    """
-    ym = dt.datetime.now().strftime("%Y%m")
-    key = f"DELETE_PASSWORD_{ym}"
-    return key, st.secrets.get(key)
-
-
 def download_from_storage(object_path: str) -> bytes:
     bucket = st.secrets.get("SUPABASE_BUCKET", "work-efficiency-exports")
     return sb().storage.from_(bucket).download(object_path)
 
 
-def remove_from_storage(object_path: str):
-    bucket = st.secrets.get("SUPABASE_BUCKET", "work-efficiency-exports")
-    sb().storage.from_(bucket).remove([object_path])
-
-
-def delete_audit_run(run_id: str):
-    sb().schema("public").table("audit_runs").delete().eq("id", run_id).execute()
-
-
 def _rate_light(x):
     if x is None:
         return ("—", "⚪")
@@ -63,6 +44,30 @@ def _rate_light(x):
     return (f"{x:.0%}", "🔴")
 
 
+def _run_bulk_delete(run_ids: list):
+    try:
+        res = delete_audit_runs(run_ids)
+    except APIError as e:
+        st.error("❌ 刪除失敗（APIError）")
+        st.code(_human_api_error(e))
+        return
+    except Exception as e:
+        st.error("❌ 刪除失敗")
+        st.code(repr(e))
+        return
+
+    if res["deleted"]:
+        st.success(f"✅ 已刪除 {len(res['deleted']):,} 筆（Storage 移除 {len(res['storage_removed']):,} 個檔案；已套用當月密碼）")
+    if res["storage_missing"]:
+        st.info(f"Storage 中已不存在 {len(res['storage_missing']):,} 個檔案（略過）")
+    if res["failed"]:
+        st.error(f"❌ {len(res['failed']):,} 筆未刪除")
+        st.code("\n".join(res["failed"]))
+    for msg in res["errors"]:
+        st.code(msg)
+    st.info("請重新整理頁面以更新清單")
+
+
 # ========= Page =========
 def main():
     inject_logistics_theme()
@@ -174,18 +179,32 @@ def main():
         unlocked = confirm and pwd == expected_pwd
 
         if st.button("🗑️ 刪除紀錄", disabled=not unlocked, type="primary", use_container_width=True):
-            try:
-                if obj_path:
-                    remove_from_storage(obj_path)
-                delete_audit_run(run_id)
-                st.success("✅ 刪除完成（已套用當月密碼）")
-                st.info("請重新整理頁面以更新清單")
-            except APIError as e:
-                st.error("❌ 刪除失敗（APIError）")
-                st.code(_human_api_error(e))
-            except Exception as e:
-                st.error("❌ 刪除失敗")
-                st.code(repr(e))
+            _run_bulk_delete([run_id])
+
+    card_close()
+
+    # ===== 批次刪除 =====
+    card_open("🧹 批次刪除（多選）")
+
+    months = sorted(df["created_at"].dt.strftime("%Y-%m").dropna().unique().tolist(), reverse=True)
+    month = st.selectbox("依分析月份篩選", ["全部"] + months)
+    pool = df if month == "全部" else df[df["created_at"].dt.strftime("%Y-%m") == month]
+    select_all = st.checkbox(f"全選（{len(pool):,} 筆）")
+
+    picked = st.multiselect(
+        "選擇要刪除的紀錄（可多選）",
+        options=pool.index.tolist(),
+        default=pool.index.tolist() if select_all else [],
+        format_func=lambda i: f"{df.loc[i,'created_at']}｜{df.loc[i,'app_name']}｜{df.loc[i,'source_filename']}",
+    )
+
+    st.warning(f"⚠️ 將刪除 {len(picked):,} 筆紀錄（DB + Storage，不可逆）")
+    bulk_confirm = st.checkbox("我已確認要刪除以上所選紀錄")
+    bulk_pwd = st.text_input("輸入本月刪除密碼", type="password", key="bulk_delete_pwd")
+    bulk_unlocked = bool(picked) and bulk_confirm and bulk_pwd == expected_pwd
+
+    if st.button("🗑️ 批次刪除", disabled=not bulk_unlocked, type="primary", use_container_width=True):
+        _run_bulk_delete(df.loc[picked, "id"].tolist())
 
     card_close()
 
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量模式：逐日累加的 per-(人員, 日期) 部分彙總存放區
+- 每個「資料集」一個目錄，每個日期一個分區檔（事件 + 該日各人員的部分彙總表）
+- 新檔只帶來新一天（或少數幾天）的事件：同一 (人員, 日期) 以新檔為準覆蓋，
+  只重算受影響的日期分區，其餘日期直接沿用已存的部分彙總
+- 彙總（summary / full_df …）一律由所有分區的部分彙總重建
+- 已計入月 / 週彙總（kpi_rollups）的各日期貢獻另外記錄（credit_rollup），
+  重算過的日期再次留存時只計入差額；此紀錄依資料集名稱保存，清空資料集 / 改排除規則都不會清掉
+  （kpi_rollups 裡已計入的值也還在）
+
+存放位置：環境變數 WORK_EFF_STATE_DIR（預設 ~/.work_efficiency），其下
+    partials/<模組>/<資料集>__<參數簽章>/   各日期分區
+    partials/<模組>/<資料集>.rollup.json    已計入彙總的各日期貢獻
+跨 process 的互斥用檔案鎖（fcntl.flock；沒有 fcntl 的平台不加鎖）
+"""
+from __future__ import annotations
+
+import contextlib
+import datetime as dt
+import hashlib
+import json
+import os
+import re
+import shutil
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows：單機批次使用，不加鎖
+    fcntl = None
+
+DATE_COL = "日期"
+
+
+def state_dir() -> str:
+    return os.environ.get("WORK_EFF_STATE_DIR") or os.path.join(os.path.expanduser("~"), ".work_efficiency")
+
+
+def params_signature(params) -> str:
+    """影響部分彙總的參數（排除規則、空窗門檻…）→ 短簽章；參數不同即為不同資料集。"""
+    raw = json.dumps(params, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def _worker_key(s: pd.Series) -> pd.Series:
+    return s.map(str, na_action="ignore").astype(object)
+
+
+@contextlib.contextmanager
+def _locked(lock_file: str) -> Iterator[None]:
+    """跨 process / session 的互斥（持有期間其他人在此等候）"""
+    with open(lock_file, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class PartialStore:
+    def __init__(self, module: str, dataset: str, params=None, root: Optional[str] = None):
+        slug = re.sub(r"[^\w\-]+", "_", str(dataset).strip()) or "default"
+        self.module = module
+        self.dataset = dataset
+        base = os.path.join(root or os.path.join(state_dir(), "partials"), module)
+        self.path = os.path.join(base, f"{slug}__{params_signature(params)}")
+        self.rollup_file = os.path.join(base, f"{slug}.rollup.json")
+        os.makedirs(self.path, exist_ok=True)
+        self._pending: Dict[dt.date, Dict[str, pd.DataFrame]] = {}  # ingest 中尚未寫出的分區
+
+    def _lock(self):
+        return _locked(os.path.join(self.path, ".lock"))
+
+    # ---------- 分區 I/O（ingest 進行中先看尚未寫出的分區） ----------
+    def _file(self, d: dt.date) -> str:
+        return os.path.join(self.path, f"{d:%Y-%m-%d}.pkl")
+
+    def dates(self) -> List[dt.date]:
+        out = set(self._pending)
+        for fn in os.listdir(self.path):
+            m = re.fullmatch(r"(\d{4}-\d{2}-\d{2})\.pkl", fn)
+            if m:
+                out.add(dt.date.fromisoformat(m.group(1)))
+        return sorted(out)
+
+    def load(self, d: dt.date) -> Dict[str, pd.DataFrame]:
+        if d in self._pending:
+            return self._pending[d]
+        f = self._file(d)
+        return pd.read_pickle(f) if os.path.exists(f) else {}
+
+    def save(self, d: dt.date, frames: Dict[str, pd.DataFrame]):
+        tmp = self._file(d) + ".tmp"
+        pd.to_pickle(frames, tmp)
+        os.replace(tmp, self._file(d))
+
+    def load_all(self, key: str) -> pd.DataFrame:
+        parts = [self.load(d).get(key) for d in self.dates()]
+        parts = [p for p in parts if p is not None and not p.empty]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+    def clear(self):
+        with self._lock():  # 留著鎖檔，等候中的 ingest 仍鎖同一個檔
+            for fn in os.listdir(self.path):
+                if fn != ".lock":
+                    p = os.path.join(self.path, fn)
+                    if os.path.isdir(p):
+                        shutil.rmtree(p)
+                    else:
+                        os.remove(p)
+
+    # ---------- 相鄰分區查詢（跨日前一筆 / 後一個出勤日） ----------
+    def prev_events(self, d: dt.date, keys: pd.DataFrame, key_cols: List[str]) -> pd.DataFrame:
+        """各 key 在 d 之前最後出現的那個日期分區的事件（由近往遠找，找齊即停）。"""
+        need = set(map(tuple, keys[key_cols].drop_duplicates().itertuples(index=False)))
+        found = []
+        for pd_ in reversed([x for x in self.dates() if x < d]):
+            if not need:
+                break
+            ev = self.load(pd_).get("events")
+            if ev is None or ev.empty:
+                continue
+            k = pd.Series(list(zip(*(ev[c] for c in key_cols))), index=ev.index)
+            hit = k.isin(need)
+            if hit.any():
+                found.append(ev[hit])
+                need -= set(k[hit])
+        return pd.concat(found, ignore_index=True) if found else pd.DataFrame()
+
+    def next_dates(self, d: dt.date, keys: pd.DataFrame, key_cols: List[str]) -> List[dt.date]:
+        """各 key 在 d 之後第一個出現的日期分區。"""
+        need = set(map(tuple, keys[key_cols].drop_duplicates().itertuples(index=False)))
+        out = []
+        for nd in [x for x in self.dates() if x > d]:
+            if not need:
+                break
+            ev = self.load(nd).get("events")
+            if ev is None or ev.empty:
+                continue
+            k = set(map(tuple, ev[key_cols].drop_duplicates().itertuples(index=False)))
+            if need & k:
+                out.append(nd)
+                need -= k
+        return out
+
+    # ---------- 增量寫入 ----------
+    def ingest(
+        self,
+        events: pd.DataFrame,
+        *,
+        worker_col: str,
+        compute: Callable[[dt.date, pd.DataFrame], Dict[str, pd.DataFrame]],
+        cascade_cols: Optional[List[str]] = None,
+    ) -> List[dt.date]:
+        """
+        events 需含「日期」欄與 worker_col。
+        - 同一 (worker, 日期) 以新檔事件為準，覆蓋已存事件；其他人員的事件保留
+        - compute(日期, 該日全部事件) → 該日部分彙總表（dict，需含 "events" 以外的表）
+        - cascade_cols 有給時，計算結果會受「前一出勤日」影響（例：跨日空窗），
+          會一併重算這些 key 的下一個出勤日
+        回傳重算過的日期（遞增）。
+        合併後的事件與各日期的部分彙總全部先在記憶體算好，compute 全部成功才逐一寫出（每個分區一次寫入）；
+        compute 失敗 / 取消時磁碟上的分區不變。整段持資料集鎖，兩個 session 同時累加同一資料集時依序進行
+        """
+        if events is None or events.empty:
+            return []
+        # 人員一律以字串比對 / 存放（舊分區可能存成數字代碼）
+        events = events.assign(**{worker_col: _worker_key(events[worker_col])})
+        with self._lock():
+            try:
+                affected: Dict[dt.date, None] = {}
+                for d, new_ev in events.groupby(DATE_COL, sort=True):
+                    old = self.load(d).get("events")
+                    if old is not None and not old.empty:
+                        old = old.assign(**{worker_col: _worker_key(old[worker_col])})
+                        keep = old[~old[worker_col].isin(set(new_ev[worker_col]))]
+                        merged = pd.concat([keep, new_ev], ignore_index=True)
+                    else:
+                        merged = new_ev.reset_index(drop=True)
+                    self._pending[d] = {"events": merged}
+                    affected[d] = None
+                    if cascade_cols:
+                        for nd in self.next_dates(d, new_ev, cascade_cols):
+                            affected[nd] = None
+
+                # 依日期遞增計算：compute 查前一出勤日時看得到本次已合併（尚未寫出）的事件
+                for d in sorted(affected):
+                    ev = self.load(d)["events"]
+                    self._pending[d] = {"events": ev, **compute(d, ev)}
+                for d in sorted(affected):
+                    self.save(d, self._pending[d])
+            finally:
+                self._pending = {}
+        return sorted(affected)
+
+    # ---------- 已計入月 / 週彙總的貢獻 ----------
+    def credit_rollup(self, new_by_date: Dict[str, List[dict]], apply: Callable[[Dict[str, List[dict]]], Any]):
+        """
+        new_by_date：本次各日期（"YYYY-MM-DD"）的貢獻列。
+        apply(先前已計入的同日期貢獻) 負責把差額寫進彙總；成功後才把 new_by_date 記為已計入，回傳 apply 的結果。
+        整段持鎖：兩個 session 同時留存同一資料集時，不會各自拿同一份舊值算差額
+        """
+        with _locked(self.rollup_file + ".lock"):
+            credited: Dict[str, List[dict]] = {}
+            if os.path.exists(self.rollup_file):
+                with open(self.rollup_file, encoding="utf-8") as f:
+                    credited = json.load(f)
+            out = apply({d: credited.get(d, []) for d in new_by_date})
+            credited.update(new_by_date)
+            tmp = self.rollup_file + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(credited, f, ensure_ascii=False)
+            os.replace(tmp, self.rollup_file)
+        return out
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+單次計算的 profiler（頁面管理員工具：某位主管的檔案特別慢時，抓那一次的 profile）
+- 兩種模式：
+    sample   取樣：背景 thread 每 5 ms 記一次呼叫堆疊（依實際間隔加權），額外負擔小
+    cprofile 完整：cProfile 逐函式計時（數字精確，但計算本身會變慢）
+- 兩種模式都整理成 pstats 格式（取樣模式由堆疊換算），可再合併（Stats.add 的規則）
+- 輸出：.pstats（python -m pstats / snakeviz 可開）與單檔火焰圖 HTML（不需外部 JS）
+- 沒啟用時頁面不 import 本模組、不包裝任何函式，計算沒有額外負擔
+
+用法（可直接交給計算池，progress 等參數原樣轉給 fn）：
+    result, report = profile_call(run_qc_efficiency, b, name, rules, profile_mode="sample")
+    report.pstats_bytes() / report.html("標題")
+"""
+from __future__ import annotations
+
+import cProfile
+import html as _html
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+MODES = {"sample": "取樣（低負擔）", "cprofile": "完整 cProfile（較慢、數字精確）"}
+SAMPLE_INTERVAL = 0.005  # 秒
+
+FuncKey = Tuple[str, int, str]  # pstats 的函式鍵：(檔名, 行號, 函式名)
+
+
+# ===== 取樣 =====
+class Sampler:
+    """背景 thread 定時抓指定 thread 的堆疊；samples[堆疊(由外到內)] = 秒數"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, root_code=None):
+        self.interval = interval
+        self.samples: Dict[Tuple[FuncKey, ...], float] = defaultdict(float)
+        self._root_code = root_code  # 堆疊只留這個 code 以下的 frame
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _stack(self) -> Optional[Tuple[FuncKey, ...]]:
+        frame = sys._current_frames().get(self._target)
+        stack: List[FuncKey] = []
+        while frame is not None:
+            code = frame.f_code
+            if code is self._root_code:
+                break
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        return tuple(reversed(stack)) or None
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            stack = self._stack()
+            if stack is not None:
+                # 持有 GIL 的長時間 C 呼叫會延後取樣，以實際間隔加權才不會低估
+                self.samples[stack] += now - last
+            last = now
+
+
+def samples_to_stats(samples: Dict[Tuple[FuncKey, ...], float]) -> dict:
+    """取樣堆疊 → pstats 的 stats dict {func: (cc, nc, tt, ct, {caller: (nc, cc, tt, ct)})}；次數為取樣數"""
+    acc: Dict[FuncKey, list] = {}
+    callers: Dict[FuncKey, Dict[FuncKey, list]] = defaultdict(dict)
+    for stack, w in samples.items():
+        seen = set()
+        for i, f in enumerate(stack):
+            leaf = i == len(stack) - 1
+            a = acc.setdefault(f, [0, 0, 0.0, 0.0])
+            if leaf:
+                a[2] += w
+            if f not in seen:  # 遞迴時累計時間只算一次
+                seen.add(f)
+                a[0] += 1; a[1] += 1; a[3] += w
+            if i > 0:
+                e = callers[f].setdefault(stack[i - 1], [0, 0, 0.0, 0.0])
+                e[0] += 1; e[1] += 1; e[3] += w
+                if leaf:
+                    e[2] += w
+    return {f: (a[0], a[1], a[2], a[3], {c: tuple(v) for c, v in callers[f].items()}) for f, a in acc.items()}
+
+
+# ===== 結果 =====
+@dataclass
+class ProfileReport:
+    mode: str
+    wall_s: float
+    stats: dict = field(repr=False)  # pstats 格式
+
+    def merge(self, other: "ProfileReport") -> "ProfileReport":
+        """兩段 profile 合併（例如頁面 2：計算池內讀檔 / 每人每日 + 頁面內彙總 / 匯出）"""
+        ps = self._pstats()
+        ps.add(other._pstats())
+        return ProfileReport(self.mode, self.wall_s + other.wall_s, ps.stats)
+
+    def _pstats(self) -> pstats.Stats:
+        ps = pstats.Stats()
+        ps.stats = dict(self.stats)
+        ps.get_top_level_stats()
+        return ps
+
+    def pstats_bytes(self) -> bytes:
+        """同 Stats.dump_stats 的檔案內容"""
+        return marshal.dumps(self.stats)
+
+    def top(self, n: int = 30) -> pd.DataFrame:
+        """自身時間最多的函式"""
+        rows = [{"函式": f"{fn}（{_short(file)}:{line}）", "自身_秒": round(tt, 3), "累計_秒": round(ct, 3), "次數": nc}
+                for (file, line, fn), (cc, nc, tt, ct, _) in self.stats.items()]
+        out = pd.DataFrame(rows, columns=["函式", "自身_秒", "累計_秒", "次數"])
+        return out.sort_values("自身_秒", ascending=False, ignore_index=True).head(n)
+
+    def html(self, title: str = "profile") -> str:
+        return flame_html(self.stats, title=f"{title}｜{MODES.get(self.mode, self.mode)}｜{self.wall_s:.2f} 秒")
+
+
+def profile_call(fn: Callable, *args, profile_mode: str = "sample", **kwargs) -> Tuple[Any, ProfileReport]:
+    """在 profiler 下執行 fn(*args, **kwargs) → (fn 的結果, ProfileReport)"""
+    if profile_mode not in MODES:
+        raise Exception(f"不支援的 profiler 模式：{profile_mode}")
+    t0 = time.perf_counter()
+    if profile_mode == "cprofile":
+        prof = cProfile.Profile()
+        result = prof.runcall(fn, *args, **kwargs)
+        stats = pstats.Stats(prof).stats
+    else:
+        with Sampler(root_code=profile_call.__code__) as sampler:
+            result = fn(*args, **kwargs)
+        stats = samples_to_stats(sampler.samples)
+    return result, ProfileReport(profile_mode, time.perf_counter() - t0, stats)
+
+
+# ===== 火焰圖 =====
+def _short(path: str) -> str:
+    parts = path.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+def _color(name: str) -> str:
+    h = sum(ord(c) * 31 ** i for i, c in enumerate(name[:12])) % 60
+    return f"hsl({10 + h}, 80%, 62%)"
+
+
+def call_tree(stats: dict, min_frac: float = 0.002, max_depth: int = 60) -> List[dict]:
+    """
+    pstats → 呼叫樹（由外到內）。某函式在不同呼叫者下的子呼叫時間依「該呼叫者給它的時間 / 它的總累計時間」
+    比例分配（snakeviz 的做法）；小於總時間 min_frac 的節點不畫
+    """
+    callees: Dict[FuncKey, Dict[FuncKey, float]] = defaultdict(dict)
+    for g, (_, _, _, _, callers) in stats.items():
+        for f, v in callers.items():
+            callees[f][g] = v[3] if isinstance(v, tuple) else 0.0
+    roots = [(f, s[3]) for f, s in stats.items() if not s[4]]
+    total = sum(t for _, t in roots) or 1.0
+
+    def build(f: FuncKey, t: float, path: frozenset, depth: int) -> dict:
+        node = {"func": f, "time": t, "children": []}
+        ct = stats[f][3]
+        if depth >= max_depth or ct <= 0:
+            return node
+        scale = min(t / ct, 1.0)
+        for g, gt in sorted(callees.get(f, {}).items(), key=lambda x: -x[1]):
+            share = gt * scale
+            if g in path or share < total * min_frac:
+                continue
+            node["children"].append(build(g, share, path | {g}, depth + 1))
+        return node
+
+    return [build(f, t, frozenset([f]), 0) for f, t in sorted(roots, key=lambda x: -x[1]) if t >= total * min_frac]
+
+
+def flame_html(stats: dict, title: str = "profile", row_px: int = 18) -> str:
+    """單檔 HTML 火焰圖（icicle：最外層在上）＋自身時間排行；滑鼠停留看函式、檔案與秒數"""
+    roots = call_tree(stats)
+    total = sum(r["time"] for r in roots) or 1.0
+    boxes: List[str] = []
+    depth_max = [0]
+
+    def emit(node: dict, x: float, depth: int):
+        file, line, fn = node["func"]
+        w = node["time"] / total
+        depth_max[0] = max(depth_max[0], depth)
+        tip = _html.escape(f"{fn}  {_short(file)}:{line}\n{node['time']:.3f} 秒（{w:.1%}）")
+        boxes.append(f'<div class="f" style="left:{x * 100:.4f}%;width:{w * 100:.4f}%;top:{depth * row_px}px;'
+                     f'background:{_color(fn)}" title="{tip}">{_html.escape(fn)}</div>')
+        cx = x
+        for c in node["children"]:
+            emit(c, cx, depth + 1)
+            cx += c["time"] / total
+
+    x = 0.0
+    for r in roots:
+        emit(r, x, 0)
+        x += r["time"] / total
+
+    report = ProfileReport("", 0.0, stats).top(40)
+    top_rows = "".join(f"<tr><td>{_html.escape(r.函式)}</td><td>{r.自身_秒:.3f}</td><td>{r.累計_秒:.3f}</td>"
+                       f"<td>{r.次數}</td></tr>" for r in report.itertuples(index=False))
+    height = (depth_max[0] + 1) * row_px
+    return f"""<!DOCTYPE html>
+<html lang="zh-Hant"><head><meta charset="utf-8"><title>{_html.escape(title)}</title>
+<style>
+body {{ font-family: sans-serif; margin: 16px; }}
+#flame {{ position: relative; height: {height}px; border: 1px solid #ddd; }}
+.f {{ position: absolute; height: {row_px - 1}px; font-size: 11px; line-height: {row_px - 1}px; overflow: hidden;
+      white-space: nowrap; box-sizing: border-box; border-right: 1px solid #fff; padding-left: 2px; cursor: default; }}
+table {{ border-collapse: collapse; margin-top: 16px; font-size: 12px; }}
+td, th {{ border: 1px solid #ddd; padding: 2px 6px; text-align: right; }}
+td:first-child {{ text-align: left; }}
+</style></head><body>
+<h3>{_html.escape(title)}</h3>
+<div id="flame">{''.join(boxes)}</div>
+<table><tr><th>函式（自身時間排行）</th><th>自身_秒</th><th>累計_秒</th><th>次數</th></tr>{top_rows}</table>
+</body></html>
+"""
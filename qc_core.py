@@ -21,16 +21,37 @@ import pandas as pd
 import tempfile
 import io
 from datetime import datetime, time
+import functools
 from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
 from openpyxl.formatting.rule import FormulaRule
 from openpyxl.utils import get_column_letter
 
+from batch_ingest import ITEM_CANDIDATES, load_many
+from sheet_reader import (as_category, as_code, read_columns, read_csv_any, read_excel_sheets, read_projected,
+                          relevant_sheets, rename_columns, sheet_headers, sniff_format,
+                          day_numbers, day_to_date, days_to_dates, user_keys)
+from roster import name_for, names
+from run_metrics import RunMetrics, count_rows
+from upload_cache import cached_read, lookup
+
 # ===== 可調參數 =====
 THRESHOLD_MIN = 10  # 空窗門檻（分鐘）
 USER_COLS = ["記錄輸入人","建立人員","建立者","輸入人","建立者姓名","操作人員","建立人"]
 TIME_COLS = ["修訂日期","更新日期","異動日期","修改日期","最後更新時間","時間戳記","Timestamp"]
 DEST_COL = "到"; DEST_VALUE_QC = "QC"
 
+# 固定排除的人員（比對姓名欄，不計前後空白）：全量 / 增量、串流過濾、預覽都經 name_not_excluded_mask
+EXCLUDED_NAME = "羅仲宇"
+
+# 需要完整解析的分頁：表頭要有人員欄與時間欄
+QC_SHEET_KEYS = {"user": USER_COLS, "time": TIME_COLS}
+
+# 多檔合併時判定「同一筆掃描事件」的關鍵欄位
+QC_EVENT_KEYS = {"user": USER_COLS, "time": TIME_COLS, "from": ["由"], "to": [DEST_COL], "item": ITEM_CANDIDATES}
+
+# 計算實際用到的欄位（其餘來源欄位預設不讀）
+QC_READ_COLS = {**QC_EVENT_KEYS, "name": ["姓名"]}
+
 # AM/PM 切段
 AM_START = time(9, 0)
 AM_END   = time(12, 30)
@@ -40,18 +61,10 @@ PM_START = time(13, 30)
 LUNCH_START = time(12, 30)
 LUNCH_END   = time(13, 30)
 
-# === 記錄輸入人 → 姓名 對照（可自行擴充） ===
-ID_TO_NAME = {
-    "09440": "張予軒","10137": "徐嘉蔆","10818": "葉青芳","11797": "賴泉和",
-    "20201109001": "吳振凱","10003": "李茂銓","10471": "余興炫","10275": "羅仲宇",
-    "9440": "張予軒",
-}
+# === 記錄輸入人 → 姓名 對照：外部名冊檔 roster.json 的 "qc" 分組（見 roster.py） ===
+ROSTER_GROUP = "qc"
 def map_name_from_id(x: str) -> str:
-    if x is None: return ""
-    s = str(x).strip()
-    if not s: return ""
-    if s in ID_TO_NAME: return ID_TO_NAME[s]
-    return ID_TO_NAME.get(s.lstrip("0"), "")
+    return name_for(x, ROSTER_GROUP)
 
 # ---------- 小工具 ----------
 def pick_col(cols, candidates):
@@ -79,18 +92,15 @@ def to_dt(series: pd.Series) -> pd.Series:
         return pd.NaT
     return series.apply(parse_one)
 
+def read_excel_relevant(path: str) -> dict:
+    """先只讀表頭，只完整解析有人員＋時間欄的分頁（樞紐 / 彙總分頁直接略過）；後端見 sheet_reader"""
+    return read_excel_sheets(path, sheets=relevant_sheets(sheet_headers(path), QC_SHEET_KEYS))
+
 def read_any(path: str) -> dict:
-    ext = os.path.splitext(path)[1].lower()
-    if ext in [".xlsx",".xlsm",".xltx",".xltm"]:
-        return pd.read_excel(path, sheet_name=None, engine="openpyxl")
-    if ext == ".xls":   # 老 .xls 需 xlrd，可能會有 OLE2 警告，不影響輸出 .xlsx
-        return pd.read_excel(path, sheet_name=None)
-    if ext in [".csv",".txt"]:
-        return {"CSV": pd.read_csv(path, encoding="utf-8", low_memory=False)}
-    try:
-        return pd.read_excel(path, sheet_name=None, engine="openpyxl")
-    except Exception:
-        return {"CSV": pd.read_csv(path, encoding="utf-8", low_memory=False)}
+    # 格式看檔頭判斷（副檔名取錯也只解析一次）；CSV 編碼自動判斷
+    if sniff_format(path) == ".csv":
+        return {"CSV": read_csv_any(path, low_memory=False)}
+    return read_excel_relevant(path)
 
 # ---------- 計算「排除時間區間」的分鐘數（用在總分鐘） ----------
 def calc_exclude_minutes_for_range(date_obj, user_id, first_ts, last_ts, skip_rules):
@@ -153,16 +163,14 @@ def annotate_idle(qc_df: pd.DataFrame, user_col: str, time_col: str, skip_rules=
         同樣扣掉排除時間後，若 > THRESHOLD_MIN 才記；
         → 不會把「13:30 → 當天第一筆下午任務」視為空窗。
     """
-    merged = qc_df.copy()
+    merged = qc_df.copy(deep=False)  # 淺複製：只新增 / 覆寫空窗欄，其餘欄與 qc_df 共用（Copy-on-Write）
     for col in ["空窗分鐘","空窗旗標","空窗區間","午後空窗分鐘","午後空窗旗標","午後空窗區間"]:
         if col not in merged.columns: merged[col] = pd.NA
 
-    tmp = merged[[user_col, time_col]].copy()
-    tmp["_user"] = tmp[user_col].astype(str).str.strip()
-    tmp["_dt"] = to_dt(tmp[time_col])
-    tmp = tmp.loc[tmp["_dt"].notna()].copy()
+    tmp = pd.DataFrame({"_user": user_keys(merged[user_col]), "_dt": to_dt(merged[time_col])})
+    tmp = tmp.loc[tmp["_dt"].notna()]
     tmp.sort_values(by=["_user","_dt"], inplace=True)
-    tmp["_prev_dt"] = tmp.groupby("_user")["_dt"].shift(1)
+    tmp["_prev_dt"] = tmp.groupby("_user", observed=True)["_dt"].shift(1)
 
     idle_minutes, idle_flag, idle_text = [], [], []
     pm_minutes, pm_flag, pm_text = [], [], []
@@ -302,16 +310,29 @@ def build_efficiency_table_full(qc_with_idle: pd.DataFrame, user_col: str, time_
     if skip_rules is None:
         skip_rules = []
 
-    df = qc_with_idle.copy()
-    df["_user"] = df[user_col].astype(str).str.strip()
-    df["_name"] = df["_user"].apply(map_name_from_id)
-    df["_dt"]   = to_dt(df[time_col])
-    df = df.loc[df["_dt"].notna()].copy()
-    df["_date"] = df["_dt"].dt.date
+    # groupby 鍵用精簡型別（人員 category、日期 int32 日序號），每組一列的結果再轉回顯示型別
+    df = calc_frame(qc_with_idle, user_col, time_col)
+    df["_date"] = day_numbers(df["_dt"])
+    keys = ["_date","_user"]
+
+    out = (df.groupby(keys, observed=True)["_dt"]
+             .agg(筆數="size", 第一筆修訂日期="min", 最後一筆修訂日期="max").reset_index())
+
+    gap_flag = df["空窗旗標"] if "空窗旗標" in df.columns else 0
+    idle_count = (df.assign(旗=gap_flag)
+                    .groupby(keys, observed=True)["旗"].sum().reset_index().rename(columns={"旗":"空窗筆數"}))
+    gap_minutes = (df.groupby(keys, observed=True)["空窗分鐘"].sum()
+                    .reset_index().rename(columns={"空窗分鐘":"空窗總分鐘"}))
+    gap_text = (df.groupby(keys, observed=True)["空窗區間"]
+                  .apply(lambda s: "、".join([x for x in s if isinstance(x,str) and x.strip()]))
+                  .reset_index().rename(columns={"空窗區間":"空窗明細"}))
 
-    agg_size = df.groupby(["_date","_user","_name"]).size().reset_index(name="筆數")
-    times = df.groupby(["_date","_user","_name"])["_dt"].agg(第一筆修訂日期="min", 最後一筆修訂日期="max").reset_index()
-    out = agg_size.merge(times, on=["_date","_user","_name"], how="left")
+    out = (out.merge(idle_count, on=keys, how="left")
+              .merge(gap_minutes, on=keys, how="left")
+              .merge(gap_text, on=keys, how="left"))
+    out["_date"] = days_to_dates(out["_date"])
+    out["_user"] = out["_user"].astype(str)
+    out.insert(2, "_name", names(out["_user"], ROSTER_GROUP))
 
     # 休息分鐘
     out["休息分鐘"] = out.apply(
@@ -339,19 +360,6 @@ def build_efficiency_table_full(qc_with_idle: pd.DataFrame, user_col: str, time_
     out["總工時"] = out["總分鐘"] / 60
     out["效率"]   = out["筆數"] / out["總工時"]
 
-    gap_flag = df["空窗旗標"] if "空窗旗標" in df.columns else 0
-    idle_count = (df.assign(旗=gap_flag)
-                    .groupby(["_date","_user"])["旗"].sum().reset_index().rename(columns={"旗":"空窗筆數"}))
-    gap_minutes = (df.groupby(["_date","_user"])["空窗分鐘"].sum()
-                    .reset_index().rename(columns={"空窗分鐘":"空窗總分鐘"}))
-    gap_text = (df.groupby(["_date","_user"])["空窗區間"]
-                  .apply(lambda s: "、".join([x for x in s if isinstance(x,str) and x.strip()]))
-                  .reset_index().rename(columns={"空窗區間":"空窗明細"}))
-
-    out = (out.merge(idle_count, on=["_date","_user"], how="left")
-              .merge(gap_minutes, on=["_date","_user"], how="left")
-              .merge(gap_text, on=["_date","_user"], how="left"))
-
     out.rename(columns={"_date":"日期","_user":"記錄輸入人","_name":"姓名"}, inplace=True)
     out["空窗筆數"]   = out["空窗筆數"].fillna(0).astype(int)
     out["空窗總分鐘"] = out["空窗總分鐘"].fillna(0).astype(int)
@@ -374,18 +382,17 @@ def build_efficiency_table_ampm(qc_with_idle: pd.DataFrame, user_col: str, time_
     if skip_rules is None:
         skip_rules = []
 
-    df = qc_with_idle.copy()
-    df["_user"] = df[user_col].astype(str).str.strip()
-    df["_name"] = df["_user"].apply(map_name_from_id)
-    df["_dt"]   = to_dt(df[time_col])
-    df = df.loc[df["_dt"].notna()].copy()
-    df["_date"] = df["_dt"].dt.date
+    df = calc_frame(qc_with_idle, user_col, time_col)
+    df["_date"] = day_numbers(df["_dt"])
     df.sort_values(by=["_user","_dt"], inplace=True)
 
+    users = df["_user"].cat.categories
+    name_of = dict(zip(users, names(pd.Series(users), ROSTER_GROUP)))  # 每個代碼只查一次名冊
     out_rows = []
-    for (d, u, n), g in df.groupby(["_date","_user","_name"]):
-        g_am = g.loc[g["_dt"].apply(_within_am)].copy()
-        g_pm = g.loc[g["_dt"].apply(_within_pm)].copy()
+    for (d, u), g in df.groupby(["_date","_user"], observed=True):
+        d, n = day_to_date(d), name_of[u]
+        g_am = g.loc[g["_dt"].apply(_within_am)]
+        g_pm = g.loc[g["_dt"].apply(_within_pm)]
 
         def make_row(sub: pd.DataFrame, label: str):
             if sub.empty: return
@@ -511,41 +518,28 @@ def write_grouped_ampm_sheet(wb, ampm_df: pd.DataFrame, sheet_name="AMPM_日期
             r += 1  # 區塊間空一行
         r += 1      # 每日間空一行
 
-# ===================== Streamlit/Cloud 可呼叫入口 =====================
-def run_qc_efficiency(file_bytes: bytes, original_name: str, skip_rules: list[dict] | None = None) -> dict:
-    """
-    Streamlit / API 入口：上傳檔(bytes) → 回傳統計表 + 已格式化的 Excel(bytes)
+# ===================== 共用步驟（全量 / 增量模式共用） =====================
+IDLE_COLS = ["空窗分鐘","空窗旗標","空窗區間","午後空窗分鐘","午後空窗旗標","午後空窗區間"]
+IDLE_DETAIL_COLS = ["來源分頁","日期","記錄輸入人","姓名","起","迄","空窗分鐘","空窗區間"]
 
-    Parameters
-    ----------
-    file_bytes : bytes
-        上傳檔案內容（Excel/CSV）
-    original_name : str
-        原始檔名（用來判斷副檔名）
-    skip_rules : list[dict] | None
-        排除規則（可多筆）：
-        [
-          {"user": "20201109001" 或 ""(空字串=全員), "t_start": datetime.time, "t_end": datetime.time},
-          ...
-        ]
-
-    Returns
-    -------
-    dict:
-      {
-        "full_df": DataFrame,   # 記錄輸入人統計（全日）
-        "ampm_df": DataFrame,   # 記錄輸入人統計（AM/PM）
-        "idle_df": DataFrame,   # 空窗明細
-        "xlsx_bytes": bytes,    # 含條件著色+AMPM日期分組的輸出 Excel
-        "total_idle": int,      # 全體空窗筆數
-      }
+def calc_frame(qc_with_idle: pd.DataFrame, user_col: str, time_col: str) -> pd.DataFrame:
     """
-    if skip_rules is None:
-        skip_rules = []
+    統計 / 空窗明細用的精簡表：只取空窗欄，加上 _user（category）、_dt，去掉時間無法解析的列。
+    不複製來源分頁的其他欄位（附來源分頁的報表欄位很多，整張 copy 是記憶體峰值的主因）
+    """
+    df = qc_with_idle[[c for c in IDLE_COLS if c in qc_with_idle.columns]]
+    df = df.assign(_user=user_keys(qc_with_idle[user_col]), _dt=to_dt(qc_with_idle[time_col]))
+    return df.loc[df["_dt"].notna()]
+
+def table_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """合併各分頁算全日 / AMPM 表時只需要的欄：人員、時間（pick_col 可能選到的欄）與空窗欄"""
+    keys = USER_COLS + TIME_COLS
+    return df[[c for c in df.columns if c in IDLE_COLS or any(k in str(c).strip() for k in keys)]]
 
-    # 基本清理：確保 user 是字串、時間是 time
+def clean_skip_rules(skip_rules) -> list[dict]:
+    """基本清理：確保 user 是字串、時間是 time"""
     cleaned = []
-    for r in skip_rules:
+    for r in skip_rules or []:
         if not isinstance(r, dict):
             continue
         user = str(r.get("user", "")).strip()
@@ -561,188 +555,178 @@ def run_qc_efficiency(file_bytes: bytes, original_name: str, skip_rules: list[di
         if t_end < t_start:
             continue
         cleaned.append({"user": user, "t_start": t_start, "t_end": t_end})
-    skip_rules = cleaned
+    return cleaned
 
-    suffix = os.path.splitext(original_name)[1].lower()
-    if suffix not in [".xlsx", ".xlsm", ".xls", ".csv", ".txt", ".xltx", ".xltm"]:
-        suffix = ".xlsx"
+def name_not_excluded_mask(names: pd.Series) -> pd.Series:
+    """姓名欄 → 保留的列為 True（去掉固定排除的 EXCLUDED_NAME）"""
+    return names.fillna("").astype(str).str.strip().ne(EXCLUDED_NAME)
 
-    processed = {}
-    idle_details_all = []
+def qc_row_mask(df: pd.DataFrame) -> pd.Series:
+    """
+    串流讀大型 CSV 時每塊先套用的過濾：只能先去掉固定排除的姓名（EXCLUDED_NAME）。
+    到≠QC 的列仍要留著（全日 / AMPM 效率以全部紀錄計算，只有空窗偵測限 QC）
+    """
+    if "姓名" not in df.columns:
+        return pd.Series(True, index=df.index)
+    return name_not_excluded_mask(df["姓名"])
 
+def read_upload(file_bytes: bytes, original_name: str, include_source: bool = False) -> dict:
+    """
+    上傳檔 bytes → {分頁: DataFrame}
+    - 預設只讀計算用欄位（QC_READ_COLS）並套型別：人員代碼字串、時間 datetime、由/到 category；
+      大型 CSV 分塊串流（見 sheet_reader.read_csv_streaming）
+    - include_source=True：讀完整來源欄位（報表要附來源分頁時才需要）
+    - 解析結果依檔案內容 sha256 快取在磁碟（見 upload_cache），同一檔再分析時不再解析
+    """
+    return cached_read("qc_src" if include_source else "qc", file_bytes, original_name,
+                       functools.partial(_parse_upload, include_source=include_source))
+
+def _parse_upload(file_bytes: bytes, original_name: str, include_source: bool = False) -> dict:
+    if not include_source:
+        return read_projected(file_bytes, original_name, QC_READ_COLS, required=("user", "time"),
+                              dtypes={"user": as_code, "time": fast_to_dt, "from": as_category, "to": as_category},
+                              row_mask=qc_row_mask)
+    suffix = os.path.splitext(original_name)[1].lower()
+    if suffix not in [".xlsx", ".xlsm", ".xls", ".xlsb", ".csv", ".txt", ".xltx", ".xltm"]:
+        suffix = ".xlsx"
     with tempfile.TemporaryDirectory() as td:
         in_path = os.path.join(td, f"upload{suffix}")
         with open(in_path, "wb") as f:
             f.write(file_bytes)
+        return read_any(in_path)
 
-        sheets = read_any(in_path)
-
-        # 2) 每張表處理：找 QC，算空窗，補姓名（保留你原本邏輯）
-        for name, df in sheets.items():
-            if df is None or df.empty:
-                processed[name] = df
-                continue
-            # ===== 固定排除：姓名=羅仲宇（所有統計/圖表/匯出一致） =====
-            if df is not None and not df.empty and '姓名' in df.columns:
-                s = df['姓名'].fillna('').astype(str).str.strip()
-                df = df[s.ne('羅仲宇')].copy()
-
-
-            df = df.copy()
-            dest_col = pick_col(df.columns, [DEST_COL])
-            if dest_col and DEST_VALUE_QC in df[dest_col].astype(str).unique().tolist():
-                qc = df.loc[df[dest_col].astype(str) == DEST_VALUE_QC].copy()
+def prepare_qc_sheet(df: pd.DataFrame, skip_rules: list[dict]):
+    """
+    單一分頁前處理 → (df, qc, ucol, tcol)
+    - 固定排除 姓名=EXCLUDED_NAME
+    - 找 到=QC 的列（沒有就整張）
+    - 排除「多筆人員＋時間區間」的紀錄（不參與任何統計）
+    """
+    # ===== 固定排除：姓名=EXCLUDED_NAME（所有統計/圖表/匯出一致） =====
+    if df is not None and not df.empty and '姓名' in df.columns:
+        df = df[name_not_excluded_mask(df['姓名'])]
+
+    # 過濾結果都是新 DataFrame（pandas Copy-on-Write），不必再整張 copy；之後只加欄不改原欄
+    dest_col = pick_col(df.columns, [DEST_COL])
+    if dest_col and DEST_VALUE_QC in df[dest_col].astype(str).unique().tolist():
+        qc = df.loc[df[dest_col].astype(str) == DEST_VALUE_QC]
+    else:
+        qc = df
+
+    ucol = pick_col(qc.columns, USER_COLS)
+    tcol = pick_col(qc.columns, TIME_COLS)
+
+    # ====== 先排除「多筆人員＋時間區間」的紀錄（不參與任何統計） ======
+    if ucol and tcol and skip_rules:
+        dt_series = to_dt(qc[tcol])
+        t_series = dt_series.dt.time
+
+        mask_all = pd.Series(False, index=qc.index)
+        for rule in skip_rules:
+            t_start = rule["t_start"]
+            t_end = rule["t_end"]
+            user_rule = str(rule["user"]).strip()
+
+            def _time_in_range(t, ts=t_start, te=t_end):
+                return isinstance(t, time) and (t >= ts) and (t <= te)
+
+            mask_time = t_series.apply(_time_in_range)
+            if user_rule:
+                mask_user = qc[ucol].astype(str).str.strip() == user_rule
             else:
-                qc = df.copy()
-
-            ucol = pick_col(qc.columns, USER_COLS)
-            tcol = pick_col(qc.columns, TIME_COLS)
-
-            # ====== 先排除「多筆人員＋時間區間」的紀錄（不參與任何統計） ======
-            if ucol and tcol and skip_rules:
-                dt_series = to_dt(qc[tcol])
-                t_series = dt_series.dt.time
-
-                mask_all = pd.Series(False, index=qc.index)
-                for rule in skip_rules:
-                    t_start = rule["t_start"]
-                    t_end = rule["t_end"]
-                    user_rule = str(rule["user"]).strip()
-
-                    def _time_in_range(t, ts=t_start, te=t_end):
-                        return isinstance(t, time) and (t >= ts) and (t <= te)
-
-                    mask_time = t_series.apply(_time_in_range)
-                    if user_rule:
-                        mask_user = qc[ucol].astype(str).str.strip() == user_rule
-                    else:
-                        mask_user = pd.Series(True, index=qc.index)
-
-                    mask_all = mask_all | (mask_time & mask_user)
-
-                exclude_idx = qc.index[mask_all]
-                if len(exclude_idx) > 0:
-                    qc = qc.drop(exclude_idx)
-                    df = df.drop(exclude_idx, errors="ignore")
-
-            # ====== 欄位不齊就補空窗欄/姓名後直接輸出 ======
-            if not ucol or not tcol:
-                for col in ["空窗分鐘", "空窗旗標", "空窗區間", "午後空窗分鐘", "午後空窗旗標", "午後空窗區間"]:
-                    if col not in df.columns:
-                        df[col] = pd.NA
-                user_guess = pick_col(df.columns, USER_COLS)
-                if user_guess and "姓名" not in df.columns:
-                    df["姓名"] = df[user_guess].astype(str).apply(map_name_from_id)
-                processed[name] = df
-                continue
+                mask_user = pd.Series(True, index=qc.index)
 
-            # 空窗計算會再扣掉：午休 + 「排除區間」時間（你的 annotate_idle 已支援）
-            qc_with_idle = annotate_idle(qc, ucol, tcol, skip_rules=skip_rules)
-
-            df_out = df.copy()
-            df_out.loc[qc_with_idle.index, ["空窗分鐘","空窗旗標","空窗區間",
-                                            "午後空窗分鐘","午後空窗旗標","午後空窗區間"]] = \
-               qc_with_idle[["空窗分鐘","空窗旗標","空窗區間",
-                             "午後空窗分鐘","午後空窗旗標","午後空窗區間"]].values
+            mask_all = mask_all | (mask_time & mask_user)
 
-            if "姓名" not in df_out.columns:
-                df_out["姓名"] = ""
-            try:
-                df_out.loc[:, "姓名"] = df_out[ucol].astype(str).apply(map_name_from_id)
-            except Exception:
-                pass
-            processed[name] = df_out
+        exclude_idx = qc.index[mask_all]
+        if len(exclude_idx) > 0:
+            qc = qc.drop(exclude_idx)
+            df = df.drop(exclude_idx, errors="ignore")
 
-            # 空窗明細分頁資料（上午：空窗旗標；下午：午後空窗旗標）
-            if not qc_with_idle.empty:
-                tmp = qc_with_idle.copy()
-                tmp["_user"] = tmp[ucol].astype(str).str.strip()
-                tmp["_name"] = tmp["_user"].apply(map_name_from_id)
-                tmp["_dt"]   = to_dt(tmp[tcol])
-                tmp = tmp.loc[tmp["_dt"].notna()].copy()
-                tmp.sort_values(by=["_user","_dt"], inplace=True)
-                tmp["日期"] = tmp["_dt"].dt.date
-                tmp["起"] = tmp["_dt"].shift(1).dt.strftime("%H:%M")
-                tmp["迄"] = tmp["_dt"].dt.strftime("%H:%M")
-                tmp["來源分頁"] = name
-                tmp["記錄輸入人"] = tmp["_user"]; tmp["姓名"] = tmp["_name"]
-
-                tmp_am = tmp.loc[tmp["空窗旗標"]==1, ["來源分頁","日期","記錄輸入人","姓名","起","迄","空窗分鐘","空窗區間"]]
-                tmp_pm = tmp.loc[tmp["午後空窗旗標"]==1, ["來源分頁","日期","記錄輸入人","姓名","起","迄"]].assign(
-                    空窗分鐘=tmp.loc[tmp["午後空窗旗標"]==1,"午後空窗分鐘"].values,
-                    空窗區間=tmp.loc[tmp["午後空窗旗標"]==1,"午後空窗區間"].values
-                )
-                tmp2 = pd.concat([tmp_am, tmp_pm], ignore_index=True)
-                if not tmp2.empty:
-                    idle_details_all.append(tmp2)
+    return df, qc, ucol, tcol
 
-        # 3) 彙整全日/AMPM 表
-        full_df = pd.DataFrame()
-        ampm_df = pd.DataFrame()
-        if processed:
-            big = pd.concat(processed.values(), ignore_index=True)
-            ucol_all = pick_col(big.columns, USER_COLS)
-            tcol_all = pick_col(big.columns, TIME_COLS)
-            if ucol_all and tcol_all:
-                full_df = build_efficiency_table_full(big, ucol_all, tcol_all, skip_rules=skip_rules)
-                ampm_df = build_efficiency_table_ampm(big, ucol_all, tcol_all, skip_rules=skip_rules)
+def idle_detail_rows(qc_with_idle: pd.DataFrame, ucol: str, tcol: str, sheet_name: str) -> pd.DataFrame:
+    """空窗明細分頁資料（上午：空窗旗標；下午：午後空窗旗標）"""
+    tmp = calc_frame(qc_with_idle, ucol, tcol)
+    tmp.sort_values(by=["_user","_dt"], inplace=True)
+    tmp["_prev"] = tmp["_dt"].shift(1)
+    # 顯示欄只對有空窗的列轉換
+    tmp = tmp.loc[(tmp["空窗旗標"]==1) | (tmp["午後空窗旗標"]==1)]
+    tmp["日期"] = tmp["_dt"].dt.date
+    tmp["起"] = tmp["_prev"].dt.strftime("%H:%M")
+    tmp["迄"] = tmp["_dt"].dt.strftime("%H:%M")
+    tmp["來源分頁"] = sheet_name
+    tmp["記錄輸入人"] = tmp["_user"].astype(str); tmp["姓名"] = names(tmp["記錄輸入人"], ROSTER_GROUP)
+
+    tmp_am = tmp.loc[tmp["空窗旗標"]==1, ["來源分頁","日期","記錄輸入人","姓名","起","迄","空窗分鐘","空窗區間"]]
+    tmp_pm = tmp.loc[tmp["午後空窗旗標"]==1, ["來源分頁","日期","記錄輸入人","姓名","起","迄"]].assign(
+        空窗分鐘=tmp.loc[tmp["午後空窗旗標"]==1,"午後空窗分鐘"].values,
+        空窗區間=tmp.loc[tmp["午後空窗旗標"]==1,"午後空窗區間"].values
+    )
+    return pd.concat([tmp_am, tmp_pm], ignore_index=True)
 
-        # 空窗明細彙整 + 排序
-        if idle_details_all:
-            idle_details = pd.concat(idle_details_all, ignore_index=True)
-            final_cols = ["來源分頁","日期","記錄輸入人","姓名","起","迄","空窗分鐘","空窗區間"]
-            for c in final_cols:
-                if c not in idle_details.columns:
-                    idle_details[c] = "" if c in ["來源分頁","記錄輸入人","姓名","起","迄","空窗區間"] else 0
-            idle_details = idle_details[final_cols].copy()
-            idle_details.sort_values(by=["日期","記錄輸入人","起","迄"], inplace=True, ignore_index=True)
-        else:
-            idle_details = pd.DataFrame(columns=["來源分頁","日期","記錄輸入人","姓名","起","迄","空窗分鐘","空窗區間"])
+def collect_idle_details(idle_details_all: list) -> pd.DataFrame:
+    """空窗明細彙整 + 排序"""
+    if idle_details_all:
+        idle_details = pd.concat(idle_details_all, ignore_index=True)
+        for c in IDLE_DETAIL_COLS:
+            if c not in idle_details.columns:
+                idle_details[c] = "" if c in ["來源分頁","記錄輸入人","姓名","起","迄","空窗區間"] else 0
+        idle_details = idle_details[IDLE_DETAIL_COLS]
+        idle_details.sort_values(by=["日期","記錄輸入人","起","迄"], inplace=True, ignore_index=True)
+    else:
+        idle_details = pd.DataFrame(columns=IDLE_DETAIL_COLS)
+    return idle_details
 
-        # ===== 一致過濾：只保留「同時有 記錄輸入人 + 姓名」的資料（KPI/圖表/匯出 Excel 全部一致）=====
+def finalize_qc_tables(full_df: pd.DataFrame, ampm_df: pd.DataFrame, idle_details: pd.DataFrame):
+    """一致過濾 + 固定排除 → (full_df, ampm_df, idle_details, total_idle, total_df)"""
+    # ===== 一致過濾：只保留「同時有 記錄輸入人 + 姓名」的資料（KPI/圖表/匯出 Excel 全部一致）=====
 
-        def _nonempty_series(s: pd.Series) -> pd.Series:
+    def _nonempty_series(s: pd.Series) -> pd.Series:
 
-            return s.fillna("").astype(str).str.strip().ne("")
+        return s.fillna("").astype(str).str.strip().ne("")
 
 
-        def _filter_user_and_name(df: pd.DataFrame) -> pd.DataFrame:
+    def _filter_user_and_name(df: pd.DataFrame) -> pd.DataFrame:
 
-            if df is None or df.empty:
+        if df is None or df.empty:
 
-                return df
+            return df
 
-            if "記錄輸入人" in df.columns and "姓名" in df.columns:
+        if "記錄輸入人" in df.columns and "姓名" in df.columns:
 
-                return df[_nonempty_series(df["記錄輸入人"]) & _nonempty_series(df["姓名"])].copy()
+            return df[_nonempty_series(df["記錄輸入人"]) & _nonempty_series(df["姓名"])]
 
-            return df
+        return df
 
 
-        full_df = _filter_user_and_name(full_df)
+    full_df = _filter_user_and_name(full_df)
 
-        ampm_df = _filter_user_and_name(ampm_df)
+    ampm_df = _filter_user_and_name(ampm_df)
 
-        idle_details = _filter_user_and_name(idle_details)
+    idle_details = _filter_user_and_name(idle_details)
 
-        # ===== 固定排除：姓名=羅仲宇（KPI/圖表/匯出 Excel 全部一致）=====
-        def _exclude_name(df: pd.DataFrame, name: str = '羅仲宇') -> pd.DataFrame:
-            if df is None or df.empty:
-                return df
-            if '姓名' not in df.columns:
-                return df
-            s = df['姓名'].fillna('').astype(str).str.strip()
-            return df[s.ne(name)].copy()
+    # ===== 固定排除：姓名=EXCLUDED_NAME（KPI/圖表/匯出 Excel 全部一致）=====
+    def _exclude_name(df: pd.DataFrame) -> pd.DataFrame:
+        if df is None or df.empty:
+            return df
+        if '姓名' not in df.columns:
+            return df
+        return df[name_not_excluded_mask(df['姓名'])]
 
-        full_df = _exclude_name(full_df)
-        ampm_df = _exclude_name(ampm_df)
-        idle_details = _exclude_name(idle_details)
+    full_df = _exclude_name(full_df)
+    ampm_df = _exclude_name(ampm_df)
+    idle_details = _exclude_name(idle_details)
 
 
-        total_idle = int(idle_details["空窗分鐘"].notna().sum()) if not idle_details.empty else 0
-        total_df = pd.DataFrame({"項目":[f"全體空窗筆數(>{THRESHOLD_MIN}分)"], "數量":[total_idle]})
+    total_idle = int(idle_details["空窗分鐘"].notna().sum()) if not idle_details.empty else 0
+    total_df = pd.DataFrame({"項目":[f"全體空窗筆數(>{THRESHOLD_MIN}分)"], "數量":[total_idle]})
+    return full_df, ampm_df, idle_details, total_idle, total_df
 
-        # ===== 輸出（保留條件著色 + AMPM_日期分組）=====
+def build_qc_workbook(processed: dict, full_df: pd.DataFrame, ampm_df: pd.DataFrame,
+                      idle_details: pd.DataFrame, total_df: pd.DataFrame) -> bytes:
+    """輸出（保留條件著色 + AMPM_日期分組）；processed 為各來源分頁（可為空）"""
+    with tempfile.TemporaryDirectory() as td:
         out_path = os.path.join(td, "驗收達標_含空窗_AMPM.xlsx")
 
         def set_two_decimal_format(ws, col_letter, nrows):
@@ -824,7 +808,293 @@ def run_qc_efficiency(file_bytes: bytes, original_name: str, skip_rules: list[di
         _rename_ampm_titles(out_path)
 
         with open(out_path, "rb") as f:
-            xlsx_bytes = f.read()
+            return f.read()
+
+# ===================== Streamlit/Cloud 可呼叫入口 =====================
+def run_qc_efficiency(file_bytes: bytes, original_name: str, skip_rules: list[dict] | None = None,
+                      progress=None, include_source: bool = False) -> dict:
+    """
+    Streamlit / API 入口：上傳檔(bytes) → 回傳統計表 + 已格式化的 Excel(bytes)
+
+    Parameters
+    ----------
+    file_bytes : bytes
+        上傳檔案內容（Excel/CSV）
+    original_name : str
+        原始檔名（用來判斷副檔名）
+    skip_rules : list[dict] | None
+        排除規則（可多筆）：
+        [
+          {"user": "20201109001" 或 ""(空字串=全員), "t_start": datetime.time, "t_end": datetime.time},
+          ...
+        ]
+    progress : callable | None
+        進度回報 progress(stage, pct, partial=None)（compute_pool.JobProgress；None 不回報）
+    include_source : bool
+        報表是否附各來源分頁（完整欄位 + 空窗欄）；預設否，只讀計算用欄位
+
+    Returns
+    -------
+    dict:
+      {
+        "full_df": DataFrame,   # 記錄輸入人統計（全日）
+        "ampm_df": DataFrame,   # 記錄輸入人統計（AM/PM）
+        "idle_df": DataFrame,   # 空窗明細
+        "xlsx_bytes": bytes,    # 含條件著色+AMPM日期分組的輸出 Excel
+        "total_idle": int,      # 全體空窗筆數
+        "metrics": list[dict],  # 各階段效能紀錄（見 run_metrics）
+      }
+    """
+    progress = progress or _no_progress
+    metrics = RunMetrics()
+    progress("parse", 0.0)
+    with metrics.stage("parse") as s:
+        sheets = read_upload(file_bytes, original_name, include_source=include_source)
+        s.rows_out = count_rows(sheets)
+    return run_qc_from_sheets(sheets, skip_rules, progress=progress, include_source=include_source, metrics=metrics)
+
+def run_qc_efficiency_files(files: list[tuple[str, bytes]], skip_rules: list[dict] | None = None,
+                            max_workers: int | None = None, progress=None, include_source: bool = False) -> dict:
+    """
+    多檔入口：files = [(原始檔名, bytes), ...]
+    各檔平行解析 → 跨檔去重（人員、時間、由/到、品號）→ 同名分頁合併 → 一次計算。
+    回傳鍵同 run_qc_efficiency，另含 ingest（檔數 / 讀入列數 / 去重筆數）。
+    """
+    progress = progress or _no_progress
+    metrics = RunMetrics()
+    progress("parse", 0.0)
+    reader = functools.partial(read_upload, include_source=include_source)
+    with metrics.stage("parse") as s:
+        sheets, stats = load_many(files, reader, QC_EVENT_KEYS, max_workers=max_workers)
+        s.rows_in, s.rows_out = stats.get("rows_in"), count_rows(sheets)
+    out = run_qc_from_sheets(sheets, skip_rules, progress=progress, include_source=include_source, metrics=metrics)
+    out["ingest"] = stats
+    return out
+
+def _no_progress(stage: str, pct: float, partial: dict | None = None):
+    pass
+
+def run_qc_from_sheets(sheets: dict, skip_rules: list[dict] | None = None, progress=None,
+                       include_source: bool = False, metrics: RunMetrics | None = None) -> dict:
+    """
+    已讀入的 {分頁: DataFrame} → 統計表 + Excel（回傳鍵同 run_qc_efficiency）
+    progress：各階段回報進度；彙總完成、產 Excel 前先送出部分結果（ampm_df / full_df / total_idle）
+    include_source：Excel 是否附各來源分頁（含空窗欄）
+    metrics：各階段效能紀錄累加到這裡（None 則新建）；結果的 "metrics" 為其 records()
+    """
+    progress = progress or _no_progress
+    metrics = metrics if metrics is not None else RunMetrics()
+    skip_rules = clean_skip_rules(skip_rules)
+
+    processed = {}
+    idle_details_all = []
+
+    # 2) 每張表處理：找 QC，算空窗，補姓名（保留你原本邏輯）
+    n_sheets = max(len(sheets), 1)
+    for i, (name, df) in enumerate(sheets.items()):
+        progress("filter", 0.30 + 0.40 * i / n_sheets)
+        if df is None or df.empty:
+            processed[name] = df
+            continue
+        with metrics.stage("filter", len(df)) as s:
+            df, qc, ucol, tcol = prepare_qc_sheet(df, skip_rules)
+            s.rows_out = len(qc)
+        progress("idle", 0.30 + 0.40 * (i + 0.3) / n_sheets)
+
+        # ====== 欄位不齊就補空窗欄/姓名後直接輸出 ======
+        if not ucol or not tcol:
+            df = df.assign(**{col: pd.NA for col in IDLE_COLS if col not in df.columns})
+            user_guess = pick_col(df.columns, USER_COLS)
+            if user_guess and "姓名" not in df.columns:
+                df["姓名"] = names(df[user_guess].astype(str), ROSTER_GROUP)
+            processed[name] = df
+            continue
+
+        with metrics.stage("idle", len(qc)) as s:
+            # 空窗計算會再扣掉：午休 + 「排除區間」時間（你的 annotate_idle 已支援）
+            qc_with_idle = annotate_idle(qc, ucol, tcol, skip_rules=skip_rules)
+
+            df_out = df.copy(deep=False)  # 淺複製後只加空窗 / 姓名欄，不複製來源欄位
+            df_out.loc[qc_with_idle.index, IDLE_COLS] = qc_with_idle[IDLE_COLS].values
+
+            if "姓名" not in df_out.columns:
+                df_out["姓名"] = ""
+            try:
+                df_out.loc[:, "姓名"] = names(df_out[ucol].astype(str), ROSTER_GROUP)
+            except Exception:
+                pass
+            # 不附來源分頁時只留算統計表用的欄，其餘欄位可以先釋放
+            processed[name] = df_out if include_source else table_frame(df_out)
+
+            s.rows_out = 0
+            if not qc_with_idle.empty:
+                tmp2 = idle_detail_rows(qc_with_idle, ucol, tcol, name)
+                s.rows_out = len(tmp2)
+                if not tmp2.empty:
+                    idle_details_all.append(tmp2)
+
+    # 3) 彙整全日/AMPM 表
+    progress("aggregate", 0.70)
+    with metrics.stage("aggregate") as s:
+        full_df = pd.DataFrame()
+        ampm_df = pd.DataFrame()
+        if processed:
+            big = pd.concat([d if d is None else table_frame(d) for d in processed.values()], ignore_index=True)
+            s.rows_in = len(big)
+            ucol_all = pick_col(big.columns, USER_COLS)
+            tcol_all = pick_col(big.columns, TIME_COLS)
+            if ucol_all and tcol_all:
+                full_df = build_efficiency_table_full(big, ucol_all, tcol_all, skip_rules=skip_rules)
+                ampm_df = build_efficiency_table_ampm(big, ucol_all, tcol_all, skip_rules=skip_rules)
+
+        idle_details = collect_idle_details(idle_details_all)
+        full_df, ampm_df, idle_details, total_idle, total_df = finalize_qc_tables(full_df, ampm_df, idle_details)
+        s.rows_out = len(full_df) + len(ampm_df) + len(idle_details)
+
+    # KPI 先行：Excel 產出前先送出統計表，頁面可先顯示
+    progress("export", 0.85, {"full_df": full_df, "ampm_df": ampm_df, "total_idle": total_idle})
+    sources = processed if include_source else {}
+    with metrics.stage("export", len(full_df) + len(ampm_df) + len(idle_details) + (count_rows(sources) or 0)):
+        xlsx_bytes = build_qc_workbook(sources, full_df, ampm_df, idle_details, total_df)
+    progress("export", 1.0)
+
+    return {
+        "full_df": full_df,
+        "ampm_df": ampm_df,
+        "idle_df": idle_details,
+        "xlsx_bytes": xlsx_bytes,
+        "total_idle": total_idle,
+        "metrics": metrics.records(),
+    }
+
+# ===================== 增量模式（每日新檔累加，不重算歷史） =====================
+def extract_qc_events(sheets: dict, skip_rules: list[dict] | None = None) -> pd.DataFrame:
+    """
+    {分頁: DataFrame} → 前處理後的事件表（來源分頁, _user, _dt, _qc, 日期），
+    排除規則與固定排除與 run_qc_efficiency 相同；_qc 標示是否參與空窗計算。
+    """
+    skip_rules = clean_skip_rules(skip_rules)
+    parts = []
+    for name, df in sheets.items():
+        if df is None or df.empty:
+            continue
+        df, qc, ucol, tcol = prepare_qc_sheet(df, skip_rules)
+        if not ucol or not tcol:
+            continue
+        ev = pd.DataFrame({
+            "來源分頁": name,
+            "_user": df[ucol].astype(str).str.strip(),
+            "_dt": to_dt(df[tcol]),
+            "_qc": df.index.isin(qc.index),
+        })
+        parts.append(ev.loc[ev["_dt"].notna()])
+    if not parts:
+        return pd.DataFrame(columns=["來源分頁", "_user", "_dt", "_qc", "日期"])
+    events = pd.concat(parts, ignore_index=True)
+    events["_dt"] = pd.to_datetime(events["_dt"])
+    events["日期"] = events["_dt"].dt.date
+    return events
+
+def compute_qc_partition(events: pd.DataFrame, context: pd.DataFrame, skip_rules: list[dict], day) -> dict:
+    """
+    單日分區的部分彙總：全日 / AMPM / 空窗明細。
+    context：各 (來源分頁, 人員) 前一個出勤日的最後一筆 QC 事件（跨日間隔與全量計算一致）。
+    """
+    ev = events.copy(deep=False)
+    for col in IDLE_COLS:
+        ev[col] = pd.NA
+    idle_parts = []
+    for sheet, ev_s in ev.groupby("來源分頁", sort=False):
+        qc = ev_s.loc[ev_s["_qc"]]
+        if qc.empty:
+            continue
+        ctx = context[context["來源分頁"] == sheet] if not context.empty else context
+        if not ctx.empty:
+            ctx = ctx.sort_values("_dt").groupby("_user", as_index=False).tail(1)
+            ctx = ctx.set_axis(range(-len(ctx), 0))
+            frame = pd.concat([ctx[qc.columns.intersection(ctx.columns)], qc])
+        else:
+            frame = qc
+        with_idle = annotate_idle(frame, "_user", "_dt", skip_rules=skip_rules)
+        own = with_idle.index[with_idle.index >= 0]
+        ev.loc[own, IDLE_COLS] = with_idle.loc[own, IDLE_COLS].values
+        rows = idle_detail_rows(with_idle, "_user", "_dt", sheet)
+        idle_parts.append(rows[rows["日期"] == day])
+
+    return {
+        "full": build_efficiency_table_full(ev, "_user", "_dt", skip_rules=skip_rules),
+        "ampm": build_efficiency_table_ampm(ev, "_user", "_dt", skip_rules=skip_rules),
+        "idle": pd.concat(idle_parts, ignore_index=True) if idle_parts else pd.DataFrame(columns=IDLE_DETAIL_COLS),
+    }
+
+def run_qc_incremental(file_bytes: bytes, original_name: str, skip_rules: list[dict] | None = None, *,
+                       store, progress=None) -> dict:
+    """
+    增量入口：只讀入新檔事件、重算受影響的 (人員, 日期) 分區，
+    再由 store 內所有分區的部分彙總重建 full_df / ampm_df / 空窗明細與 Excel。
+    store：partial_store.PartialStore（參數簽章需含 skip_rules）
+    回傳鍵同 run_qc_efficiency，另含 affected_dates / dates。
+    （累計報表不含各來源分頁原始資料）
+    """
+    progress = progress or _no_progress
+    metrics = RunMetrics()
+    progress("parse", 0.0)
+    with metrics.stage("parse") as s:
+        sheets = read_upload(file_bytes, original_name)
+        s.rows_out = count_rows(sheets)
+    return run_qc_incremental_sheets(sheets, skip_rules, store=store, progress=progress, metrics=metrics)
+
+def run_qc_incremental_files(files: list[tuple[str, bytes]], skip_rules: list[dict] | None = None, *,
+                             store, max_workers: int | None = None, progress=None) -> dict:
+    """多檔增量入口：平行解析 + 跨檔去重後再累加（另含 ingest 統計）"""
+    progress = progress or _no_progress
+    metrics = RunMetrics()
+    progress("parse", 0.0)
+    with metrics.stage("parse") as s:
+        sheets, stats = load_many(files, read_upload, QC_EVENT_KEYS, max_workers=max_workers)
+        s.rows_in, s.rows_out = stats.get("rows_in"), count_rows(sheets)
+    out = run_qc_incremental_sheets(sheets, skip_rules, store=store, progress=progress, metrics=metrics)
+    out["ingest"] = stats
+    return out
+
+def run_qc_incremental_sheets(sheets: dict, skip_rules: list[dict] | None = None, *, store, progress=None,
+                              metrics: RunMetrics | None = None) -> dict:
+    """增量入口（已讀入的分頁）"""
+    progress = progress or _no_progress
+    metrics = metrics if metrics is not None else RunMetrics()
+    skip_rules = clean_skip_rules(skip_rules)
+    progress("filter", 0.30)
+    with metrics.stage("filter", count_rows(sheets)) as s:
+        events = extract_qc_events(sheets, skip_rules)
+        s.rows_out = len(events)
+    progress("idle", 0.40)
+
+    def _compute(day, ev):
+        ctx = store.prev_events(day, ev.loc[ev["_qc"]], ["來源分頁", "_user"])
+        if not ctx.empty:
+            ctx = ctx.loc[ctx["_qc"]]
+        return compute_qc_partition(ev, ctx, skip_rules, day)
+
+    # 受影響分區的空窗 + 部分彙總都在 store.ingest 內計算
+    with metrics.stage("idle", len(events)):
+        affected = store.ingest(events, worker_col="_user", compute=_compute, cascade_cols=["來源分頁", "_user"])
+
+    progress("aggregate", 0.70)
+    with metrics.stage("aggregate") as s:
+        full_df = store.load_all("full")
+        ampm_df = store.load_all("ampm")
+        if not full_df.empty:
+            full_df = full_df.sort_values(by=["日期","記錄輸入人","第一筆修訂日期"])
+        if not ampm_df.empty:
+            ampm_df = ampm_df.sort_values(by=["日期","記錄輸入人","時段","第一筆修訂日期"])
+        idle_details = collect_idle_details([store.load_all("idle")])
+        full_df, ampm_df, idle_details, total_idle, total_df = finalize_qc_tables(full_df, ampm_df, idle_details)
+        s.rows_out = len(full_df) + len(ampm_df) + len(idle_details)
+
+    progress("export", 0.85, {"full_df": full_df, "ampm_df": ampm_df, "total_idle": total_idle})
+    with metrics.stage("export", s.rows_out):
+        xlsx_bytes = build_qc_workbook({}, full_df, ampm_df, idle_details, total_df)
+    progress("export", 1.0)
 
     return {
         "full_df": full_df,
@@ -832,4 +1102,84 @@ def run_qc_efficiency(file_bytes: bytes, original_name: str, skip_rules: list[di
         "idle_df": idle_details,
         "xlsx_bytes": xlsx_bytes,
         "total_idle": total_idle,
+        "affected_dates": affected,
+        "dates": store.dates(),
+        "metrics": metrics.records(),
     }
+
+# ===================== 快速預覽（只讀必要欄位的概估 KPI） =====================
+PREVIEW_COLS = {"user": USER_COLS, "time": TIME_COLS, "to": [DEST_COL], "name": ["姓名"]}
+
+def fast_to_dt(series: pd.Series) -> pd.Series:
+    """常見格式向量化解析，其餘再交給 to_dt 逐筆嘗試"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return pd.to_datetime(series, errors="coerce")
+    s = series.astype(str).str.strip()
+    out = pd.to_datetime(s, errors="coerce", format="%Y-%m-%d %H:%M:%S")
+    rest = out.isna() & series.notna()
+    if rest.any():
+        out.loc[rest] = pd.to_datetime(to_dt(s[rest]), errors="coerce")
+    return out
+
+def preview_qc_kpis(files: list[tuple[str, bytes]], skip_rules: list[dict] | None = None) -> pd.DataFrame:
+    """
+    快速概估：只讀 人員 / 時間 / 到 / 姓名 欄，算每人每日 AM/PM 筆數與首末筆跨度（扣休息、排除區間）。
+    不算空窗、不產 Excel；回傳欄位為 ampm_df 的子集（日期, 時段, 記錄輸入人, 姓名, 筆數, 總分鐘, 總工時, 效率）。
+    多檔時以 (人員, 時間) 粗略去重。
+    """
+    skip_rules = clean_skip_rules(skip_rules)
+    cols = ["日期", "時段", "記錄輸入人", "姓名", "筆數", "總分鐘", "總工時", "效率"]
+    parts = []
+    for name, b in files:
+        cached = lookup(("qc", "qc_src"), b)  # 已完整分析過的檔直接用快取
+        for df in (rename_columns(cached, PREVIEW_COLS) if cached is not None else read_columns(b, name, PREVIEW_COLS)):
+            if "name" in df.columns:
+                df = df[name_not_excluded_mask(df["name"])]
+            # 排除區間只套用在 到=QC 的列（同 prepare_qc_sheet；該分頁沒有 QC 列時整張適用）
+            is_qc = df["to"].astype(str) == DEST_VALUE_QC if "to" in df.columns else pd.Series(False, index=df.index)
+            parts.append(df[["user", "time"]].assign(_qc=is_qc if is_qc.any() else True))
+    if not parts:
+        return pd.DataFrame(columns=cols)
+
+    ev = pd.concat(parts, ignore_index=True)
+    ev["_user"] = user_keys(ev["user"])
+    ev["_dt"] = fast_to_dt(ev["time"])
+    ev = ev.loc[ev["_dt"].notna()].drop_duplicates(["_user", "_dt"]) if len(files) > 1 else ev.loc[ev["_dt"].notna()]
+
+    # 排除「人員＋時間區間」的紀錄
+    if skip_rules:
+        t = ev["_dt"].dt.time
+        drop = pd.Series(False, index=ev.index)
+        for rule in skip_rules:
+            m = (t >= rule["t_start"]) & (t <= rule["t_end"])
+            if rule["user"]:
+                m &= ev["_user"].eq(rule["user"])
+            drop |= m
+        ev = ev.loc[~(drop & ev["_qc"])]
+
+    t = ev["_dt"].dt.time
+    am = (t >= AM_START) & (t <= AM_END)
+    pm = t >= PM_START
+    ev = ev.assign(日期=day_numbers(ev["_dt"]), 時段=np.where(am, "上午", np.where(pm, "下午", "")))
+    ev = ev.loc[ev["時段"] != ""]
+    if ev.empty:
+        return pd.DataFrame(columns=cols)
+
+    g = ev.groupby(["日期", "_user", "時段"], observed=True)["_dt"].agg(["size", "min", "max"]).reset_index()
+    g["日期"] = days_to_dates(g["日期"])
+    g["_user"] = g["_user"].astype(str)
+    rest = np.where(g["時段"] == "上午", 15,
+                    [calc_rest_minutes_for_pm(f, l) for f, l in zip(g["min"], g["max"])])
+    excl = [calc_exclude_minutes_for_range(d, u, f, l, skip_rules)
+            for d, u, f, l in zip(g["日期"], g["_user"], g["min"], g["max"])]
+    total_min = (g["max"] - g["min"]).dt.total_seconds() / 60 - rest - np.asarray(excl, dtype=float)
+    total_hr = (total_min / 60).where(total_min > 0)
+
+    out = pd.DataFrame({
+        "日期": g["日期"], "時段": g["時段"], "記錄輸入人": g["_user"],
+        "姓名": names(g["_user"], ROSTER_GROUP), "筆數": g["size"],
+        "總分鐘": total_min.round(2), "總工時": total_hr.round(2),
+        "效率": (g["size"] / total_hr).round(2),
+    })
+    out = out[name_not_excluded_mask(out["姓名"])]  # 同 finalize_qc_tables 的固定排除
+    return out[cols].sort_values(["日期", "記錄輸入人", "時段"], ignore_index=True)
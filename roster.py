@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+人員名冊：記錄輸入人代碼 → 姓名（各模組共用的單一元件）
+- 名冊放在外部檔案（JSON 或 CSV），改檔後下一次查詢自動重新載入，不必重新部署
+- 依模組分組（qc / shelf…），同一代碼在不同模組可對應不同人
+- 載入時預先建好兩份索引：原代碼、去前導 0 的代碼；查詢順序為
+  去空白後的代碼 → 去前導 0 後比對（例如 "9440"、"009440" 都能對到 "09440"）
+- names(欄, 模組)：整欄只對不重複代碼查表一次，再以代碼位置展開（不逐列 apply）
+
+檔案格式：
+    JSON：{"qc": {"09440": "張予軒", ...}, "shelf": {...}}
+    CSV ：欄位 模組,代碼,姓名（代碼一律當字串讀，保留前導 0）
+
+設定（環境變數）：
+    WORK_EFF_ROSTER  名冊檔路徑（預設與本模組同目錄的 roster.json）
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "roster.json")
+
+
+def roster_path() -> str:
+    return os.environ.get("WORK_EFF_ROSTER") or DEFAULT_PATH
+
+
+def _read_file(path: str) -> Dict[str, Dict[str, str]]:
+    if os.path.splitext(path)[1].lower() == ".csv":
+        df = pd.read_csv(path, dtype=str, encoding="utf-8-sig").fillna("")
+        missing = [c for c in ("模組", "代碼", "姓名") if c not in df.columns]
+        if missing:
+            raise Exception(f"人員名冊缺少欄位：{'、'.join(missing)}")
+        out: Dict[str, Dict[str, str]] = {}
+        for group, code, name in zip(df["模組"].str.strip(), df["代碼"], df["姓名"]):
+            out.setdefault(group, {})[code] = name
+        return out
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {str(g): {str(k): str(v) for k, v in m.items()} for g, m in data.items()}
+
+
+class Roster:
+    """單一名冊檔的內容與查詢索引"""
+
+    def __init__(self, groups: Dict[str, Dict[str, str]]):
+        self.groups = groups
+        self._index: Dict[str, Tuple[Dict[str, str], Dict[str, str]]] = {}
+        for g, m in groups.items():
+            exact = {str(k).strip(): v for k, v in m.items()}
+            stripped: Dict[str, str] = {}
+            for k, v in exact.items():
+                stripped.setdefault(k.lstrip("0"), v)  # 檔案中先出現的優先
+            self._index[g] = (exact, stripped)
+
+    def lookup(self, code, group: str) -> str:
+        exact, stripped = self._index.get(group, ({}, {}))
+        if code is None or (isinstance(code, float) and np.isnan(code)):
+            return ""
+        s = str(code).strip()
+        if not s:
+            return ""
+        if s in exact:
+            return exact[s]
+        return stripped.get(s.lstrip("0"), "")
+
+    def names(self, codes: pd.Series, group: str) -> pd.Series:
+        """代碼欄 → 姓名欄（查不到為空字串）；只對不重複代碼查表"""
+        if isinstance(codes.dtype, pd.CategoricalDtype):
+            pos, uniq = codes.cat.codes.to_numpy(), codes.cat.categories
+        else:
+            pos, uniq = pd.factorize(codes)
+        table = np.array([self.lookup(u, group) for u in uniq] + [""], dtype=object)  # 最後一格給空值（位置 -1）
+        return pd.Series(table[pos], index=codes.index, name=codes.name, dtype="str")
+
+
+# ===== 目前名冊（檔案更新時自動重新載入） =====
+_LOCK = threading.Lock()
+_CACHE: Dict[str, object] = {"path": None, "mtime": None, "roster": None}
+
+
+def get_roster() -> Roster:
+    """目前的名冊；檔案路徑或修改時間變了就重新載入。重新載入失敗時沿用上一份（第一次載入失敗則拋出例外）"""
+    path = roster_path()
+    try:
+        mtime: Optional[float] = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    with _LOCK:
+        if _CACHE["roster"] is not None and _CACHE["path"] == path and _CACHE["mtime"] == mtime:
+            return _CACHE["roster"]
+        try:
+            roster = Roster(_read_file(path))
+        except Exception as e:
+            if _CACHE["roster"] is not None and _CACHE["path"] == path:
+                return _CACHE["roster"]
+            raise Exception(f"人員名冊讀取失敗（{path}）：{e}")
+        _CACHE.update(path=path, mtime=mtime, roster=roster)
+        return roster
+
+
+def name_for(code, group: str) -> str:
+    return get_roster().lookup(code, group)
+
+
+def names(codes: pd.Series, group: str) -> pd.Series:
+    return get_roster().names(codes, group)
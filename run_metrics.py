@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+計算效能紀錄（驗收 / 上架兩個引擎共用）
+- 每個具名階段記錄：牆鐘時間、CPU 時間（整個 process）、輸入 / 輸出列數、RSS 變化
+- 同名階段可以進出多次（例如逐分頁的 過濾 / 空窗偵測），數字會累加在同一列
+- records()：可 pickle / JSON 的 list[dict]，放在結果 dict 的 "metrics" 與稽核 payload
+- table(records)：頁面「效能」面板用的 DataFrame（階段代碼轉成中文）
+
+用法：
+    metrics = RunMetrics()
+    with metrics.stage("parse") as s:
+        sheets = read_upload(...)
+        s.rows_out = count_rows(sheets)
+
+    @metrics.timed("aggregate")       # 列數自動取第一個參數 / 回傳值
+    def build(df): ...
+"""
+from __future__ import annotations
+
+import contextlib
+import functools
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from compute_pool import STAGE_LABELS
+from mem_probe import rss_mb
+
+COLUMNS = ["階段", "牆鐘_秒", "CPU_秒", "輸入列數", "輸出列數", "記憶體變化_MB"]
+
+
+def count_rows(obj) -> Optional[int]:
+    """DataFrame → 列數；{分頁: DataFrame} / list / tuple → 各 DataFrame 列數合計；其他 → None"""
+    if isinstance(obj, pd.DataFrame):
+        return len(obj)
+    if isinstance(obj, dict):
+        obj = list(obj.values())
+    if isinstance(obj, (list, tuple)):
+        frames = [x for x in obj if isinstance(x, pd.DataFrame)]
+        return sum(len(x) for x in frames) if frames else None
+    return None
+
+
+class _Stage:
+    """with metrics.stage(...) as s：區塊內可設定 s.rows_in / s.rows_out"""
+
+    def __init__(self, rows_in: Optional[int] = None):
+        self.rows_in = rows_in
+        self.rows_out: Optional[int] = None
+
+
+def _add(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    if a is None:
+        return b
+    return a if b is None else a + b
+
+
+class RunMetrics:
+    def __init__(self, records: Optional[List[Dict[str, Any]]] = None):
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        for r in records or []:
+            self._merge(dict(r))
+
+    def _merge(self, rec: Dict[str, Any]):
+        cur = self._rows.get(rec["stage"])
+        if cur is None:
+            self._rows[rec["stage"]] = rec
+            return
+        for k in ("wall_s", "cpu_s", "rows_in", "rows_out", "mem_delta_mb"):
+            cur[k] = _add(cur.get(k), rec.get(k))
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None) -> Iterator[_Stage]:
+        s = _Stage(rows_in)
+        wall, cpu, mem = time.perf_counter(), time.process_time(), rss_mb()
+        try:
+            yield s
+        finally:
+            self._merge({
+                "stage": name,
+                "wall_s": time.perf_counter() - wall,
+                "cpu_s": time.process_time() - cpu,
+                "rows_in": s.rows_in,
+                "rows_out": s.rows_out,
+                "mem_delta_mb": rss_mb() - mem,
+            })
+
+    def timed(self, name: str):
+        """函式裝飾器：整個呼叫記為一個階段，輸入 / 輸出列數取第一個參數與回傳值"""
+        def deco(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.stage(name, count_rows(args[0]) if args else None) as s:
+                    out = fn(*args, **kwargs)
+                    s.rows_out = count_rows(out)
+                return out
+            return wrapper
+        return deco
+
+    def records(self) -> List[Dict[str, Any]]:
+        """依第一次進入的順序；秒數 / MB 取到小數 3 / 1 位"""
+        out = []
+        for r in self._rows.values():
+            out.append({**r, "wall_s": round(r["wall_s"], 3), "cpu_s": round(r["cpu_s"], 3),
+                        "mem_delta_mb": round(r["mem_delta_mb"], 1)})
+        return out
+
+    def table(self) -> pd.DataFrame:
+        return table(self.records())
+
+
+def table(records: Optional[List[Dict[str, Any]]]) -> pd.DataFrame:
+    """records → 顯示用表格（最後一列為合計）"""
+    rows = [{
+        "階段": STAGE_LABELS.get(r["stage"], r["stage"]),
+        "牆鐘_秒": r["wall_s"], "CPU_秒": r["cpu_s"],
+        "輸入列數": r.get("rows_in"), "輸出列數": r.get("rows_out"),
+        "記憶體變化_MB": r["mem_delta_mb"],
+    } for r in records or []]
+    if rows:
+        rows.append({"階段": "合計",
+                     "牆鐘_秒": round(sum(r["牆鐘_秒"] for r in rows), 3),
+                     "CPU_秒": round(sum(r["CPU_秒"] for r in rows), 3),
+                     "輸入列數": None, "輸出列數": None,
+                     "記憶體變化_MB": round(sum(r["記憶體變化_MB"] for r in rows), 1)})
+    out = pd.DataFrame(rows, columns=COLUMNS)
+    for c in ("輸入列數", "輸出列數"):
+        out[c] = out[c].astype("Int64")
+    return out
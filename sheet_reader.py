@@ -0,0 +1,648 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+讀檔層（qc_core / shelf_core / 預覽共用）
+- 格式看檔頭（magic bytes）判斷、不靠副檔名；CSV 編碼以開頭取樣判斷，整檔只解析一次
+- 讀檔後端可插拔：calamine（Rust 原生，最快）→ openpyxl 唯讀 → xlrd（.xls）→ pyxlsb（.xlsb），
+  依副檔名與已安裝套件挑選，讀取失敗自動改用下一個後端
+- CSV：先讀表頭判定欄位，再以 usecols 只解析需要的欄；大檔分塊串流，每塊先過濾再累積
+- Excel：串流逐列只取需要的欄位值（不建整張表的 DataFrame）
+read_columns：欄名改為呼叫端指定的代號（例如 user / time / to），預覽用
+read_projected：保留原欄名並套用型別提示（人員代碼字串、由/到 category、時間 datetime），引擎用
+read_excel_sheets：完整讀取指定分頁（報表要附來源分頁時）
+
+表頭探測：完整解析前先只讀每張分頁的表頭，挑出有需要欄位的分頁，
+樞紐 / 彙總分頁不進 pandas 完整解析。
+
+設定（環境變數）：
+    WORK_EFF_EXCEL_BACKEND  指定後端優先順序（逗號分隔，例如 openpyxl,calamine）；未列出的不使用
+    WORK_EFF_CSV_STREAM_MB  CSV 超過此大小（MB，預設 64）改用分塊串流讀取
+
+後端比較：python sheet_reader.py bench 檔案 [檔案 ...]
+"""
+from __future__ import annotations
+
+import argparse
+import codecs
+import datetime as dt
+import importlib.util
+import io
+import itertools
+import math
+import os
+import re
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+CSV_ENCODINGS = ("utf-8-sig", "cp950", "big5")
+CSV_EXTS = (".csv", ".txt")
+
+Source = Union[bytes, str]  # 檔案內容或路徑
+
+
+# ===== 欄名比對 =====
+def _norm(c) -> str:
+    return re.sub(r"[（）\(\)\s]", "", str(c).strip())
+
+
+def pick_column(cols: Sequence, candidates: Sequence[str]) -> Optional[str]:
+    """候選欄名 → 實際欄名：完全相同 → 去括號空白後相同 → 包含"""
+    cols = list(cols)
+    stripped = [str(c).strip() for c in cols]
+    for cand in candidates:
+        if cand in stripped:
+            return cols[stripped.index(cand)]
+    normed = [_norm(c) for c in cols]
+    for cand in candidates:
+        key = _norm(cand)
+        if key in normed:
+            return cols[normed.index(key)]
+    for cand in candidates:
+        for i, c in enumerate(stripped):
+            if cand in c:
+                return cols[i]
+    return None
+
+
+def match_columns(header: Sequence, wanted: Dict[str, List[str]]) -> Dict[str, object]:
+    """{代號: 候選欄名} → {代號: 實際欄名}（找不到的代號不列入）"""
+    out = {}
+    for key, cands in wanted.items():
+        col = pick_column(header, cands)
+        if col is not None and col not in out.values():
+            out[key] = col
+    return out
+
+
+def project_columns(header: Sequence, wanted: Dict[str, List[str]]) -> Dict[str, list]:
+    """
+    {代號: 候選欄名} → {代號: 所有可能被選中的實際欄名}（完全相同 / 去括號空白後相同 / 包含）。
+    保留所有命中欄，呼叫端之後再用自己的欄名規則挑欄時結果不變。
+    """
+    out = {}
+    for key, cands in wanted.items():
+        keys = [_norm(c) for c in cands]
+        hit = [c for c in header
+               if str(c).strip() != "" and any(k == _norm(c) or cand in str(c).strip() for cand, k in zip(cands, keys))]
+        if hit:
+            out[key] = hit
+    return out
+
+
+# ===== 讀檔後端 =====
+# 每個後端：iter_sheets(src) → 逐張分頁產生 (分頁名, 列 iterator)；
+# 列的值已轉成與 pd.read_excel 相同的型別（整數 float → int、日期 → datetime），TextParser 推斷結果才一致
+@dataclass(frozen=True)
+class ExcelBackend:
+    name: str
+    module: str                 # 需要的套件（判斷是否已安裝）
+    exts: Tuple[str, ...]       # 支援的副檔名
+    pandas_engine: str          # 完整讀取時交給 pd.read_excel 的 engine
+    iter_sheets: Callable[[Source], Iterator[Tuple[str, Iterator[list]]]]
+    streaming: bool             # 逐列串流（只讀表頭時不必解析整張分頁）
+
+    def available(self) -> bool:
+        return importlib.util.find_spec(self.module) is not None
+
+
+def _num(v):
+    if isinstance(v, float) and math.isfinite(v) and v == int(v):
+        return int(v)
+    return v
+
+
+def _iter_calamine(src: Source):
+    from python_calamine import CalamineWorkbook
+
+    wb = (CalamineWorkbook.from_filelike(_fh(src)) if isinstance(src, (bytes, bytearray))
+          else CalamineWorkbook.from_path(src))
+
+    def conv(v):
+        if isinstance(v, float):
+            return _num(v)
+        if isinstance(v, dt.date) and not isinstance(v, dt.datetime):
+            return dt.datetime(v.year, v.month, v.day)
+        return v
+
+    try:
+        for sn in wb.sheet_names:
+            sheet = wb.get_sheet_by_name(sn)
+            yield sn, ([conv(v) for v in r] for r in sheet.iter_rows())
+    finally:
+        wb.close()
+
+
+def _iter_openpyxl(src: Source):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(_fh(src),
+                       read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            yield ws.title, ([_num(v) for v in r] for r in ws.iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def _iter_xlrd(src: Source):
+    import xlrd
+    from xlrd import XL_CELL_BOOLEAN, XL_CELL_DATE, XL_CELL_ERROR, xldate
+
+    book = (xlrd.open_workbook(file_contents=bytes(src), on_demand=True) if isinstance(src, (bytes, bytearray))
+            else xlrd.open_workbook(src, on_demand=True))
+
+    def conv(v, typ):
+        if typ == XL_CELL_DATE:
+            try:
+                return xldate.xldate_as_datetime(v, book.datemode)
+            except OverflowError:
+                return v
+        if typ == XL_CELL_ERROR:
+            return None
+        if typ == XL_CELL_BOOLEAN:
+            return bool(v)
+        return _num(v)
+
+    try:
+        for sn in book.sheet_names():
+            sh = book.sheet_by_name(sn)
+            yield sn, ([conv(v, t) for v, t in zip(sh.row_values(i), sh.row_types(i))] for i in range(sh.nrows))
+            book.unload_sheet(sn)
+    finally:
+        book.release_resources()
+
+
+def _iter_pyxlsb(src: Source):
+    from pyxlsb import open_workbook
+
+    with open_workbook(_fh(src)) as wb:
+        for sn in wb.sheets:
+            with wb.get_sheet(sn) as sheet:
+                yield sn, ([_num(c.v) for c in r] for r in sheet.rows())
+
+
+BACKENDS: List[ExcelBackend] = [
+    ExcelBackend("calamine", "python_calamine", (".xlsx", ".xlsm", ".xltx", ".xltm", ".xls", ".xlsb"), "calamine",
+                 _iter_calamine, streaming=False),
+    ExcelBackend("openpyxl", "openpyxl", (".xlsx", ".xlsm", ".xltx", ".xltm"), "openpyxl", _iter_openpyxl, streaming=True),
+    ExcelBackend("xlrd", "xlrd", (".xls",), "xlrd", _iter_xlrd, streaming=False),
+    ExcelBackend("pyxlsb", "pyxlsb", (".xlsb",), "pyxlsb", _iter_pyxlsb, streaming=True),
+]
+
+
+def _ext(filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if ext in CSV_EXTS or any(ext in b.exts for b in BACKENDS) else ".xlsx"
+
+
+def backends_for(filename: str, prefer_streaming: bool = False) -> List[ExcelBackend]:
+    """
+    可讀此副檔名且已安裝的後端（依優先順序；WORK_EFF_EXCEL_BACKEND 可覆寫）。
+    prefer_streaming：只讀少數幾列時（表頭探測）串流後端優先。
+    """
+    return _backends(_ext(filename), prefer_streaming)
+
+
+def _backends(ext: str, prefer_streaming: bool = False) -> List[ExcelBackend]:
+    order = BACKENDS
+    forced = [x.strip() for x in os.environ.get("WORK_EFF_EXCEL_BACKEND", "").split(",") if x.strip()]
+    if forced:
+        order = [b for name in forced for b in BACKENDS if b.name == name]
+    out = [b for b in order if ext in b.exts and b.available()]
+    return sorted(out, key=lambda b: not b.streaming) if prefer_streaming else out
+
+
+def _with_backends(ext: str, fn: Callable[[ExcelBackend], object], prefer_streaming: bool = False):
+    """依序嘗試可讀此格式的後端，讀取失敗（格式不支援、檔案異常）改用下一個"""
+    last = None
+    for backend in _backends(ext, prefer_streaming):
+        try:
+            return fn(backend)
+        except Exception as e:
+            last = e
+    if last is not None:
+        raise last
+    raise Exception(f"沒有可讀取 {ext} 的套件（請安裝 python-calamine 或 openpyxl / xlrd / pyxlsb）。")
+
+
+# ===== 格式 / 編碼偵測（看檔頭，不靠副檔名） =====
+SNIFF_BYTES = 64 * 1024  # CSV 編碼判斷的取樣長度
+_ZIP_MAGIC = b"PK\x03\x04"                          # xlsx / xlsm / xlsb
+_OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"  # 舊版 xls
+
+
+def _fh(src: Source):
+    return io.BytesIO(src) if isinstance(src, (bytes, bytearray)) else src
+
+
+def _head(src: Source, n: int) -> bytes:
+    if isinstance(src, (bytes, bytearray)):
+        return bytes(src[:n])
+    with open(src, "rb") as f:
+        return f.read(n)
+
+
+def sniff_format(src: Source) -> str:
+    """
+    檔案內容 → 格式（".xlsx" / ".xlsb" / ".xls" / ".csv"）
+    - ZIP：內含 xl/workbook.bin 為 .xlsb，其餘為 .xlsx（xlsm / xltx 讀法相同）
+    - OLE2：.xls
+    - 文字檔：.csv；網頁 / XML 或其他二進位檔直接報錯，不交給解析器試錯
+    """
+    head = _head(src, len(_OLE_MAGIC))
+    if head.startswith(_ZIP_MAGIC):
+        try:
+            with zipfile.ZipFile(_fh(src)) as z:  # 只讀 ZIP 目錄
+                return ".xlsb" if "xl/workbook.bin" in z.namelist() else ".xlsx"
+        except zipfile.BadZipFile:
+            return ".xlsx"  # 交給後端回報原本的錯誤
+    if head.startswith(_OLE_MAGIC):
+        return ".xls"
+    sample = _head(src, 1024)
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return ".csv"
+    if sample.removeprefix(codecs.BOM_UTF8).lstrip()[:1] == b"<":
+        raise Exception("檔案是網頁 / XML 格式（不是 Excel 或 CSV），請在 Excel 另存為 .xlsx 後再上傳。")
+    if b"\x00" in sample:
+        raise Exception("無法辨識的檔案格式（不是 Excel 或 CSV）。")
+    return ".csv"
+
+
+def _resolve(src: Source, filename: Optional[str]) -> Tuple[Source, str]:
+    """→ (src, 格式)；路徑的副檔名與實際格式不符時改傳 bytes（部分套件開路徑時會檢查副檔名）"""
+    kind = sniff_format(src)
+    if isinstance(src, (bytes, bytearray)):
+        return src, kind
+    ext = _ext(filename or str(src))
+    if ext != kind and not (kind == ".xlsx" and ext in (".xlsm", ".xltx", ".xltm")):
+        src = _head(src, -1)
+    return src, kind
+
+
+def detect_encoding(sample: bytes, final: bool = False) -> str:
+    """
+    CSV 編碼：BOM → 依序試 CSV_ENCODINGS 解碼取樣。
+    final=False 表示 sample 只是檔案開頭（結尾被截斷的多位元組字不算錯）。
+    """
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    for enc in CSV_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(enc)().decode(sample, final=final)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    raise Exception("CSV 讀取失敗（請確認編碼）。")
+
+
+def _with_csv_encoding(src: Source, fn: Callable[[str], object]):
+    """
+    fn(編碼) 以取樣判斷的編碼執行一次；取樣之後才出現無法解碼的字時，
+    以整檔重新判斷編碼再執行（只有這種少見情況會解析第二次）
+    """
+    enc = detect_encoding(_head(src, SNIFF_BYTES))
+    try:
+        return fn(enc)
+    except UnicodeDecodeError:
+        data = src if isinstance(src, (bytes, bytearray)) else _head(src, -1)
+        full = detect_encoding(data, final=True)
+        if full == enc:
+            raise
+        return fn(full)
+
+
+def read_csv_any(src: Source, **kwargs) -> pd.DataFrame:
+    """CSV（bytes 或路徑）→ DataFrame；編碼自動判斷（見 detect_encoding）"""
+    return _with_csv_encoding(src, lambda enc: pd.read_csv(_fh(src), encoding=enc, **kwargs))
+
+
+# ===== 表頭探測（只讀每張分頁的表頭列） =====
+PROBE_MAX_ROWS = 20  # 表頭前的空白列上限（與 read_excel 略過空白列的行為一致）
+
+
+def _first_row(rows) -> list:
+    for r in rows:
+        if any(v is not None and str(v).strip() != "" for v in r):
+            return ["" if v is None else v for v in r]
+    return []
+
+
+def sheet_headers(src: Source, filename: Optional[str] = None) -> Dict[str, list]:
+    """Excel 檔（bytes 或路徑）→ {分頁名: 表頭欄名}；每張分頁只讀到第一個非空白列。"""
+    src, kind = _resolve(src, filename)
+    return _with_backends(kind, lambda b: {
+        sn: _first_row(itertools.islice(rows, PROBE_MAX_ROWS)) for sn, rows in b.iter_sheets(src)
+    }, prefer_streaming=True)
+
+
+def relevant_sheets(headers: Dict[str, list], required: Dict[str, List[str]]) -> List[str]:
+    """表頭含 required 每一組候選欄名（任一命中）的分頁名（保持原順序）"""
+    return [sn for sn, header in headers.items()
+            if header and all(pick_column(header, cands) is not None for cands in required.values())]
+
+
+# ===== 投影讀取（只讀需要的欄位） =====
+def _read_csv_selected(file_bytes: bytes, select: Callable[[list], Optional[list]]) -> Dict[str, pd.DataFrame]:
+    def _read(enc):
+        header = list(pd.read_csv(io.BytesIO(file_bytes), encoding=enc, nrows=0).columns)
+        cols = select(header)
+        if cols is None:
+            return {}
+        return {"CSV": pd.read_csv(io.BytesIO(file_bytes), encoding=enc, usecols=cols, low_memory=False)[cols]}
+
+    return _with_csv_encoding(file_bytes, _read)
+
+
+def _read_excel_selected(backend: ExcelBackend, src: Source,
+                         select: Callable[[list], Optional[list]]) -> Dict[str, pd.DataFrame]:
+    out = {}
+    for sn, rows in backend.iter_sheets(src):
+        header = _first_row(itertools.islice(rows, PROBE_MAX_ROWS))
+        cols = select(header) if header else None
+        if cols is None:
+            continue
+        idx = [header.index(c) for c in cols]
+        data = [cols]
+        for r in rows:
+            data.append([r[i] if i < len(r) else None for i in idx])
+        # 與 pd.read_excel 相同的型別推斷（例如文字 "09440" 會轉成數字），結果才與完整解析一致
+        out[sn] = TextParser(data, header=0).read().dropna(how="all")
+    return out
+
+
+def _read_sheets(file_bytes: bytes, filename: str, select: Callable[[list], Optional[list]]) -> Dict[str, pd.DataFrame]:
+    """
+    共用讀檔：select(表頭) → 要讀的欄（原欄名）或 None（略過該分頁）。
+    回傳 {分頁名: 只含所選欄位的 DataFrame}；CSV 分頁名為 "CSV"。
+    格式看檔頭判斷，filename 的副檔名不影響讀法。
+    """
+    kind = sniff_format(file_bytes)
+    if kind == ".csv":
+        return _read_csv_selected(file_bytes, select)
+    return _with_backends(kind, lambda b: _read_excel_selected(b, file_bytes, select))
+
+
+def read_columns(file_bytes: bytes, filename: str, wanted: Dict[str, List[str]],
+                 required: Sequence[str] = ("user", "time")) -> List[pd.DataFrame]:
+    """
+    上傳檔 → 各分頁只含需要欄位的 DataFrame（欄名為 wanted 的代號）。
+    缺少 required 任一欄的分頁直接略過（樞紐 / 彙總分頁不會被解析）。
+    """
+    def select(header):
+        m = match_columns(header, wanted)
+        return None if any(k not in m for k in required) else list(m.values())
+
+    return rename_columns(_read_sheets(file_bytes, filename, select), wanted, required)
+
+
+def rename_columns(sheets: Dict[str, pd.DataFrame], wanted: Dict[str, List[str]],
+                   required: Sequence[str] = ("user", "time")) -> List[pd.DataFrame]:
+    """已讀入的 {分頁: DataFrame} → 同 read_columns 的結果（例如快取中的 read_projected 結果）"""
+    out = []
+    for df in sheets.values():
+        m = match_columns(list(df.columns), wanted)
+        if any(k not in m for k in required):
+            continue
+        out.append(df.rename(columns={v: k for k, v in m.items()})[list(m)])
+    return out
+
+
+# ===== 欄位投影 + 型別提示（引擎讀檔用） =====
+def as_code(s: pd.Series) -> pd.Series:
+    """人員代碼 → 字串（與引擎 astype(str) 的結果相同；空值保留為 NaN）"""
+    return s.map(str, na_action="ignore").astype(object)
+
+
+def as_category(s: pd.Series) -> pd.Series:
+    """由 / 到 這類重複值多的欄位 → category"""
+    return s.astype("category")
+
+
+def per_unique(s: pd.Series, fn: Callable[[pd.Series], object], na_value=None) -> np.ndarray:
+    """
+    只對不重複值算一次 fn（傳入不重複值組成的 Series，回傳等長結果），再依代碼展開回整欄；
+    category 欄直接用其類別，非 category 先 factorize。空值那格為 na_value。
+    成本與不重複值數成正比（例如儲位代碼數），不隨列數增加
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        codes, uniq = s.cat.codes.to_numpy(), s.cat.categories
+    else:
+        codes, uniq = pd.factorize(s)
+    res = np.asarray(fn(pd.Series(np.asarray(uniq, dtype=object), dtype=object)))
+    return np.append(res, np.array([na_value], dtype=res.dtype if na_value is not None else object))[codes]
+
+
+# ===== 精簡鍵（引擎內部 groupby 用；輸出前再轉回顯示型別） =====
+def user_keys(s: pd.Series) -> pd.Series:
+    """
+    人員欄 → category（整數代碼 + 對照表），值同 s.astype(str).str.strip()；
+    去空白只做在不重複值上，類別依字串排序（排序 / groupby 順序與字串欄相同）
+    """
+    codes, uniq = pd.factorize(s, use_na_sentinel=False)
+    labels = pd.Series(uniq).astype(str).str.strip()
+    lab_codes, lab_uniq = pd.factorize(labels)
+    order = np.argsort(np.asarray(lab_uniq, dtype=object), kind="stable")
+    rank = np.empty(len(order) + 1, dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    rank[-1] = -1  # 空值
+    cat = pd.Categorical.from_codes(rank[lab_codes[codes]], categories=pd.Index(lab_uniq)[order])
+    return pd.Series(cat, index=s.index, name=s.name)
+
+
+def day_numbers(ts: pd.Series) -> pd.Series:
+    """datetime 欄（不可含 NaT）→ int32 日序號（1970-01-01 起算），取代 .dt.date 的 Python date 物件欄"""
+    return pd.Series(ts.to_numpy().astype("datetime64[D]").astype(np.int32), index=ts.index, name=ts.name)
+
+
+def day_to_date(n) -> dt.date:
+    """單一日序號 → datetime.date"""
+    return dt.date(1970, 1, 1) + dt.timedelta(days=int(n))
+
+
+def days_to_dates(days: pd.Series) -> pd.Series:
+    """日序號 → datetime.date（輸出表格 / Excel / 分區存檔用）"""
+    return pd.Series(days.to_numpy().astype(np.int64).astype("datetime64[D]"), index=days.index,
+                     name=days.name).dt.date
+
+
+def _projection(wanted: Dict[str, List[str]], required: Sequence[str]) -> Callable[[list], Optional[list]]:
+    """read_projected / 串流共用的 select：wanted 命中的所有欄（保持表頭順序）；缺 required 回傳 None"""
+    def select(header):
+        m = project_columns(header, wanted)
+        if any(k not in m for k in required):
+            return None
+        return [c for c in header if any(c in v for v in m.values())]
+    return select
+
+
+def _apply_dtypes(sheets: Dict[str, pd.DataFrame], wanted: Dict[str, List[str]],
+                  dtypes: Optional[Dict[str, Callable]]) -> Dict[str, pd.DataFrame]:
+    for df in sheets.values():
+        m = project_columns(list(df.columns), wanted)
+        for key, fn in (dtypes or {}).items():
+            for c in m.get(key, []):
+                df[c] = fn(df[c])
+    return sheets
+
+
+def read_projected(file_bytes: bytes, filename: str, wanted: Dict[str, List[str]],
+                   required: Sequence[str], dtypes: Optional[Dict[str, Callable]] = None,
+                   row_mask: Optional[Callable[[pd.DataFrame], pd.Series]] = None) -> Dict[str, pd.DataFrame]:
+    """
+    上傳檔 → {分頁名: 只含 wanted 命中欄位的 DataFrame}（保留原欄名，引擎照原本方式挑欄）。
+    缺少 required 任一代號的分頁略過；dtypes = {代號: 轉換函式}，套用到該代號命中的所有欄。
+    大型 CSV 改分塊串流（見 read_csv_streaming），row_mask 為每塊先套用的過濾；
+    其他情況不套 row_mask（引擎本來就會再過濾一次）。
+    """
+    if len(file_bytes) >= _stream_min_bytes() and sniff_format(file_bytes) == ".csv":
+        return read_csv_streaming(file_bytes, wanted, required, dtypes=dtypes, row_mask=row_mask)
+    return _apply_dtypes(_read_sheets(file_bytes, filename, _projection(wanted, required)), wanted, dtypes)
+
+
+# ===== CSV 分塊串流（記憶體只跟過濾後留下的列數有關，與原始檔大小無關） =====
+CSV_CHUNK_ROWS = 200_000
+
+
+def _stream_min_bytes() -> int:
+    return int(float(os.environ.get("WORK_EFF_CSV_STREAM_MB", "64")) * 1024 * 1024)
+
+
+class _ColumnTypes:
+    """
+    分塊時每塊都以字串讀入（各塊自行推斷型別會不一致），另外累計每欄在「全部列」上的型別：
+    結束時照一次讀完整檔的 read_csv 規則還原（全為整數且無空值 → int、全為數字 → float、其餘維持字串），
+    人員代碼這類欄位的結果才與不分塊時相同
+    """
+    _INT = r"\s*[+-]?\d+\s*"
+
+    def __init__(self, cols: list):
+        self.numeric = dict.fromkeys(cols, True)
+        self.intlike = dict.fromkeys(cols, True)
+        self.has_na = dict.fromkeys(cols, False)
+
+    def update(self, chunk: pd.DataFrame):
+        for c in chunk.columns:
+            if not self.numeric[c]:
+                continue
+            s = chunk[c]
+            na = s.isna()
+            v = s[~na]
+            self.has_na[c] |= bool(na.any())
+            if not pd.to_numeric(v, errors="coerce").notna().all():
+                self.numeric[c] = False
+            elif self.intlike[c] and not v.str.fullmatch(self._INT).all():
+                self.intlike[c] = False
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        for c in df.columns:
+            if self.numeric[c]:
+                v = pd.to_numeric(df[c])
+                df[c] = v.astype("int64") if self.intlike[c] and not self.has_na[c] else v.astype("float64")
+        return df
+
+
+def read_csv_streaming(file_bytes: bytes, wanted: Dict[str, List[str]], required: Sequence[str],
+                       dtypes: Optional[Dict[str, Callable]] = None,
+                       row_mask: Optional[Callable[[pd.DataFrame], pd.Series]] = None,
+                       chunksize: Optional[int] = None) -> Dict[str, pd.DataFrame]:
+    """
+    大型 CSV → {"CSV": DataFrame}，結果同 read_projected：
+    每塊 chunksize 列（預設 CSV_CHUNK_ROWS）只解析 wanted 命中的欄 → row_mask(塊) 過濾 → 累積留下的列；最後還原型別並套 dtypes。
+    """
+    select = _projection(wanted, required)
+
+    def _read(enc):
+        header = list(pd.read_csv(io.BytesIO(file_bytes), encoding=enc, nrows=0).columns)
+        cols = select(header)
+        if cols is None:
+            return {}
+        types = _ColumnTypes(cols)
+        kept = []
+        for chunk in pd.read_csv(io.BytesIO(file_bytes), encoding=enc, usecols=cols, dtype=str,
+                                 chunksize=chunksize or CSV_CHUNK_ROWS):
+            chunk = chunk[cols]
+            types.update(chunk)
+            kept.append(chunk.loc[row_mask(chunk)] if row_mask is not None else chunk)
+        df = pd.concat(kept, ignore_index=True) if kept else pd.DataFrame(columns=cols)
+        return {"CSV": types.apply(df)}
+
+    return _apply_dtypes(_with_csv_encoding(file_bytes, _read), wanted, dtypes)
+
+
+# ===== 完整讀取（全部欄位） =====
+def read_excel_sheets(src: Source, filename: Optional[str] = None,
+                      sheets: Optional[List[str]] = None) -> Dict[str, pd.DataFrame]:
+    """Excel 檔 → {分頁名: DataFrame}（sheets=None 為全部分頁）；後端同上，交給 pd.read_excel 解析"""
+    if sheets is not None and not sheets:
+        return {}
+    src, kind = _resolve(src, filename)
+    return _with_backends(kind, lambda b: pd.read_excel(_fh(src), sheet_name=sheets, engine=b.pandas_engine))
+
+
+# ===== 後端效能比較 =====
+def benchmark(src: Source, filename: Optional[str] = None, repeat: int = 3,
+              wanted: Optional[Dict[str, List[str]]] = None) -> pd.DataFrame:
+    """
+    各可用後端讀同一檔的耗時（取 repeat 次最小值）：表頭探測 / 投影讀取 / 完整讀取。
+    wanted 預設為人員＋時間欄（兩個引擎共通的候選欄名）。
+    """
+    name = filename if filename is not None else str(src)
+    if isinstance(src, (bytes, bytearray)):
+        data = bytes(src)
+    else:
+        with open(src, "rb") as f:
+            data = f.read()
+    wanted = wanted or {"user": ["記錄輸入人", "建立人", "輸入人"], "time": ["修訂日期", "修訂時間", "更新日期"]}
+
+    def select(header):
+        m = project_columns(header, wanted)
+        return [c for c in header if any(c in v for v in m.values())] if len(m) == len(wanted) else None
+
+    tasks = {
+        "表頭探測": lambda b: {sn: _first_row(itertools.islice(r, PROBE_MAX_ROWS)) for sn, r in b.iter_sheets(data)},
+        "投影讀取": lambda b: _read_excel_selected(b, data, select),
+        "完整讀取": lambda b: pd.read_excel(io.BytesIO(data), sheet_name=None, engine=b.pandas_engine),
+    }
+    rows = []
+    ext = sniff_format(data)
+    for b in BACKENDS:
+        if ext not in b.exts or not b.available():
+            continue
+        for task, fn in tasks.items():
+            best, err, n = None, "", 0
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                try:
+                    out = fn(b)
+                except Exception as e:
+                    err = repr(e)[:80]
+                    break
+                best = min(best or 1e9, time.perf_counter() - t0)
+                n = len(out) if task == "表頭探測" else sum(len(v) for v in out.values())
+            rows.append({"檔案": os.path.basename(name), "大小_KB": len(data) // 1024, "後端": b.name,
+                         "項目": task, "秒": None if best is None else round(best, 3), "列數": n, "錯誤": err})
+    return pd.DataFrame(rows)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="sheet_reader", description="Excel 讀檔後端效能比較")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    bp = sub.add_parser("bench", help="各後端讀同一批檔案的耗時")
+    bp.add_argument("files", nargs="+")
+    bp.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    res = pd.concat([benchmark(f, repeat=args.repeat) for f in args.files], ignore_index=True)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(res.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
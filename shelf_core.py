@@ -6,20 +6,47 @@
 - 保留：彙總、明細、明細_時段、報表_區塊、休息規則 分頁
 - 保留：效率著色（>=TARGET_EFF 綠；<TARGET_EFF 紅）
 - 保留：空窗計算（>=10 分鐘；扣固定排除帶；上午不扣休、下午工時計算扣休）
+- 過濾（由=QC、到 不含排除關鍵字）只對不重複的儲位值各算一次，再依 category 代碼展開回每列
+- 頁面、批次（batch_cli）、增量模式共用同一套引擎：
+    ShelfParams（目標效率、空窗門檻、AM/PM 時段、休息規則、空窗排除帶、排除關鍵字）
+    → compute_daily（每人每日）→ build_result → ShelfResult（彙總 / 明細 / 長表 / KPI；Excel 用到才產生）
+- 各階段（讀檔 / 過濾 / 每人每日 / 彙總 / 匯出）的時間、列數、記憶體記在 RunMetrics（見 run_metrics），
+  ShelfResult.metrics / 結果 dict 的 "metrics"
+
+設定（環境變數）：
+    WORK_EFF_SHELF_EXCLUDE  『到』排除關鍵字（逗號分隔，取代預設清單；呼叫端 params["exclude_keywords"] 優先）
 """
 from __future__ import annotations
 
-import os, re, tempfile, datetime as dt
-from typing import Dict, Any, Tuple, List
+import io, os, re, functools, hashlib, datetime as dt
+from dataclasses import dataclass, field, fields
+from typing import Dict, Any, Tuple, List, Sequence
 
+import numpy as np
 import pandas as pd
 
+from batch_ingest import ITEM_CANDIDATES, load_many
+from sheet_reader import (as_category, as_code, read_columns, read_csv_any, read_excel_sheets, read_projected,
+                          relevant_sheets, rename_columns, sheet_headers, sniff_format,
+                          day_numbers, days_to_dates, per_unique, user_keys)
+from roster import names
+from run_metrics import RunMetrics, count_rows
+from upload_cache import cached_read, lookup
+
 # ====== 參數（可被呼叫端覆寫） ======
-TO_EXCLUDE_KEYWORDS = ["CGS", "JCPL", "QC99", "GREAT0001X", "GX010", "PD99"]
-TO_EXCLUDE_PATTERN = re.compile("|".join(re.escape(k) for k in TO_EXCLUDE_KEYWORDS), flags=re.IGNORECASE)
+TO_EXCLUDE_KEYWORDS = [k.strip() for k in os.environ.get("WORK_EFF_SHELF_EXCLUDE", "").split(",") if k.strip()] \
+    or ["CGS", "JCPL", "QC99", "GREAT0001X", "GX010", "PD99"]
 
 INPUT_USER_CANDIDATES = ["記錄輸入人", "記錄輸入者", "建立人", "輸入人"]
-REV_DT_CANDIDATES    = ["修訂日期", "修訂時間", "修訂日", "異動時間", "修改時間"]
+REV_DT_CANDIDATES    = ["修訂日期", "修訂時間", "修訂日", "異動時間", "修改時間",
+                        "修訂日期時間", "修訂日期時間(系統)", "修訂日期時間（系統）"]
+
+# 需要完整解析的分頁：表頭要有『由』『到』（見 prepare_filtered_df）
+SHELF_SHEET_KEYS = {"from": ["由"], "to": ["到"]}
+
+# 多檔合併時判定「同一筆掃描事件」的關鍵欄位
+SHELF_EVENT_KEYS = {"user": INPUT_USER_CANDIDATES, "time": REV_DT_CANDIDATES,
+                    "from": ["由"], "to": ["到"], "item": ITEM_CANDIDATES}
 
 DEFAULT_TARGET_EFF = 20
 DEFAULT_IDLE_MIN_THRESHOLD = 10
@@ -27,16 +54,8 @@ DEFAULT_IDLE_MIN_THRESHOLD = 10
 AM_START, AM_END = dt.time(7,0,0), dt.time(12,30,0)
 PM_START, PM_END = dt.time(13,30,0), dt.time(23,59,59)
 
-NAME_MAP = {
-    "20200924001":"黃雅君","20210805001":"郭中合","20220505002":"阮文青明",
-    "20221221001":"阮文全","20221222005":"謝忠龍","20230119001":"陶春青",
-    "20240926001":"陳莉娜","20241011002":"林雙慧","20250502001":"吳詩敏",
-    "20250617001":"阮文譚","20250617003":"喬家寶","20250901009":"張寶萱",
-    "G01":"0","20201109003":"吳振凱","09963":"黃謙凱",
-    "20240313003":"阮曰忠","20201109001":"梁冠如","10003":"李茂銓",
-    "20200922002":"葉欲弘","20250923019":"阮氏紅深","9963":"黃謙凱",
-    "11399":"陳哲沅",
-}
+# 記錄輸入人 → 姓名：外部名冊檔 roster.json 的 "shelf" 分組（見 roster.py）
+ROSTER_GROUP = "shelf"
 
 BREAK_RULES = [
      (dt.time(20,45,0), dt.time(22,30,0),  0, "首≥20:45 且 末≤22:30 → 0 分鐘"),
@@ -68,6 +87,62 @@ EXCLUDE_IDLE_RANGES = [
     (dt.time(20,30, 0), dt.time(20, 45, 0)),
 ]
 
+TimeWindow = Tuple[dt.time, dt.time]
+BreakRule = Tuple[dt.time, dt.time, int, str]
+
+@dataclass(frozen=True)
+class ShelfParams:
+    """
+    上架產能計算參數（頁面 / 批次 / 增量共用）。規則表存成 tuple：可雜湊、可送進 process pool。
+    exclude_keywords 為 None 時用 TO_EXCLUDE_KEYWORDS（建立時即正規化，見 exclude_keywords）
+    """
+    target_eff: float = DEFAULT_TARGET_EFF
+    idle_threshold: int = DEFAULT_IDLE_MIN_THRESHOLD
+    am_window: TimeWindow = (AM_START, AM_END)
+    pm_window: TimeWindow = (PM_START, PM_END)
+    break_rules: Tuple[BreakRule, ...] = tuple(BREAK_RULES)
+    idle_exclude_ranges: Tuple[TimeWindow, ...] = tuple(EXCLUDE_IDLE_RANGES)
+    exclude_keywords: Tuple[str, ...] | None = None
+
+    def __post_init__(self):
+        object.__setattr__(self, "target_eff", float(self.target_eff))
+        object.__setattr__(self, "idle_threshold", int(self.idle_threshold))
+        object.__setattr__(self, "am_window", tuple(self.am_window))
+        object.__setattr__(self, "pm_window", tuple(self.pm_window))
+        object.__setattr__(self, "break_rules", tuple(tuple(r) for r in self.break_rules))
+        object.__setattr__(self, "idle_exclude_ranges", tuple(tuple(r) for r in self.idle_exclude_ranges))
+        object.__setattr__(self, "exclude_keywords", exclude_keywords(self.exclude_keywords))
+
+    @classmethod
+    def of(cls, params=None) -> "ShelfParams":
+        """None / dict（舊呼叫端的 params，只取認得的鍵）/ ShelfParams → ShelfParams"""
+        if isinstance(params, cls):
+            return params
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in (params or {}).items() if k in known and v is not None})
+
+    def store_params(self) -> Dict[str, Any]:
+        """增量資料集（PartialStore）的參數簽章：影響每人每日明細的欄位；與預設相同的不列入（既有資料集照常沿用）"""
+        base = ShelfParams()
+        out: Dict[str, Any] = {"idle_threshold": self.idle_threshold}
+        for name in ("am_window", "pm_window", "break_rules", "idle_exclude_ranges", "exclude_keywords"):
+            if getattr(self, name) != getattr(base, name):
+                out[name] = getattr(self, name)
+        return out
+
+    def audit(self) -> Dict[str, Any]:
+        """稽核留存用的參數摘要"""
+        hm = lambda t: t.strftime("%H:%M" if t.second == 0 else "%H:%M:%S")
+        return {
+            "target_eff": self.target_eff,
+            "filter": "由=QC 且 到不含關鍵字",
+            "exclude_keywords": list(self.exclude_keywords),
+            "am_range": f"{hm(self.am_window[0])}-{hm(self.am_window[1])}",
+            "pm_range": f"{hm(self.pm_window[0])}-{hm(self.pm_window[1])}",
+            "idle_min_threshold": self.idle_threshold,
+            "idle_exclude_ranges": [(a.strftime("%H:%M"), b.strftime("%H:%M")) for a, b in self.idle_exclude_ranges],
+        }
+
 def _strip_cols(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
     df.columns = [str(c).strip() for c in df.columns]
@@ -86,40 +161,53 @@ def find_first_column(df: pd.DataFrame, candidates: List[str]) -> str | None:
     return None
 
 def read_excel_any_quiet(path: str) -> Dict[str, pd.DataFrame]:
-    ext = os.path.splitext(path)[1].lower()
-    if ext in (".xlsx", ".xlsm"):
-        xl = pd.ExcelFile(path, engine="openpyxl")
-        return {sn: pd.read_excel(xl, sheet_name=sn) for sn in xl.sheet_names}
-    if ext == ".xls":
-        xl = pd.ExcelFile(path, engine="xlrd")
-        return {sn: pd.read_excel(xl, sheet_name=sn) for sn in xl.sheet_names}
-    if ext == ".xlsb":
-        xl = pd.ExcelFile(path, engine="pyxlsb")
-        return {sn: pd.read_excel(xl, sheet_name=sn) for sn in xl.sheet_names}
-    if ext == ".csv":
-        for enc in ("utf-8-sig", "cp950", "big5"):
-            try:
-                return {"CSV": pd.read_csv(path, encoding=enc)}
-            except Exception:
-                continue
-        raise Exception("CSV 讀取失敗。")
-    raise Exception("不支援的副檔名。")
+    # 格式看檔頭判斷、CSV 編碼以取樣判斷，都只解析一次；後端見 sheet_reader
+    if sniff_format(path) == ".csv":
+        return {"CSV": read_csv_any(path)}
+    # 先只讀表頭：沒有『由/到』的分頁（樞紐、彙總）不做完整解析
+    return read_excel_sheets(path, sheets=relevant_sheets(sheet_headers(path), SHELF_SHEET_KEYS))
+
+# ====== 過濾（由=QC、到 不含排除關鍵字） ======
+def exclude_keywords(keywords: Sequence[str] | None = None) -> Tuple[str, ...]:
+    """排除關鍵字正規化：None → TO_EXCLUDE_KEYWORDS；去空白、轉大寫、去重（保留順序）"""
+    if keywords is None:
+        keywords = TO_EXCLUDE_KEYWORDS
+    elif isinstance(keywords, str):
+        keywords = keywords.split(",")
+    return tuple(dict.fromkeys(str(k).strip().upper() for k in keywords if str(k).strip()))
+
+@functools.lru_cache(maxsize=32)
+def exclude_pattern(keywords: Tuple[str, ...]) -> re.Pattern | None:
+    if not keywords:
+        return None
+    return re.compile("|".join(re.escape(k) for k in keywords), flags=re.IGNORECASE)
 
 def normalize_to_qc(series: pd.Series) -> pd.Series:
-    s = series.astype(str).str.strip().str.upper()
-    return s.eq("QC")
-
-def to_not_excluded_mask(series: pd.Series) -> pd.Series:
-    s = series.astype(str).str.strip()
-    return ~s.str.contains(TO_EXCLUDE_PATTERN, na=False)
+    mask = per_unique(series, lambda u: u.astype(str).str.strip().str.upper().eq("QC").to_numpy(bool), False)
+    return pd.Series(mask, index=series.index)
+
+def to_not_excluded_mask(series: pd.Series, keywords: Sequence[str] | None = None) -> pd.Series:
+    """到 不含任一排除關鍵字（不分大小寫）；正則只對不重複的儲位值各跑一次，空值保留"""
+    pat = exclude_pattern(exclude_keywords(keywords))
+    if pat is None:
+        return pd.Series(True, index=series.index)
+    mask = per_unique(series, lambda u: ~u.astype(str).str.strip().str.contains(pat).to_numpy(bool), True)
+    return pd.Series(mask, index=series.index)
+
+def shelf_event_mask(df: pd.DataFrame, keywords: Sequence[str] | None = None) -> pd.Series:
+    """有效上架事件：由=QC 且 到 不含排除關鍵字（欄名去空白比對；缺欄時全部不留）"""
+    cols = {str(c).strip(): c for c in df.columns}
+    if "由" not in cols or "到" not in cols:
+        return pd.Series(False, index=df.index)
+    return normalize_to_qc(df[cols["由"]]) & to_not_excluded_mask(df[cols["到"]], keywords)
 
-def prepare_filtered_df(df: pd.DataFrame) -> pd.DataFrame:
+def prepare_filtered_df(df: pd.DataFrame, keywords: Sequence[str] | None = None) -> pd.DataFrame:
     if df is None or df.empty:
         return pd.DataFrame()
     df = _strip_cols(df)
     if "由" not in df.columns or "到" not in df.columns:
         return pd.DataFrame()
-    return df[normalize_to_qc(df["由"]) & to_not_excluded_mask(df["到"])].copy()
+    return df[shelf_event_mask(df, keywords)].copy()
 
 def autosize_columns(ws, df: pd.DataFrame):
     from openpyxl.utils import get_column_letter
@@ -132,11 +220,12 @@ def autosize_columns(ws, df: pd.DataFrame):
             max_len = max(len(str(col)), 8)
         ws.column_dimensions[get_column_letter(i)].width = min(max_len + 2, 60)
 
-def break_minutes_for_span(first_dt: pd.Timestamp, last_dt: pd.Timestamp) -> Tuple[int,str]:
+def break_minutes_for_span(first_dt: pd.Timestamp, last_dt: pd.Timestamp,
+                           rules: Sequence[BreakRule] = BREAK_RULES) -> Tuple[int,str]:
     if pd.isna(first_dt) or pd.isna(last_dt):
         return 0, "無時間資料"
     st, ed = first_dt.time(), last_dt.time()
-    for st_ge, ed_le, mins, tag in BREAK_RULES:
+    for st_ge, ed_le, mins, tag in rules:
         if (st >= st_ge) and (ed <= ed_le):
             return mins, tag
     return 0, "未命中規則"
@@ -183,29 +272,30 @@ def _span_metrics(series_dt: pd.Series):
         return pd.NaT, pd.NaT, 0
     return series_dt.min(), series_dt.max(), series_dt.size
 
-def compute_am_pm_for_group(g: pd.DataFrame, *, idle_threshold: int) -> pd.Series:
+def compute_am_pm_for_group(g: pd.DataFrame, *, params: ShelfParams) -> pd.Series:
     times = g["__dt__"]
+    idle_threshold, rules, idle_ex = params.idle_threshold, params.break_rules, params.idle_exclude_ranges
 
-    t_am = times[times.dt.time.between(AM_START, AM_END)]
+    t_am = times[times.dt.time.between(*params.am_window)]
     am_first, am_last, am_cnt = _span_metrics(t_am)
     am_mins = int(round(((am_last - am_first).total_seconds()/60.0))) if am_cnt > 0 else 0
     am_eff  = round((am_cnt / am_mins * 60.0), 2) if am_mins > 0 else 0.0
-    am_idle_min, am_idle_ranges = _compute_idle(t_am, idle_threshold, EXCLUDE_IDLE_RANGES)
+    am_idle_min, am_idle_ranges = _compute_idle(t_am, idle_threshold, idle_ex)
 
-    t_pm = times[times.dt.time.between(PM_START, PM_END)]
+    t_pm = times[times.dt.time.between(*params.pm_window)]
     pm_first, pm_last, pm_cnt = _span_metrics(t_pm)
     if pm_cnt > 0:
-        pm_break, pm_rule = break_minutes_for_span(pm_first, pm_last)
+        pm_break, pm_rule = break_minutes_for_span(pm_first, pm_last, rules)
         raw_pm_mins = (pm_last - pm_first).total_seconds()/60.0
         pm_mins = max(int(round(raw_pm_mins - pm_break)), 0)
     else:
         pm_break, pm_rule, pm_mins = 0, "無時間資料", 0
     pm_eff = round((pm_cnt / pm_mins * 60.0), 2) if pm_mins > 0 else 0.0
-    pm_idle_min, pm_idle_ranges = _compute_idle(t_pm, idle_threshold, EXCLUDE_IDLE_RANGES)
+    pm_idle_min, pm_idle_ranges = _compute_idle(t_pm, idle_threshold, idle_ex)
 
     whole_first, whole_last, day_cnt = _span_metrics(times)
     if day_cnt > 0:
-        whole_break, br_tag_whole = break_minutes_for_span(whole_first, whole_last)
+        whole_break, br_tag_whole = break_minutes_for_span(whole_first, whole_last, rules)
         raw_whole_mins = (whole_last - whole_first).total_seconds()/60.0
         whole_mins = max(int(round(raw_whole_mins - whole_break)), 0)
     else:
@@ -266,10 +356,8 @@ def write_block_report(writer, detail_long: pd.DataFrame, user_col: str, target_
     left   = Alignment(horizontal="left",   vertical="center")
 
     df = detail_long.copy()
-    df["工作區間"] = df.apply(lambda r: (
-        ("" if pd.isna(r["第一筆時間"]) else str(r["第一筆時間"].time())) + " ~ " +
-        ("" if pd.isna(r["最後一筆時間"]) else str(r["最後一筆時間"].time()))
-    ), axis=1)
+    clock = lambda ts: ts.dt.time.astype(str).where(ts.notna(), "")  # 同 str(Timestamp.time())
+    df["工作區間"] = clock(df["第一筆時間"]) + " ~ " + clock(df["最後一筆時間"])
     df["總分鐘"] = df["工時_分鐘"].astype(int)
 
     for dt_date, g in df.groupby("日期"):
@@ -316,217 +404,566 @@ def write_block_report(writer, detail_long: pd.DataFrame, user_col: str, target_
                       max((len(str(ws.cell(row=r, column=c).value)) for r in range(1, ws.max_row+1)), default=0))
         ws.column_dimensions[get_column_letter(c)].width = min(max_len + 2, 60)
 
-def run_shelf_efficiency(file_bytes: bytes, filename: str, params: Dict[str, Any] | None = None) -> Dict[str, Any]:
-    params = params or {}
-    target_eff = float(params.get("target_eff", DEFAULT_TARGET_EFF))
-    idle_threshold = int(params.get("idle_threshold", DEFAULT_IDLE_MIN_THRESHOLD))
-
-    suffix = os.path.splitext(filename)[1].lower() or ".xlsx"
-
-    with tempfile.TemporaryDirectory() as td:
-        in_path = os.path.join(td, f"upload{suffix}")
-        with open(in_path, "wb") as f:
-            f.write(file_bytes)
-
-        sheets = read_excel_any_quiet(in_path)
-
-        kept_all = []
-        for sn, df in sheets.items():
-            k = prepare_filtered_df(df)
-            if not k.empty:
-                k["__sheet__"] = sn
-                kept_all.append(k)
-
-        if not kept_all:
-            raise Exception("無符合資料（可能缺『由/到』欄或過濾後為空）。")
-
-        data = pd.concat(kept_all, ignore_index=True)
-
-        user_col = find_first_column(data, INPUT_USER_CANDIDATES)
-        revdt_col = find_first_column(data, REV_DT_CANDIDATES)
-        if user_col is None:
-            raise Exception("找不到『記錄輸入人』欄位。")
-        if revdt_col is None:
-            raise Exception("找不到『修訂日期/時間』欄位。")
-
-        data["__dt__"] = pd.to_datetime(data[revdt_col], errors="coerce")
-        data["__code__"] = data[user_col].astype(str).str.strip()
-        data["對應姓名"] = data["__code__"].map(NAME_MAP).fillna("")
-
-        dt_data = data.dropna(subset=["__dt__"]).copy()
-        if dt_data.empty:
-            raise Exception("資料沒有可用的修訂日期時間，無法計算。")
-
-        dt_data["日期"] = dt_data["__dt__"].dt.date
-
-        daily = (
-            dt_data.groupby([user_col, "對應姓名", "日期"], dropna=False)
-                   .apply(lambda g: compute_am_pm_for_group(g, idle_threshold=idle_threshold))
-                   .reset_index()
-        )
+def to_datetime_quiet(series: pd.Series) -> pd.Series:
+    return pd.to_datetime(series, errors="coerce")
+
+def upload_namespace(keywords: Sequence[str] | None = None) -> str:
+    """上傳檔快取的讀法名稱：快取的是過濾後的列，所以依排除關鍵字分開存"""
+    sig = hashlib.sha1(",".join(exclude_keywords(keywords)).encode("utf-8")).hexdigest()[:10]
+    return f"shelf-{sig}"
+
+def read_upload(file_bytes: bytes, filename: str, exclude: Sequence[str] | None = None) -> Dict[str, pd.DataFrame]:
+    """
+    上傳檔 bytes → {分頁: DataFrame}（模組層級函式，可交給 process pool）
+    只讀計算用欄位（SHELF_EVENT_KEYS）並套型別：人員代碼字串、時間 datetime、由/到 category
+    格式看檔頭判斷（副檔名取錯或沒有副檔名也能讀）；大型 CSV 分塊串流，每塊先留下有效事件再累積
+    解析結果依檔案內容 sha256 快取在磁碟（見 upload_cache），換參數重算時不再解析
+    exclude：『到』排除關鍵字（None 用 TO_EXCLUDE_KEYWORDS）
+    """
+    exclude = exclude_keywords(exclude)
+    return cached_read(upload_namespace(exclude), file_bytes, filename,
+                       functools.partial(_parse_upload, exclude=exclude))
+
+def _parse_upload(file_bytes: bytes, filename: str, exclude: Tuple[str, ...]) -> Dict[str, pd.DataFrame]:
+    return read_projected(file_bytes, filename, SHELF_EVENT_KEYS, required=("from", "to"),
+                          dtypes={"user": as_code, "time": to_datetime_quiet,
+                                  "from": as_category, "to": as_category},
+                          row_mask=functools.partial(shelf_event_mask, keywords=exclude))
+
+def load_shelf_events(file_bytes: bytes, filename: str,
+                      exclude: Sequence[str] | None = None) -> Tuple[pd.DataFrame, str]:
+    """上傳檔 → (有效事件 dt_data, 記錄輸入人欄名)；已過濾 由=QC、到 排除關鍵字、無時間列"""
+    return shelf_events_from_sheets(read_upload(file_bytes, filename, exclude), exclude)
+
+def load_shelf_events_files(files: List[Tuple[str, bytes]], max_workers: int | None = None,
+                            progress=None, exclude: Sequence[str] | None = None,
+                            metrics: RunMetrics | None = None) -> Tuple[pd.DataFrame, str, dict, RunMetrics]:
+    """
+    多檔：平行解析 → 跨檔去重合併 → (dt_data, 記錄輸入人欄名, ingest 統計, 效能紀錄)
+    效能紀錄一併回傳（交給計算池時子 process 內的紀錄才帶得回來）
+    """
+    progress = progress or _no_progress
+    metrics = metrics if metrics is not None else RunMetrics()
+    progress("parse", 0.0)
+    exclude = exclude_keywords(exclude)
+    with metrics.stage("parse") as s:
+        sheets, stats = load_many(files, functools.partial(read_upload, exclude=exclude), SHELF_EVENT_KEYS,
+                                  max_workers=max_workers)
+        s.rows_in, s.rows_out = stats.get("rows_in"), count_rows(sheets)
+    progress("filter", 0.30)
+    with metrics.stage("filter", count_rows(sheets)) as s:
+        dt_data, user_col = shelf_events_from_sheets(sheets, exclude)
+        s.rows_out = len(dt_data)
+    return dt_data, user_col, stats, metrics
+
+def _no_progress(stage: str, pct: float, partial: dict | None = None):
+    pass
+
+def shelf_events_from_sheets(sheets: Dict[str, pd.DataFrame],
+                             exclude: Sequence[str] | None = None) -> Tuple[pd.DataFrame, str]:
+    """{分頁: DataFrame} → (有效事件 dt_data, 記錄輸入人欄名)"""
+    kept_all = []
+    for sn, df in sheets.items():
+        k = prepare_filtered_df(df, exclude)
+        if not k.empty:
+            k["__sheet__"] = sn
+            kept_all.append(k)
+
+    if not kept_all:
+        raise Exception("無符合資料（可能缺『由/到』欄或過濾後為空）。")
+
+    data = pd.concat(kept_all, ignore_index=True)
+
+    user_col = find_first_column(data, INPUT_USER_CANDIDATES)
+    revdt_col = find_first_column(data, REV_DT_CANDIDATES)
+    if user_col is None:
+        raise Exception("找不到『記錄輸入人』欄位。")
+    if revdt_col is None:
+        raise Exception("找不到『修訂日期/時間』欄位。")
+
+    data["__dt__"] = pd.to_datetime(data[revdt_col], errors="coerce")
+    data["__code__"] = data[user_col].astype(str).str.strip()
+    data["對應姓名"] = names(data["__code__"], ROSTER_GROUP)
+
+    dt_data = data.dropna(subset=["__dt__"]).copy()
+    if dt_data.empty:
+        raise Exception("資料沒有可用的修訂日期時間，無法計算。")
+
+    dt_data["日期"] = dt_data["__dt__"].dt.date
+    return dt_data, user_col
+
+def compute_daily(dt_data: pd.DataFrame, user_col: str, params: ShelfParams | None = None,
+                  progress=None, pct_range: Tuple[float, float] = (0.35, 0.80),
+                  metrics: RunMetrics | None = None, group_fn=None) -> pd.DataFrame:
+    """
+    每人每日（per-(人員, 日期)）AM/PM/整體 指標；progress 依已算組數回報「空窗偵測」進度
+    分組鍵用精簡型別（人員 / 姓名 category、日期 int32 日序號），結果再轉回原本的欄型別與 date
+    metrics：有給時整段記為 idle 階段
+    group_fn：每組的計算（預設 compute_am_pm_for_group；等價性檢查換成候選實作，見 equivalence）
+    """
+    if metrics is not None:
+        with metrics.stage("idle", len(dt_data)) as s:
+            daily = compute_daily(dt_data, user_col, params, progress, pct_range, group_fn=group_fn)
+            s.rows_out = len(daily)
+        return daily
+    params = ShelfParams.of(params)
+    keys = [dt_data[user_col].astype("category"), dt_data["對應姓名"].astype("category"),
+            day_numbers(dt_data["__dt__"]).rename("日期")]
+    grouped = dt_data.groupby(keys, dropna=False, observed=True)
+    group_fn = group_fn or compute_am_pm_for_group
+    if progress is None:
+        fn = lambda g: group_fn(g, params=params)
+    else:
+        lo, hi = pct_range
+        n = max(grouped.ngroups, 1)
+        step = max(1, n // 20)
+        done = [0]
+
+        def fn(g):
+            done[0] += 1
+            if done[0] % step == 0:
+                progress("idle", lo + (hi - lo) * min(done[0] / n, 1.0))
+            return group_fn(g, params=params)
+
+    daily = grouped.apply(fn).reset_index()
+    for c in (user_col, "對應姓名"):  # 同直接以原欄 groupby 時的鍵欄型別
+        daily[c] = daily[c].astype(daily[c].cat.categories.dtype)
+    daily["日期"] = days_to_dates(daily["日期"])
+    return daily
+
+def compute_daily_files(files: List[Tuple[str, bytes]], params: ShelfParams | None = None,
+                        max_workers: int | None = None, progress=None) -> Tuple[pd.DataFrame, str, dict, RunMetrics]:
+    """多檔 → (每人每日明細, 記錄輸入人欄名, ingest 統計, 效能紀錄)；供計算池整段送到子 process"""
+    params = ShelfParams.of(params)
+    dt_data, user_col, stats, metrics = load_shelf_events_files(files, max_workers=max_workers, progress=progress,
+                                                                exclude=params.exclude_keywords)
+    daily = compute_daily(dt_data, user_col, params, progress=progress, pct_range=(0.35, 1.0), metrics=metrics)
+    return daily, user_col, stats, metrics
+
+# ===================== 結果（彙總 / 長表 / KPI；Excel 用到才產生） =====================
+@dataclass
+class ShelfResult:
+    """build_result 的結果；xlsx_bytes 第一次取用時才產生 Excel（之後沿用）"""
+    user_col: str
+    daily: pd.DataFrame        # 每人每日明細
+    summary: pd.DataFrame      # 每人彙總（依總筆數排序，不含合計列）
+    summary_out: pd.DataFrame  # summary ＋「整體合計」列（Excel 彙總分頁）
+    detail_long: pd.DataFrame  # 明細_時段：每人每日每時段一列
+    kpi: Dict[str, Any]
+    params: ShelfParams
+    filename: str
+    metrics: RunMetrics = field(default_factory=RunMetrics)  # 各階段效能紀錄（產 Excel 時再加 export）
+
+    @functools.cached_property
+    def xlsx_bytes(self) -> bytes:
+        with self.metrics.stage("export", len(self.summary_out) + len(self.daily) + len(self.detail_long)):
+            return build_excel_bytes(self)
+
+    @property
+    def xlsx_name(self) -> str:
+        return f"{os.path.splitext(os.path.basename(self.filename))[0]}上架績效.xlsx"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """run_shelf_efficiency 的回傳格式（共用 UI 欄名；會產生 Excel）"""
+        user_col, long = self.user_col, self.detail_long
+        return {
+            "summary_df": self.summary_out.rename(columns={
+                user_col: "記錄輸入人", "對應姓名": "姓名", "總筆數": "筆數",
+                "總工時_分鐘_扣休": "總分鐘", "效率_件每小時": "效率",
+            }),
+            "detail_df": self.daily,
+            "ampm_df": long.rename(columns={user_col: "記錄輸入人", "對應姓名": "姓名"}) if not long.empty else pd.DataFrame(),
+            "xlsx_bytes": self.xlsx_bytes,
+            "xlsx_name": self.xlsx_name,
+            "target_eff": self.params.target_eff,
+            "people": self.kpi["total_people"],
+            "total_count": self.kpi["total_count"],
+            "total_hours": self.kpi["total_hours"],
+            "avg_eff": self.kpi["avg_eff"],
+            "pass_rate": f"{self.kpi['total_rate']:.0%}",
+            "metrics": self.metrics.records(),  # 放在 xlsx_bytes 之後：含匯出階段
+        }
 
-        # 彙總
-        summary = (
-            daily.groupby([user_col, "對應姓名"], dropna=False, as_index=False)
-                 .agg(
-                     総日數=("日期", "nunique"),
-                     總筆數=("當日筆數", "sum"),
-                     總工時_分鐘_扣休=("當日工時_分鐘_扣休", "sum"),
-                     上午筆數=("上午_筆數", "sum"),
-                     上午工時_分鐘=("上午_工時_分鐘", "sum"),
-                     下午筆數=("下午_筆數", "sum"),
-                     下午工時_分鐘_扣休=("下午_工時_分鐘_扣休", "sum"),
-                 )
-        )
+def _eff(n, m):
+    return round((n / m * 60.0), 2) if m and m > 0 else 0.0
+
+def _round2(v: pd.Series) -> pd.Series:
+    """
+    同 Python round(x, 2)。numpy 的 round（×100 取整再 ÷100）在 .xx5 附近可能與 Python 差 0.01
+    （例如 201/800*60 = 15.075），只有這些接近進位邊界的值改用 Python round
+    """
+    out = v.round(2)
+    frac = (v * 100) % 1
+    near = (frac - 0.5).abs() < 1e-6
+    if near.any():
+        out[near] = [round(x, 2) for x in v[near]]
+    return out
+
+def _eff_col(n: pd.Series, m: pd.Series) -> pd.Series:
+    """同 _eff，整欄計算（分鐘 <= 0 → 0.0）"""
+    return _round2(n / m.where(m > 0) * 60.0).fillna(0.0)
+
+# 明細_時段（長表）：每人每日明細的 上午_* / 下午_* 欄 → 長表欄
+LONG_AM_COLS = {"上午_第一筆": "第一筆時間", "上午_最後一筆": "最後一筆時間", "上午_筆數": "筆數",
+                "上午_工時_分鐘": "工時_分鐘", "上午_空窗分鐘": "空窗分鐘", "上午_空窗時段": "空窗時段",
+                "上午_效率_件每小時": "效率_件每小時"}
+LONG_PM_COLS = {"下午_第一筆": "第一筆時間", "下午_最後一筆": "最後一筆時間", "下午_筆數": "筆數",
+                "下午_工時_分鐘_扣休": "工時_分鐘", "下午_休息分鐘": "休息分鐘", "下午_空窗分鐘_扣休": "空窗分鐘",
+                "下午_空窗時段": "空窗時段", "下午_效率_件每小時": "效率_件每小時", "下午_命中規則": "命中規則"}
+
+def build_detail_long(daily: pd.DataFrame, user_col: str) -> pd.DataFrame:
+    """
+    每人每日明細 → 明細_時段（有筆數的時段各一列）。
+    上午 / 下午兩組欄各取一次再接起來（不逐列 iterrows）；列順序同逐列展開（每人每日先上午後下午）
+    """
+    cols = [user_col, "對應姓名", "日期", "時段", "第一筆時間", "最後一筆時間",
+            "筆數", "工時_分鐘", "休息分鐘", "空窗分鐘", "空窗時段", "效率_件每小時", "命中規則"]
+    parts = []
+    for seg, mapping, extra in (("上午", LONG_AM_COLS, {"休息分鐘": 0, "命中規則": "上午不扣休"}),
+                                ("下午", LONG_PM_COLS, {})):
+        cnt_col = next(k for k, v in mapping.items() if v == "筆數")
+        rows = np.flatnonzero((daily[cnt_col] > 0).to_numpy())
+        part = daily.iloc[rows][[user_col, "對應姓名", "日期", *mapping]].rename(columns=mapping)
+        part = part.assign(時段=seg, **extra, _ord=rows * 2 + (seg == "下午"))
+        parts.append(part)
+    long = pd.concat(parts, ignore_index=True)
+    if long.empty:
+        return pd.DataFrame()
+    long = long.sort_values("_ord", ignore_index=True)[cols]
+    for c in ("筆數", "工時_分鐘", "休息分鐘", "空窗分鐘"):
+        long[c] = long[c].astype(int)
+    return long.sort_values([user_col,"日期","時段","第一筆時間"])
+
+def build_result(daily: pd.DataFrame, user_col: str, params: ShelfParams | None = None, *,
+                 filename: str = "", progress=None, metrics: RunMetrics | None = None) -> ShelfResult:
+    """每人每日明細 → 彙總、長表與 KPI（不產 Excel）；metrics 記下 aggregate 階段後掛在結果上"""
+    metrics = metrics if metrics is not None else RunMetrics()
+    with metrics.stage("aggregate", len(daily)) as s:
+        res = _build_result(daily, user_col, ShelfParams.of(params), filename, progress)
+        s.rows_out = len(res.summary) + len(res.detail_long)
+    res.metrics = metrics
+    return res
+
+def _build_result(daily: pd.DataFrame, user_col: str, params: ShelfParams, filename: str, progress) -> ShelfResult:
+    target_eff = params.target_eff
+    progress = progress or _no_progress
+    progress("aggregate", 0.80)
+
+    # 彙總
+    summary = (
+        daily.groupby([user_col, "對應姓名"], dropna=False, as_index=False)
+             .agg(
+                 総日數=("日期", "nunique"),
+                 總筆數=("當日筆數", "sum"),
+                 總工時_分鐘_扣休=("當日工時_分鐘_扣休", "sum"),
+                 上午筆數=("上午_筆數", "sum"),
+                 上午工時_分鐘=("上午_工時_分鐘", "sum"),
+                 下午筆數=("下午_筆數", "sum"),
+                 下午工時_分鐘_扣休=("下午_工時_分鐘_扣休", "sum"),
+             )
+    )
+    summary["上午效率_件每小時"] = _eff_col(summary["上午筆數"], summary["上午工時_分鐘"])
+    summary["下午效率_件每小時"] = _eff_col(summary["下午筆數"], summary["下午工時_分鐘_扣休"])
+    summary["總工時_分鐘_扣休"] = summary["上午工時_分鐘"].fillna(0).astype(int) + summary["下午工時_分鐘_扣休"].fillna(0).astype(int)
+    summary["效率_件每小時"] = _eff_col(summary["總筆數"], summary["總工時_分鐘_扣休"])
+
+    for c in ["總筆數","總工時_分鐘_扣休","上午筆數","上午工時_分鐘","下午筆數","下午工時_分鐘_扣休"]:
+        summary[c] = summary[c].fillna(0).astype(int)
+    summary = summary.sort_values(["總筆數","總工時_分鐘_扣休"], ascending=[False, False])
+
+    total_people = int(summary[user_col].nunique())
+    total_met = int((summary["效率_件每小時"] >= target_eff).sum())
+    pm_met = int((summary["下午效率_件每小時"] >= target_eff).sum())
+
+    total_row = {
+        user_col: "整體合計", "對應姓名": "",
+        "総日數": int(summary["総日數"].sum()),
+        "總筆數": int(summary["總筆數"].sum()),
+        "總工時_分鐘_扣休": int(summary["總工時_分鐘_扣休"].sum()),
+        "上午筆數": int(summary["上午筆數"].sum()),
+        "上午工時_分鐘": int(summary["上午工時_分鐘"].sum()),
+        "下午筆數": int(summary["下午筆數"].sum()),
+        "下午工時_分鐘_扣休": int(summary["下午工時_分鐘_扣休"].sum()),
+        "效率_件每小時": _eff(int(summary["總筆數"].sum()), int(summary["總工時_分鐘_扣休"].sum())),
+        "上午效率_件每小時": _eff(int(summary["上午筆數"].sum()), int(summary["上午工時_分鐘"].sum())),
+        "下午效率_件每小時": _eff(int(summary["下午筆數"].sum()), int(summary["下午工時_分鐘_扣休"].sum())),
+    }
+    summary_out = pd.concat([summary, pd.DataFrame([total_row])], ignore_index=True)
+
+    detail_long = build_detail_long(daily, user_col)
+
+    total_minutes = int(summary["總工時_分鐘_扣休"].sum())
+    kpi = {
+        "total_people": total_people, "total_met": total_met,
+        "total_rate": (total_met / total_people) if total_people > 0 else 0.0,
+        "pm_total": total_people, "pm_met": pm_met,
+        "pm_rate": (pm_met / total_people) if total_people > 0 else 0.0,
+        "total_count": int(summary["總筆數"].sum()) if len(summary) > 0 else 0,
+        "total_hours": round(total_minutes / 60.0, 2) if total_minutes else 0.0,
+        "avg_eff": round(float(summary["效率_件每小時"].mean()), 2) if len(summary) > 0 else 0.0,
+    }
+    return ShelfResult(user_col=user_col, daily=daily, summary=summary, summary_out=summary_out,
+                       detail_long=detail_long, kpi=kpi, params=params, filename=filename)
+
+def build_excel_bytes(res: ShelfResult) -> bytes:
+    """匯出 Excel：彙總、明細、明細_時段、報表_區塊、休息規則（保留著色）"""
+    user_col, target_eff = res.user_col, res.params.target_eff
+    daily, detail_long, summary_out = res.daily, res.detail_long, res.summary_out
+    out = io.BytesIO()
+    with pd.ExcelWriter(out, engine="openpyxl",
+                        datetime_format="yyyy-mm-dd hh:mm:ss",
+                        date_format="yyyy-mm-dd") as writer:
+        sum_cols = [
+            user_col, "對應姓名", "総日數",
+            "總筆數","總工時_分鐘_扣休","效率_件每小時",
+            "上午筆數","上午工時_分鐘","上午效率_件每小時",
+            "下午筆數","下午工時_分鐘_扣休","下午效率_件每小時",
+        ]
+        summary_out[sum_cols].to_excel(writer, index=False, sheet_name="彙總")
+        ws_sum = writer.sheets["彙總"]; autosize_columns(ws_sum, summary_out[sum_cols])
+
+        det_cols = [
+            user_col, "對應姓名", "日期",
+            "第一筆時間","最後一筆時間","當日筆數",
+            "休息分鐘_整體","當日工時_分鐘_扣休","效率_件每小時",
+            "上午_第一筆","上午_最後一筆","上午_筆數","上午_工時_分鐘","上午_效率_件每小時",
+            "上午_空窗分鐘","上午_空窗時段",
+            "下午_第一筆","下午_最後一筆","下午_筆數","下午_休息分鐘",
+            "下午_工時_分鐘_扣休","下午_效率_件每小時",
+            "下午_空窗分鐘_扣休","下午_空窗時段",
+        ]
+        daily.sort_values([user_col,"日期","第一筆時間"])[det_cols].to_excel(writer, index=False, sheet_name="明細")
+        ws_det = writer.sheets["明細"]; autosize_columns(ws_det, daily[det_cols])
 
-        def _eff(n, m):
-            return round((n / m * 60.0), 2) if m and m > 0 else 0.0
-
-        summary["上午效率_件每小時"] = summary.apply(lambda r: _eff(r["上午筆數"], r["上午工時_分鐘"]), axis=1)
-        summary["下午效率_件每小時"] = summary.apply(lambda r: _eff(r["下午筆數"], r["下午工時_分鐘_扣休"]), axis=1)
-        summary["總工時_分鐘_扣休"] = summary["上午工時_分鐘"].fillna(0).astype(int) + summary["下午工時_分鐘_扣休"].fillna(0).astype(int)
-        summary["效率_件每小時"] = summary.apply(lambda r: _eff(r["總筆數"], r["總工時_分鐘_扣休"]), axis=1)
-
-        for c in ["總筆數","總工時_分鐘_扣休","上午筆數","上午工時_分鐘","下午筆數","下午工時_分鐘_扣休"]:
-            summary[c] = summary[c].fillna(0).astype(int)
-        summary = summary.sort_values(["總筆數","總工時_分鐘_扣休"], ascending=[False, False])
-
-        total_people = int(summary[user_col].nunique())
-        met_people = int((summary["效率_件每小時"] >= target_eff).sum())
-        rate = (met_people / total_people) if total_people > 0 else 0.0
-
-        total_row = {
-            user_col: "整體合計", "對應姓名": "",
-            "総日數": int(summary["総日數"].sum()),
-            "總筆數": int(summary["總筆數"].sum()),
-            "總工時_分鐘_扣休": int(summary["總工時_分鐘_扣休"].sum()),
-            "上午筆數": int(summary["上午筆數"].sum()),
-            "上午工時_分鐘": int(summary["上午工時_分鐘"].sum()),
-            "下午筆數": int(summary["下午筆數"].sum()),
-            "下午工時_分鐘_扣休": int(summary["下午工時_分鐘_扣休"].sum()),
-            "效率_件每小時": _eff(int(summary["總筆數"].sum()), int(summary["總工時_分鐘_扣休"].sum())),
-            "上午效率_件每小時": _eff(int(summary["上午筆數"].sum()), int(summary["上午工時_分鐘"].sum())),
-            "下午效率_件每小時": _eff(int(summary["下午筆數"].sum()), int(summary["下午工時_分鐘_扣休"].sum())),
-        }
-        summary_out = pd.concat([summary, pd.DataFrame([total_row])], ignore_index=True)
-
-        # 明細_時段（長表）
-        long_rows = []
-        for _, r in daily.iterrows():
-            if r["上午_筆數"] > 0:
-                long_rows.append({
-                    user_col: r[user_col], "對應姓名": r["對應姓名"], "日期": r["日期"],
-                    "時段": "上午",
-                    "第一筆時間": r["上午_第一筆"], "最後一筆時間": r["上午_最後一筆"],
-                    "筆數": int(r["上午_筆數"]),
-                    "工時_分鐘": int(r["上午_工時_分鐘"]),
-                    "休息分鐘": 0,
-                    "空窗分鐘": int(r["上午_空窗分鐘"]),
-                    "空窗時段": r["上午_空窗時段"],
-                    "效率_件每小時": r["上午_效率_件每小時"],
-                    "命中規則": "上午不扣休",
-                })
-            if r["下午_筆數"] > 0:
-                long_rows.append({
-                    user_col: r[user_col], "對應姓名": r["對應姓名"], "日期": r["日期"],
-                    "時段": "下午",
-                    "第一筆時間": r["下午_第一筆"], "最後一筆時間": r["下午_最後一筆"],
-                    "筆數": int(r["下午_筆數"]),
-                    "工時_分鐘": int(r["下午_工時_分鐘_扣休"]),
-                    "休息分鐘": int(r["下午_休息分鐘"]),
-                    "空窗分鐘": int(r["下午_空窗分鐘_扣休"]),
-                    "空窗時段": r["下午_空窗時段"],
-                    "效率_件每小時": r["下午_效率_件每小時"],
-                    "命中規則": r["下午_命中規則"],
-                })
-        detail_long = pd.DataFrame(long_rows)
         if not detail_long.empty:
-            detail_long = detail_long.sort_values([user_col,"日期","時段","第一筆時間"])
-
-        # 匯出 Excel（保留著色與報表）
-        base = os.path.splitext(os.path.basename(filename))[0]
-        xlsx_name = f"{base}上架績效.xlsx"
-        out_path = os.path.join(td, "result.xlsx")
-
-        with pd.ExcelWriter(out_path, engine="openpyxl",
-                            datetime_format="yyyy-mm-dd hh:mm:ss",
-                            date_format="yyyy-mm-dd") as writer:
-            sum_cols = [
-                user_col, "對應姓名", "総日數",
-                "總筆數","總工時_分鐘_扣休","效率_件每小時",
-                "上午筆數","上午工時_分鐘","上午效率_件每小時",
-                "下午筆數","下午工時_分鐘_扣休","下午效率_件每小時",
-            ]
-            summary_out[sum_cols].to_excel(writer, index=False, sheet_name="彙總")
-            ws_sum = writer.sheets["彙總"]; autosize_columns(ws_sum, summary_out[sum_cols])
-
-            det_cols = [
-                user_col, "對應姓名", "日期",
-                "第一筆時間","最後一筆時間","當日筆數",
-                "休息分鐘_整體","當日工時_分鐘_扣休","效率_件每小時",
-                "上午_第一筆","上午_最後一筆","上午_筆數","上午_工時_分鐘","上午_效率_件每小時",
-                "上午_空窗分鐘","上午_空窗時段",
-                "下午_第一筆","下午_最後一筆","下午_筆數","下午_休息分鐘",
-                "下午_工時_分鐘_扣休","下午_效率_件每小時",
-                "下午_空窗分鐘_扣休","下午_空窗時段",
-            ]
-            daily.sort_values([user_col,"日期","第一筆時間"])[det_cols].to_excel(writer, index=False, sheet_name="明細")
-            ws_det = writer.sheets["明細"]; autosize_columns(ws_det, daily[det_cols])
-
-            if not detail_long.empty:
-                long_cols = [user_col,"對應姓名","日期","時段","第一筆時間","最後一筆時間",
-                             "筆數","工時_分鐘","休息分鐘","空窗分鐘","空窗時段",
-                             "效率_件每小時","命中規則"]
-                detail_long[long_cols].to_excel(writer, index=False, sheet_name="明細_時段")
-                ws_long = writer.sheets["明細_時段"]; autosize_columns(ws_long, detail_long[long_cols])
-                shade_rows_by_efficiency(ws_long, header_name="效率_件每小時", target_eff=target_eff)
-
-                write_block_report(writer, detail_long, user_col, target_eff=target_eff)
-
-            rules_rows = []
-            for i,(st_ge,ed_le,mins,tag) in enumerate(BREAK_RULES, start=1):
-                rules_rows.append({
-                    "優先序": i,
-                    "首時間條件(>=)": st_ge.strftime("%H:%M:%S"),
-                    "末時間條件(<=)": ed_le.strftime("%H:%M:%S"),
-                    "休息分鐘": mins,
-                    "規則說明": tag
-                })
-            rules_df = pd.DataFrame(rules_rows, columns=["優先序","首時間條件(>=)","末時間條件(<=)","休息分鐘","規則說明"])
-            rules_df.to_excel(writer, index=False, sheet_name="休息規則")
-            ws_rule = writer.sheets["休息規則"]; autosize_columns(ws_rule, rules_df)
-
-            shade_rows_by_efficiency(ws_sum, header_name="效率_件每小時", target_eff=target_eff)
-            shade_rows_by_efficiency(ws_det, header_name="效率_件每小時", target_eff=target_eff)
-
-        with open(out_path, "rb") as f:
-            xlsx_bytes = f.read()
-
-    # UI 用的彙總欄位（統一名稱方便共用 UI）
-    ui_summary = summary_out.copy()
-    ui_summary = ui_summary.rename(columns={
-        user_col: "記錄輸入人",
-        "對應姓名": "姓名",
-        "總筆數": "筆數",
-        "總工時_分鐘_扣休": "總分鐘",
-        "效率_件每小時": "效率",
+            long_cols = [user_col,"對應姓名","日期","時段","第一筆時間","最後一筆時間",
+                         "筆數","工時_分鐘","休息分鐘","空窗分鐘","空窗時段",
+                         "效率_件每小時","命中規則"]
+            detail_long[long_cols].to_excel(writer, index=False, sheet_name="明細_時段")
+            ws_long = writer.sheets["明細_時段"]; autosize_columns(ws_long, detail_long[long_cols])
+            shade_rows_by_efficiency(ws_long, header_name="效率_件每小時", target_eff=target_eff)
+
+            write_block_report(writer, detail_long, user_col, target_eff=target_eff)
+
+        rules_rows = []
+        for i,(st_ge,ed_le,mins,tag) in enumerate(res.params.break_rules, start=1):
+            rules_rows.append({
+                "優先序": i,
+                "首時間條件(>=)": st_ge.strftime("%H:%M:%S"),
+                "末時間條件(<=)": ed_le.strftime("%H:%M:%S"),
+                "休息分鐘": mins,
+                "規則說明": tag
+            })
+        rules_df = pd.DataFrame(rules_rows, columns=["優先序","首時間條件(>=)","末時間條件(<=)","休息分鐘","規則說明"])
+        rules_df.to_excel(writer, index=False, sheet_name="休息規則")
+        ws_rule = writer.sheets["休息規則"]; autosize_columns(ws_rule, rules_df)
+
+        shade_rows_by_efficiency(ws_sum, header_name="效率_件每小時", target_eff=target_eff)
+        shade_rows_by_efficiency(ws_det, header_name="效率_件每小時", target_eff=target_eff)
+    return out.getvalue()
+
+def _legacy_result(res: ShelfResult, progress=None) -> Dict[str, Any]:
+    """KPI 先行：產 Excel 前先送出彙總數字，再轉成 run_shelf_efficiency 的回傳格式"""
+    progress = progress or _no_progress
+    progress("export", 0.85, {
+        "people": res.kpi["total_people"], "met_people": res.kpi["total_met"],
+        "pass_rate": res.kpi["total_rate"], "total_count": res.kpi["total_count"],
     })
-
-    # 轉小時給 KPI 顯示
-    total_minutes = int(summary_out.loc[summary_out.index[:-1], "總工時_分鐘_扣休"].sum()) if len(summary_out)>1 else int(summary_out["總工時_分鐘_扣休"].sum())
-    total_hours = round(total_minutes / 60.0, 2) if total_minutes else 0.0
-    avg_eff = round(float(summary["效率_件每小時"].mean()), 2) if len(summary)>0 else 0.0
-
+    return res.to_dict()
+
+# ===================== 入口（params 可為 dict 或 ShelfParams） =====================
+def run_shelf_efficiency(file_bytes: bytes, filename: str, params: ShelfParams | Dict[str, Any] | None = None,
+                         progress=None) -> Dict[str, Any]:
+    params = ShelfParams.of(params)
+    progress = progress or _no_progress
+    metrics = RunMetrics()
+    progress("parse", 0.0)
+    with metrics.stage("parse") as s:
+        sheets = read_upload(file_bytes, filename, params.exclude_keywords)
+        s.rows_out = count_rows(sheets)
+    progress("filter", 0.30)
+    with metrics.stage("filter", s.rows_out) as s:
+        dt_data, user_col = shelf_events_from_sheets(sheets, params.exclude_keywords)
+        s.rows_out = len(dt_data)
+    daily = compute_daily(dt_data, user_col, params, progress=progress, metrics=metrics)
+    res = build_result(daily, user_col, params, filename=filename, progress=progress, metrics=metrics)
+    return _legacy_result(res, progress)
+
+def run_shelf_efficiency_files(files: List[Tuple[str, bytes]], params: ShelfParams | Dict[str, Any] | None = None,
+                               max_workers: int | None = None, progress=None) -> Dict[str, Any]:
+    """多檔入口：files = [(檔名, bytes), ...]；回傳鍵同 run_shelf_efficiency，另含 ingest 統計"""
+    params = ShelfParams.of(params)
+    dt_data, user_col, stats, metrics = load_shelf_events_files(files, max_workers=max_workers, progress=progress,
+                                                                exclude=params.exclude_keywords)
+    daily = compute_daily(dt_data, user_col, params, progress=progress, metrics=metrics)
+    res = build_result(daily, user_col, params, filename=batch_filename(files), progress=progress, metrics=metrics)
+    out = _legacy_result(res, progress)
+    out["ingest"] = stats
+    return out
+
+def batch_filename(files: List[Tuple[str, bytes]]) -> str:
+    """多檔時以第一個檔名加「等 N 檔」作為報表檔名基底"""
+    first = files[0][0]
+    if len(files) == 1:
+        return first
+    base, ext = os.path.splitext(first)
+    return f"{base}_等{len(files)}檔{ext}"
+
+# ===================== 增量模式（每日新檔累加，不重算歷史） =====================
+CANON_USER_COL = INPUT_USER_CANDIDATES[0]
+
+def ingest_daily(dt_data: pd.DataFrame, user_col: str, params: ShelfParams | None, store,
+                 metrics: RunMetrics | None = None) -> Tuple[pd.DataFrame, str, list]:
+    """
+    新檔事件只重算受影響的 (人員, 日期) 分區，回傳 (全部分區重建的每人每日明細, 人員欄名, 重算日期)。
+    store：partial_store.PartialStore（參數簽章用 ShelfParams.store_params()；target_eff 只影響彙總，不需）
+    metrics：有給時分區重算 + 重建整段記為 idle 階段
+    """
+    params = ShelfParams.of(params)
+    metrics = metrics if metrics is not None else RunMetrics()
+    events = dt_data[[user_col, "對應姓名", "__dt__", "日期"]].rename(columns={user_col: CANON_USER_COL})
+
+    with metrics.stage("idle", len(events)) as s:
+        affected = store.ingest(
+            events,
+            worker_col=CANON_USER_COL,
+            compute=lambda day, ev: {"daily": compute_daily(ev, CANON_USER_COL, params)},
+        )
+        daily = store.load_all("daily")
+        s.rows_out = len(daily)
+    daily[CANON_USER_COL] = as_code(daily[CANON_USER_COL])  # 舊分區可能存成數字代碼
+    daily = daily.sort_values([CANON_USER_COL, "對應姓名", "日期"], ignore_index=True)
+    return daily, CANON_USER_COL, affected
+
+def run_shelf_incremental(file_bytes: bytes, filename: str, params: ShelfParams | Dict[str, Any] | None = None, *,
+                          store) -> Dict[str, Any]:
+    """
+    增量入口：只讀入新檔事件，重算受影響的分區，再由 store 內所有分區重建 summary / 長表 / Excel。
+    回傳鍵同 run_shelf_efficiency，另含 affected_dates / dates。
+    """
+    params = ShelfParams.of(params)
+    metrics = RunMetrics()
+    with metrics.stage("parse") as s:
+        sheets = read_upload(file_bytes, filename, params.exclude_keywords)
+        s.rows_out = count_rows(sheets)
+    with metrics.stage("filter", s.rows_out) as s:
+        dt_data, user_col = shelf_events_from_sheets(sheets, params.exclude_keywords)
+        s.rows_out = len(dt_data)
+    return _shelf_incremental(dt_data, user_col, filename, params, store, metrics)
+
+def run_shelf_incremental_files(files: List[Tuple[str, bytes]], params: ShelfParams | Dict[str, Any] | None = None, *,
+                                store, max_workers: int | None = None) -> Dict[str, Any]:
+    """多檔增量入口：平行解析 + 跨檔去重後再累加（另含 ingest 統計）"""
+    params = ShelfParams.of(params)
+    dt_data, user_col, stats, metrics = load_shelf_events_files(files, max_workers=max_workers,
+                                                                exclude=params.exclude_keywords)
+    out = _shelf_incremental(dt_data, user_col, batch_filename(files), params, store, metrics)
+    out["ingest"] = stats
+    return out
+
+def _shelf_incremental(dt_data: pd.DataFrame, user_col: str, filename: str,
+                       params: ShelfParams, store, metrics: RunMetrics) -> Dict[str, Any]:
+    daily, user_col, affected = ingest_daily(dt_data, user_col, params, store, metrics)
+    out = build_result(daily, user_col, params, filename=filename, metrics=metrics).to_dict()
+    out["affected_dates"] = affected
+    out["dates"] = store.dates()
+    return out
+
+# ===================== 頁面 job（整段送進計算池） =====================
+def run_shelf_job(files: List[Tuple[str, bytes]], params: ShelfParams | Dict[str, Any] | None = None, *,
+                  store=None, max_workers: int | None = None,
+                  progress=None) -> Tuple[ShelfResult, dict, list | None]:
+    """
+    上架頁面的完整計算：讀檔 → 每人每日（store 有給時走增量）→ 彙總 → Excel，全部在計算池子 process 內完成，
+    頁面 script thread 只拿結果。回傳 (ShelfResult（xlsx_bytes 已產生）, ingest 統計, 本次重算日期（非增量為 None）)
+    """
+    params = ShelfParams.of(params)
+    progress = progress or _no_progress
+    dt_data, user_col, stats, metrics = load_shelf_events_files(files, max_workers=max_workers, progress=progress,
+                                                                exclude=params.exclude_keywords)
+    affected = None
+    if store is None:
+        daily = compute_daily(dt_data, user_col, params, progress=progress, metrics=metrics)
+    else:
+        daily, user_col, affected = ingest_daily(dt_data, user_col, params, store, metrics)
+    res = build_result(daily, user_col, params, filename=batch_filename(files), progress=progress, metrics=metrics)
+    progress("export", 0.85)
+    res.xlsx_bytes  # 在子 process 產生 Excel（cached_property，隨結果一起 pickle 回頁面）
+    progress("export", 1.0)
+    return res, stats, affected
+
+# ===================== 快速預覽（只讀必要欄位的概估 KPI） =====================
+PREVIEW_COLS = {"user": INPUT_USER_CANDIDATES, "time": REV_DT_CANDIDATES, "from": ["由"], "to": ["到"]}
+
+def preview_shelf_kpis(files: List[Tuple[str, bytes]], params: ShelfParams | Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """
+    只讀 人員 / 時間 / 由 / 到 四欄，向量化算每人 AM/PM 筆數與首末筆工時（不算空窗、不產 Excel）。
+    筆數與工時同完整計算；多檔時以（人員, 時間, 到）近似跨檔去重。
+    回傳 {"summary": 每人彙總, "kpi": 同頁面 kpi 欄位, "total_count"}
+    """
+    params = ShelfParams.of(params)
+    target_eff, exclude = params.target_eff, params.exclude_keywords
+
+    parts = []
+    required = ("user", "time", "from", "to")
+    for name, b in files:
+        cached = lookup((upload_namespace(exclude),), b)  # 已完整分析過的檔直接用快取
+        for df in (rename_columns(cached, PREVIEW_COLS, required) if cached is not None
+                   else read_columns(b, name, PREVIEW_COLS, required=required)):
+            parts.append(df[normalize_to_qc(df["from"]) & to_not_excluded_mask(df["to"], exclude)])
+    if not parts:
+        raise Exception("無符合資料（可能缺『由/到』欄或過濾後為空）。")
+
+    ev = pd.concat(parts, ignore_index=True)
+    ev["_code"] = user_keys(ev["user"])
+    ev["_dt"] = pd.to_datetime(ev["time"], errors="coerce")
+    ev = ev.loc[ev["_dt"].notna()]
+    if len(files) > 1:
+        ev = ev.drop_duplicates(["_code", "_dt", "to"])
+
+    t = ev["_dt"].dt.time
+    am = t.between(*params.am_window)
+    pm = t.between(*params.pm_window)
+    ev = ev.assign(日期=day_numbers(ev["_dt"]), 時段=np.where(am, "上午", np.where(pm, "下午", "")))
+    day_cnt = ev.groupby("_code", observed=True).size()  # 總筆數含午休等時段外的筆數（同完整計算的當日筆數）
+    day_cnt.index = day_cnt.index.astype(str)
+    ev = ev.loc[ev["時段"] != ""]
+
+    g = ev.groupby(["_code", "日期", "時段"], observed=True)["_dt"].agg(["size", "min", "max"]).reset_index()
+    g["_code"] = g["_code"].astype(str)
+    span = (g["max"] - g["min"]).dt.total_seconds() / 60.0
+    brk = np.where(g["時段"] == "上午", 0, [break_minutes_for_span(f, l, params.break_rules)[0]
+                                               for f, l in zip(g["min"], g["max"])])
+    g["mins"] = np.maximum((span - brk).round(), 0).astype(int)
+
+    wide = g.pivot_table(index="_code", columns="時段", values=["size", "mins"], aggfunc="sum", fill_value=0)
+    wide = wide.reindex(day_cnt.index, fill_value=0)
+    summary = pd.DataFrame({
+        CANON_USER_COL: wide.index,
+        "上午筆數": wide.get(("size", "上午"), 0),
+        "上午工時_分鐘": wide.get(("mins", "上午"), 0),
+        "下午筆數": wide.get(("size", "下午"), 0),
+        "下午工時_分鐘_扣休": wide.get(("mins", "下午"), 0),
+    }).reset_index(drop=True)
+    summary["對應姓名"] = names(summary[CANON_USER_COL], ROSTER_GROUP)
+    summary["總筆數"] = summary[CANON_USER_COL].map(day_cnt).fillna(0).astype(int)
+    summary["總工時_分鐘_扣休"] = summary["上午工時_分鐘"] + summary["下午工時_分鐘_扣休"]
+
+    summary["上午效率_件每小時"] = _eff_col(summary["上午筆數"], summary["上午工時_分鐘"])
+    summary["下午效率_件每小時"] = _eff_col(summary["下午筆數"], summary["下午工時_分鐘_扣休"])
+    summary["效率_件每小時"] = _eff_col(summary["總筆數"], summary["總工時_分鐘_扣休"])
+    summary = summary.sort_values(["總筆數", "總工時_分鐘_扣休"], ascending=[False, False], ignore_index=True)
+
+    people = int(len(summary))
+    total_met = int((summary["效率_件每小時"] >= target_eff).sum())
+    pm_met = int((summary["下午效率_件每小時"] >= target_eff).sum())
     return {
-        "summary_df": ui_summary,
-        "detail_df": daily,
-        "ampm_df": detail_long.rename(columns={user_col: "記錄輸入人", "對應姓名":"姓名"}) if not detail_long.empty else pd.DataFrame(),
-        "xlsx_bytes": xlsx_bytes,
-        "xlsx_name": xlsx_name,
-        "target_eff": target_eff,
-        "people": total_people,
-        "total_count": int(summary["總筆數"].sum()) if len(summary)>0 else 0,
-        "total_hours": total_hours,
-        "avg_eff": avg_eff,
-        "pass_rate": f"{rate:.0%}",
+        "summary": summary,
+        "kpi": {
+            "total_people": people, "total_met": total_met,
+            "total_rate": (total_met / people) if people else 0.0,
+            "pm_total": people, "pm_met": pm_met,
+            "pm_rate": (pm_met / people) if people else 0.0,
+        },
+        "total_count": int(summary["總筆數"].sum()),
     }
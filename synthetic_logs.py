@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成倉儲掃描紀錄（驗收 / 上架匯出檔的替身：可重現、不含個資，給效能量測與比對用）
+- 每位作業員有固定班別（早 / 中 / 晚）與個人速度；每日上下班時間小幅浮動
+- 掃描間隔為指數分布（平均 60 / 每小時筆數 分鐘，最少 5 秒）；每筆之後有機率出現長空窗（個人傾向不同）
+- 休息習慣：午休 / 下午茶 / 晚餐各有「會休」的機率，休息時段內沒有紀錄
+- 驗收：到=QC 佔大多數；上架：由=QC（少數大小寫 / 空白變體或非 QC 移動），到 少數落在排除關鍵字的儲位
+- 多分頁：作業員依序分到各分頁；人員 / 時間 / 品號欄名從引擎的候選欄名隨機挑
+  （驗收 USER_COLS / TIME_COLS；上架 INPUT_USER_CANDIDATES / REV_DT_CANDIDATES；品號 ITEM_CANDIDATES），
+  預設整個檔同一組，sheet_variants=True 時各分頁各挑（上架引擎合併分頁後只認第一個命中的欄名，
+  其他分頁的列會因人員 / 時間為空而不計）
+- 代碼與姓名都是假的：roster(spec) / roster_env(spec) 提供對應的名冊（WORK_EFF_ROSTER），
+  否則引擎會因對不到姓名而把人濾掉
+- 同一個 LogSpec（含 seed）產生的內容完全相同
+
+用法：
+    spec = spec_for_rows("qc", 100_000)
+    sheets = generate(spec)                       # {分頁: DataFrame}
+    data = to_bytes(sheets, "csv")
+    with roster_env(spec):
+        run_qc_efficiency(data, "qc.csv")
+
+命令列：
+    python synthetic_logs.py qc|shelf -o 檔案.xlsx|.csv [--rows N | --workers N --days N]
+        [--events-per-hour 24] [--idle-prob 0.03] [--sheets 1] [--no-variants | --sheet-variants] [--extra-sheet]
+        [--seed 1] [--roster 名冊.json]
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import math
+import os
+import sys
+import tempfile
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from batch_ingest import ITEM_CANDIDATES
+from qc_core import TIME_COLS, USER_COLS
+from shelf_core import INPUT_USER_CANDIDATES, REV_DT_CANDIDATES
+
+KINDS = ("qc", "shelf")
+
+# 班別：(名稱, 上班, 下班)
+SHIFTS = (("早班", dt.time(8, 30), dt.time(17, 30)),
+          ("中班", dt.time(10, 30), dt.time(19, 30)),
+          ("晚班", dt.time(13, 30), dt.time(22, 30)))
+SHIFT_WEIGHTS = (0.6, 0.25, 0.15)
+
+# 休息習慣：(名稱, 起, 迄, 會休的機率)
+BREAKS = (("午休", dt.time(12, 30), dt.time(13, 30), 0.9),
+          ("下午茶", dt.time(15, 30), dt.time(15, 45), 0.4),
+          ("晚餐", dt.time(18, 0), dt.time(18, 30), 0.7))
+
+QC_SOURCES = ("RCV01", "RCV02", "A01", "B01")
+OTHER_SOURCES = ("RCV01", "A01", "RT01")
+EXCLUDED_LOCATIONS = ("CGS01", "JCPL-02", "QC99X", "GREAT0001X", "GX010-1", "PD99")
+EXTRA_COLS = ("單號", "倉別", "批號", "備註")
+PIVOT_SHEET = "樞紐"
+
+# 每人每日的大約筆數 ≈ 每小時筆數 × 這個有效工時（扣休息與空窗）；spec_for_rows 用來估人數
+_EFFECTIVE_HOURS = 6.0
+
+
+@dataclass(frozen=True)
+class LogSpec:
+    kind: str = "qc"                 # qc / shelf
+    workers: int = 20
+    days: int = 5
+    rows: Optional[int] = None       # 指定時產生到剛好這麼多列就停（依 日期→作業員 順序）
+    events_per_hour: float = 24.0
+    speed_sd: float = 0.2            # 個人速度倍率的對數標準差
+    idle_prob: float = 0.03          # 每筆之後出現長空窗的平均機率
+    idle_minutes: Tuple[float, float] = (12.0, 50.0)
+    breaks: Tuple[Tuple[str, dt.time, dt.time, float], ...] = BREAKS
+    sheets: int = 1
+    column_variants: bool = True     # 從候選欄名隨機挑（False 一律用第一個）
+    sheet_variants: bool = False     # 各分頁各挑一次（False 整個檔同一組欄名）
+    extra_sheet: bool = False        # 另附一張沒有人員 / 時間欄的分頁（樞紐表之類，引擎應略過）
+    qc_share: float = 0.9            # 驗收：到=QC 的比例
+    putaway_share: float = 0.92      # 上架：由=QC 的比例
+    excluded_share: float = 0.05     # 上架：到 落在排除儲位的比例
+    start: dt.date = dt.date(2025, 3, 3)
+    seed: int = 1
+
+    def __post_init__(self):
+        if self.kind not in KINDS:
+            raise Exception(f"不支援的種類：{self.kind}（可用 {'、'.join(KINDS)}）")
+        if self.workers < 1 or self.days < 1 or self.sheets < 1 or self.events_per_hour <= 0:
+            raise Exception("作業員數、天數、分頁數須至少 1，每小時筆數須大於 0")
+
+
+def spec_for_rows(kind: str, rows: int, days: int = 5, **kw) -> LogSpec:
+    """約 rows 列的 LogSpec：依每人每日的預估筆數推人數（多估一點，產生時截在剛好 rows 列）"""
+    eph = kw.get("events_per_hour", LogSpec.events_per_hour)
+    per_day = max(eph * _EFFECTIVE_HOURS, 1.0)
+    workers = max(1, math.ceil(rows / (days * per_day) * 1.15))
+    return LogSpec(kind=kind, workers=workers, days=days, rows=rows, **kw)
+
+
+# ===== 人員與欄名 =====
+def worker_codes(spec: LogSpec) -> List[str]:
+    """驗收：5 位數員編；上架：11 位數（年月日＋流水號格式）"""
+    if spec.kind == "qc":
+        return [f"{90000 + i:05d}" for i in range(spec.workers)]
+    return [f"209901{i:05d}" for i in range(spec.workers)]
+
+
+def roster(spec: LogSpec) -> Dict[str, Dict[str, str]]:
+    """合成代碼的名冊（roster.json 格式，分組同引擎的 ROSTER_GROUP）"""
+    return {spec.kind: {c: f"測試{spec.kind.upper()}{i:05d}" for i, c in enumerate(worker_codes(spec))}}
+
+
+@contextlib.contextmanager
+def roster_env(*specs: LogSpec) -> Iterator[str]:
+    """暫時把 WORK_EFF_ROSTER 指到合成名冊（多個 spec 合併）；離開時還原並刪檔"""
+    groups: Dict[str, Dict[str, str]] = {}
+    for s in specs:
+        for g, m in roster(s).items():
+            groups.setdefault(g, {}).update(m)
+    fd, path = tempfile.mkstemp(prefix="synthetic_roster_", suffix=".json")
+    old = os.environ.get("WORK_EFF_ROSTER")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(groups, f, ensure_ascii=False)
+        os.environ["WORK_EFF_ROSTER"] = path
+        yield path
+    finally:
+        if old is None:
+            os.environ.pop("WORK_EFF_ROSTER", None)
+        else:
+            os.environ["WORK_EFF_ROSTER"] = old
+        os.remove(path)
+
+
+def _column_names(spec: LogSpec, rng: np.random.Generator) -> List[Tuple[str, str, str]]:
+    """各分頁的（人員欄, 時間欄, 品號欄）"""
+    users, times = (USER_COLS, TIME_COLS) if spec.kind == "qc" else (INPUT_USER_CANDIDATES, REV_DT_CANDIDATES)
+    if not spec.column_variants:
+        return [(users[0], times[0], ITEM_CANDIDATES[0])] * spec.sheets
+
+    def pick():
+        return str(rng.choice(users)), str(rng.choice(times)), str(rng.choice(ITEM_CANDIDATES[:5]))
+
+    return [pick() for _ in range(spec.sheets)] if spec.sheet_variants else [pick()] * spec.sheets
+
+
+def _minutes(t: dt.time) -> float:
+    return t.hour * 60 + t.minute + t.second / 60
+
+
+# ===== 產生 =====
+def _worker_day(spec: LogSpec, rng: np.random.Generator, shift: int, speed: float, idle_p: float) -> np.ndarray:
+    """一位作業員一天的掃描時間（當日 0 點起的分鐘數，遞增）"""
+    _, on, off = SHIFTS[shift]
+    start = _minutes(on) + rng.normal(0, 10)
+    end = _minutes(off) + rng.normal(0, 20)
+    mean_gap = 60.0 / (spec.events_per_hour * speed)
+    n = int((end - start) / mean_gap * 1.5) + 20
+    gaps = rng.exponential(mean_gap, n) + 5 / 60
+    idle = rng.random(n) < idle_p
+    gaps[idle] += rng.uniform(*spec.idle_minutes, int(idle.sum()))
+    t = start + np.cumsum(gaps)
+    t = t[t < min(end, 24 * 60 - 1 / 60)]
+    for _, b0, b1, p in spec.breaks:
+        if rng.random() < p:
+            t = t[(t < _minutes(b0)) | (t >= _minutes(b1))]
+    return t
+
+
+def _locations(rng: np.random.Generator, n: int) -> np.ndarray:
+    """儲位：區(A–F)-走道(01–20)-層(01–05)"""
+    zone = rng.choice(list("ABCDEF"), n)
+    aisle = rng.integers(1, 21, n)
+    level = rng.integers(1, 6, n)
+    return np.char.add(np.char.add(np.char.add(zone, "-"), np.char.zfill(aisle.astype(str), 2)),
+                       np.char.add("-", np.char.zfill(level.astype(str), 2))).astype(object)
+
+
+def _mix(rng: np.random.Generator, share: float, yes, no: np.ndarray) -> np.ndarray:
+    """每列以機率 share 取 yes（單一值或同長陣列），其餘取 no"""
+    return np.where(rng.random(len(no)) < share, yes, no)
+
+
+def generate(spec: LogSpec) -> Dict[str, pd.DataFrame]:
+    """→ {分頁名: DataFrame}；各分頁依時間排序（同匯出檔）"""
+    rng = np.random.default_rng(spec.seed)
+    codes = worker_codes(spec)
+    shifts = rng.choice(len(SHIFTS), spec.workers, p=SHIFT_WEIGHTS)
+    speeds = np.exp(rng.normal(0, spec.speed_sd, spec.workers))
+    idle_ps = np.clip(spec.idle_prob * rng.gamma(2.0, 0.5, spec.workers), 0, 0.5)  # 有人特別常停下來
+
+    who: List[np.ndarray] = []
+    when: List[np.ndarray] = []
+    total = 0
+    for d in range(spec.days):
+        base = np.datetime64(spec.start + dt.timedelta(days=d), "s")
+        for w in range(spec.workers):
+            t = _worker_day(spec, rng, shifts[w], speeds[w], idle_ps[w])
+            if spec.rows is not None:
+                t = t[: spec.rows - total]
+            if len(t):
+                who.append(np.full(len(t), w, dtype=np.int32))
+                when.append(base + np.round(t * 60).astype("timedelta64[s]"))
+                total += len(t)
+            if spec.rows is not None and total >= spec.rows:
+                break
+        if spec.rows is not None and total >= spec.rows:
+            break
+
+    wi = np.concatenate(who) if who else np.empty(0, dtype=np.int32)
+    ts = np.concatenate(when) if when else np.empty(0, dtype="datetime64[s]")
+    n = len(wi)
+    if spec.kind == "qc":
+        src = rng.choice(QC_SOURCES, n).astype(object)
+        dest = _mix(rng, spec.qc_share, "QC", _locations(rng, n))
+    else:
+        qc = _mix(rng, 0.95, "QC", rng.choice(("qc", "QC ", " Qc"), n).astype(object))
+        src = _mix(rng, spec.putaway_share, qc, rng.choice(OTHER_SOURCES, n).astype(object))
+        dest = _mix(rng, spec.excluded_share, rng.choice(EXCLUDED_LOCATIONS, n).astype(object), _locations(rng, n))
+    items = np.char.add("P", np.char.zfill(np.minimum(rng.zipf(1.3, n), 99999).astype(str), 5)).astype(object)
+    qty = rng.geometric(0.35, n)
+    docs = np.char.add("RV", np.char.zfill((rng.integers(0, 10**7, n)).astype(str), 7)).astype(object)
+
+    names = _column_names(spec, rng)
+    sheet_of = wi % spec.sheets
+    prefix = "驗收" if spec.kind == "qc" else "上架"
+    out: Dict[str, pd.DataFrame] = {}
+    for i, (ucol, tcol, icol) in enumerate(names):
+        m = sheet_of == i
+        order = np.argsort(ts[m], kind="stable")
+        sel = np.flatnonzero(m)[order]
+        out[f"{prefix}{i + 1}" if spec.sheets > 1 else prefix] = pd.DataFrame({
+            EXTRA_COLS[0]: docs[sel],
+            ucol: np.asarray(codes, dtype=object)[wi[sel]],
+            tcol: ts[sel],
+            "由": src[sel],
+            "到": dest[sel],
+            icol: items[sel],
+            "數量": qty[sel],
+            EXTRA_COLS[1]: "W1",
+            EXTRA_COLS[2]: "",
+            EXTRA_COLS[3]: "",
+        })
+    if spec.extra_sheet:
+        out[PIVOT_SHEET] = pd.DataFrame({"區": list("ABCDEF"), "筆數": rng.integers(100, 1000, 6)})
+    return out
+
+
+def to_bytes(sheets: Dict[str, pd.DataFrame], fmt: str = "xlsx") -> bytes:
+    """
+    xlsx：每個分頁一張工作表
+    csv ：只有一張表 → 資料分頁依序接起來（欄名用第一張的，不含 樞紐 分頁）；UTF-8 BOM
+    """
+    if fmt == "csv":
+        frames = [df for name, df in sheets.items() if name != PIVOT_SHEET]
+        if not frames:
+            raise Exception("沒有可輸出成 CSV 的資料分頁")
+        cols = list(frames[0].columns)
+        df = pd.concat([f.set_axis(cols, axis=1) for f in frames], ignore_index=True)
+        return df.to_csv(index=False, date_format="%Y-%m-%d %H:%M:%S").encode("utf-8-sig")
+    if fmt != "xlsx":
+        raise Exception(f"不支援的格式：{fmt}")
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as w:
+        for name, df in sheets.items():
+            df.to_excel(w, index=False, sheet_name=name)
+    return buf.getvalue()
+
+
+def make(spec: LogSpec, fmt: str = "xlsx") -> bytes:
+    return to_bytes(generate(spec), fmt)
+
+
+# ===== 命令列 =====
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="產生合成的驗收 / 上架匯出檔")
+    ap.add_argument("kind", choices=KINDS)
+    ap.add_argument("-o", "--out", required=True, help="輸出檔（副檔名 .xlsx / .csv 決定格式）")
+    ap.add_argument("--rows", type=int, help="總列數（指定時依天數推算人數）")
+    ap.add_argument("--workers", type=int, default=LogSpec.workers)
+    ap.add_argument("--days", type=int, default=LogSpec.days)
+    ap.add_argument("--events-per-hour", type=float, default=LogSpec.events_per_hour)
+    ap.add_argument("--idle-prob", type=float, default=LogSpec.idle_prob)
+    ap.add_argument("--sheets", type=int, default=LogSpec.sheets)
+    ap.add_argument("--no-variants", action="store_true", help="各分頁一律用第一個候選欄名")
+    ap.add_argument("--sheet-variants", action="store_true", help="各分頁各挑一組欄名")
+    ap.add_argument("--extra-sheet", action="store_true", help="另附一張非資料分頁")
+    ap.add_argument("--seed", type=int, default=LogSpec.seed)
+    ap.add_argument("--roster", help="一併寫出合成名冊（JSON；計算時設 WORK_EFF_ROSTER 指向它）")
+    args = ap.parse_args(argv)
+
+    kw = dict(events_per_hour=args.events_per_hour, idle_prob=args.idle_prob, sheets=args.sheets,
+              column_variants=not args.no_variants, sheet_variants=args.sheet_variants,
+              extra_sheet=args.extra_sheet, seed=args.seed)
+    spec = spec_for_rows(args.kind, args.rows, days=args.days, **kw) if args.rows \
+        else LogSpec(kind=args.kind, workers=args.workers, days=args.days, **kw)
+    fmt = "csv" if args.out.lower().endswith(".csv") else "xlsx"
+    sheets = generate(spec)
+    with open(args.out, "wb") as f:
+        f.write(to_bytes(sheets, fmt))
+    if args.roster:
+        with open(args.roster, "w", encoding="utf-8") as f:
+            json.dump(roster(spec), f, ensure_ascii=False, indent=1)
+    rows = sum(len(df) for name, df in sheets.items() if name != PIVOT_SHEET)
+    print(f"{args.out}：{rows} 列，{spec.workers} 人 × {spec.days} 天，分頁 {'、'.join(sheets)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
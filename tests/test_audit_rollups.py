@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""kpi_rollups 的加減 / 重建 / 分頁讀取（經 rpc，在 Supabase 替身上跑）"""
+import threading
+
+import pytest
+
+import fake_supabase
+from audit_store import delete_audit_runs, fetch_rollups, insert_audit_run, rebuild_rollups
+
+APP = "驗收達標效率"
+
+
+def _row(worker, days=1, count=10.0, start="2025-03-01", ptype="month"):
+    return {"period_type": ptype, "period_start": start, "app_name": APP, "shift": "上午", "worker": worker,
+            "worker_name": f"姓名{worker}", "worker_days": days, "count_sum": count, "minutes_sum": 60.0 * days,
+            "pass_days": days, "eff_hist": {"10": days}}
+
+
+def _state(sb):
+    keep = ("worker", "period_start", "worker_days", "count_sum", "minutes_sum", "pass_days", "eff_hist")
+    return sorted(({k: r[k] for k in keep} for r in sb.tables.get("kpi_rollups", [])),
+                  key=lambda r: (r["worker"], r["period_start"]))
+
+
+@pytest.fixture
+def sb():
+    with fake_supabase.installed() as fake:
+        yield fake
+
+
+def test_concurrent_inserts_add_up(sb):
+    threads = [threading.Thread(target=insert_audit_run, args=({"app_name": APP, "rollup_contrib": [_row("A")]},))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    (r,) = sb.tables["kpi_rollups"]
+    assert (r["worker_days"], r["count_sum"], r["eff_hist"]) == (8, 80.0, {"10": 8})
+
+
+def test_delete_then_rebuild(sb):
+    a = insert_audit_run({"app_name": APP, "rollup_contrib": [_row("A"), _row("B", days=2)]})
+    insert_audit_run({"app_name": APP, "rollup_contrib": [_row("A", days=3, count=5.0)]})
+    live = _state(sb)
+
+    sb.tables["kpi_rollups"] = []
+    assert rebuild_rollups() == 2
+    assert _state(sb) == live
+
+    delete_audit_runs([a["id"]])
+    assert [(r["worker"], r["worker_days"]) for r in _state(sb)] == [("A", 3)]
+
+
+def test_fetch_rollups_pages_past_limit(sb):
+    insert_audit_run({"app_name": APP, "rollup_contrib": [_row(f"W{i:03d}", ptype="week") for i in range(25)]})
+    rows = fetch_rollups(app_name=APP, period_type="week", page_size=10)
+    assert [r["worker"] for r in rows] == [f"W{i:03d}" for i in range(25)]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""PartialStore.ingest：compute 失敗不留下半套分區；同時累加同一資料集不遺失事件"""
+import datetime as dt
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from partial_store import PartialStore
+
+D1, D2 = dt.date(2025, 3, 3), dt.date(2025, 3, 4)
+
+
+def _events(worker, day, n=3):
+    ts = pd.date_range(f"{day} 09:00", periods=n, freq="10min")
+    return pd.DataFrame({"w": worker, "_dt": ts, "日期": day})
+
+
+def _count(day, ev):
+    return {"daily": ev.groupby("w", as_index=False).size()}
+
+
+def test_failed_compute_keeps_existing_partitions(tmp_path):
+    store = PartialStore("t", "ds", root=str(tmp_path))
+    store.ingest(pd.concat([_events("A", D1), _events("A", D2)]), worker_col="w", compute=_count)
+    before = store.load_all("daily")
+
+    def boom(day, ev):
+        if day == D2:
+            raise RuntimeError("壞資料")
+        return _count(day, ev)
+
+    with pytest.raises(RuntimeError):
+        store.ingest(pd.concat([_events("B", D1), _events("B", D2)]), worker_col="w", compute=boom)
+    pd.testing.assert_frame_equal(store.load_all("daily"), before)
+    assert set(store.load(D1)["events"]["w"]) == {"A"}
+
+
+def test_concurrent_ingest_keeps_both(tmp_path):
+    def slow(day, ev):
+        time.sleep(0.2)  # 兩邊的讀-合併-寫交錯時，沒有鎖就會蓋掉對方的事件
+        return _count(day, ev)
+
+    def run(worker):
+        PartialStore("t", "ds", root=str(tmp_path)).ingest(_events(worker, D1), worker_col="w", compute=slow)
+
+    threads = [threading.Thread(target=run, args=(w,)) for w in ("A", "B")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    store = PartialStore("t", "ds", root=str(tmp_path))
+    assert sorted(store.load_all("daily")["w"]) == ["A", "B"]
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""增量模式留存：同一天重傳 / 修正後重傳，月 / 週彙總（kpi_rollups）不重複累加"""
+import io
+
+import pandas as pd
+import pytest
+
+import fake_supabase
+from audit_store import insert_incremental_audit_run
+from kpi_rollup import contrib_by_date, diff_rollup_contrib
+from partial_store import PartialStore
+from shelf_core import ShelfParams, run_shelf_job
+from synthetic_logs import make, roster_env, spec_for_rows
+
+APP = "上架產能分析（Putaway KPI）"
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    monkeypatch.setenv("WORK_EFF_STATE_DIR", str(tmp_path))
+    monkeypatch.setenv("WORK_EFF_UPLOAD_CACHE_MB", "0")
+    spec = spec_for_rows("shelf", 1500, days=2, seed=11)
+    with roster_env(spec), fake_supabase.installed() as sb:
+        yield spec, sb
+
+
+def _persist(files, store):
+    res, _, affected = run_shelf_job(files, store=store)
+    dates = [f"{d:%Y-%m-%d}" for d in affected]
+    new_by_date = contrib_by_date(res.detail_long, dates, app_name=APP, target_eff=res.params.target_eff,
+                                  user_col=res.user_col, name_col="對應姓名", minutes_col="工時_分鐘",
+                                  eff_col="效率_件每小時")
+    insert_incremental_audit_run({"app_name": APP}, new_by_date, store)
+    return res
+
+
+def _rollups(sb):
+    rows = [{k: v for k, v in r.items() if k not in ("id", "created_at", "updated_at")}
+            for r in sb.tables.get("kpi_rollups", [])]
+    return sorted(rows, key=lambda r: (r["period_type"], r["period_start"], r["shift"], r["worker"]))
+
+
+def test_reingest_same_day_keeps_rollups(env):
+    spec, sb = env
+    store = PartialStore("putaway", "t", ShelfParams().store_params())
+    files = [("day.csv", make(spec, "csv"))]
+
+    _persist(files, store)
+    first = _rollups(sb)
+    assert first and sum(r["worker_days"] for r in first) > 0
+
+    _persist(files, store)
+    assert _rollups(sb) == first
+    # 第二次留存的貢獻是空差額
+    assert sb.tables["audit_runs"][-1]["rollup_contrib"] == []
+
+
+def test_corrected_reupload_replaces_contribution(env):
+    spec, sb = env
+    store = PartialStore("putaway", "t", ShelfParams().store_params())
+    data = make(spec, "csv")
+    _persist([("day.csv", data)], store)
+
+    # 修正檔：同樣的人員 / 日期，紀錄隔列刪掉一半 → 彙總應等於「只上傳修正檔」的結果
+    df = pd.read_csv(io.BytesIO(data), dtype=str)
+    fixed = df.iloc[::2].to_csv(index=False).encode("utf-8-sig")
+    _persist([("fixed.csv", fixed)], store)
+    corrected = _rollups(sb)
+
+    with fake_supabase.installed() as fresh:
+        other = PartialStore("putaway", "other", ShelfParams().store_params())
+        _persist([("fixed.csv", fixed)], other)
+        assert corrected == _rollups(fresh)
+
+
+def test_diff_rollup_contrib_cancels_out():
+    row = {"period_type": "month", "period_start": "2025-03-01", "app_name": APP, "shift": "上午",
+           "worker": "A", "worker_name": "甲", "worker_days": 2, "count_sum": 30.5, "minutes_sum": 120.0,
+           "pass_days": 1, "eff_hist": {"12": 1, "18": 1}}
+    assert diff_rollup_contrib([row], [row]) == []
+    less = {**row, "worker_days": 1, "count_sum": 10.0, "pass_days": 0, "eff_hist": {"12": 1}}
+    (d,) = diff_rollup_contrib([less], [row])
+    assert (d["worker_days"], d["count_sum"], d["pass_days"], d["eff_hist"]) == (-1, -20.5, -1, {"18": -1})
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上傳檔解析結果快取（磁碟）
+- 同一份匯出檔換排除規則 / 目標值重新分析時，直接載入上次解析＋正規化好的 {分頁: DataFrame}，不再解析試算表
+- 鍵：檔案內容 sha256（檔名不同、內容相同也命中）＋讀法（qc / qc_src / shelf-<排除關鍵字簽章>）＋ CACHE_VERSION
+- 每張分頁存一個 Parquet 檔（pyarrow，讀取時 memory-map）；沒裝 pyarrow 或欄位型別存不進 Parquet 時改存 pickle
+- 總大小超過上限時，依最後使用時間（LRU）淘汰最舊的項目
+- 快取讀寫失敗一律當作沒命中，不影響計算
+
+存放位置：WORK_EFF_STATE_DIR（見 partial_store.state_dir）之下 upload_cache/<讀法>-v<版本>-<sha256>/
+設定（環境變數）：
+    WORK_EFF_UPLOAD_CACHE_MB  快取總大小上限（MB，預設 512；0 為停用）
+"""
+from __future__ import annotations
+
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Callable, Dict, Optional, Sequence
+
+import pandas as pd
+
+from partial_store import state_dir
+
+CACHE_VERSION = 1  # 讀檔 / 正規化邏輯改變時遞增，舊快取自動失效
+MANIFEST = "manifest.json"
+
+
+def cache_dir() -> str:
+    return os.path.join(state_dir(), "upload_cache")
+
+
+def cap_bytes() -> int:
+    return int(float(os.environ.get("WORK_EFF_UPLOAD_CACHE_MB", "512")) * 1024 * 1024)
+
+
+def _entry(namespace: str, sha: str) -> str:
+    return os.path.join(cache_dir(), f"{namespace}-v{CACHE_VERSION}-{sha}")
+
+
+# ===== 單一項目讀寫 =====
+def _write_sheet(df: pd.DataFrame, base: str) -> str:
+    """→ 檔名；欄名都是字串且 pyarrow 存得下時用 Parquet，否則 pickle"""
+    if importlib.util.find_spec("pyarrow") is not None and all(isinstance(c, str) for c in df.columns) \
+            and df.columns.is_unique:
+        try:
+            df.to_parquet(base + ".parquet")
+            return os.path.basename(base) + ".parquet"
+        except Exception:
+            pass  # 混型別 object 欄等
+    pd.to_pickle(df, base + ".pkl")
+    return os.path.basename(base) + ".pkl"
+
+
+def _read_sheet(path: str, object_cols: Sequence[str]) -> pd.DataFrame:
+    if path.endswith(".pkl"):
+        return pd.read_pickle(path)
+    df = pd.read_parquet(path, memory_map=True)
+    for c in object_cols:  # Parquet 讀回字串欄會變成 str dtype，還原成原本的 object
+        df[c] = df[c].astype(object)
+    return df
+
+
+def save(namespace: str, sha: str, sheets: Dict[str, pd.DataFrame]):
+    """寫到暫存目錄後整個改名（其他 process 不會讀到寫一半的項目），再依上限淘汰"""
+    final = _entry(namespace, sha)
+    tmp = f"{final}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(tmp)
+    try:
+        meta = []
+        for i, (name, df) in enumerate(sheets.items()):
+            fn = _write_sheet(df, os.path.join(tmp, str(i)))
+            meta.append({"name": name, "file": fn,
+                         "object_cols": [c for c in df.columns if df[c].dtype == object]})
+        with open(os.path.join(tmp, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump({"sheets": meta, "created": time.time()}, f, ensure_ascii=False)
+        os.replace(tmp, final)
+    except OSError:
+        # 同一檔已由其他 process 寫入（目錄已存在）或磁碟錯誤
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    evict()
+
+
+def load(namespace: str, sha: str) -> Optional[Dict[str, pd.DataFrame]]:
+    """命中 → {分頁: DataFrame}（並更新最後使用時間）；沒有或讀取失敗 → None"""
+    path = _entry(namespace, sha)
+    try:
+        with open(os.path.join(path, MANIFEST), encoding="utf-8") as f:
+            meta = json.load(f)
+        sheets = {m["name"]: _read_sheet(os.path.join(path, m["file"]), m["object_cols"]) for m in meta["sheets"]}
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        shutil.rmtree(path, ignore_errors=True)  # 損毀的項目
+        return None
+    return sheets
+
+
+# ===== 容量控管 =====
+def _size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for fn in files:
+            try:
+                total += os.path.getsize(os.path.join(root, fn))
+            except OSError:
+                pass
+    return total
+
+
+def entries() -> pd.DataFrame:
+    """目前的快取項目（名稱, 大小_bytes, 最後使用），依最後使用時間由舊到新"""
+    rows = []
+    root = cache_dir()
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if ".tmp-" in name or not os.path.isdir(path):
+                continue
+            try:
+                rows.append({"名稱": name, "大小_bytes": _size(path), "最後使用": os.path.getmtime(path)})
+            except OSError:
+                continue
+    return pd.DataFrame(rows, columns=["名稱", "大小_bytes", "最後使用"]).sort_values("最後使用", ignore_index=True)
+
+
+def evict(cap: Optional[int] = None) -> int:
+    """總大小超過 cap（預設 cap_bytes()）時由最久沒用的開始刪；回傳刪除數"""
+    cap = cap_bytes() if cap is None else cap
+    ent = entries()
+    total = int(ent["大小_bytes"].sum())
+    removed = 0
+    for row in ent.itertuples(index=False):
+        if total <= cap:
+            break
+        shutil.rmtree(os.path.join(cache_dir(), row.名稱), ignore_errors=True)
+        total -= row.大小_bytes
+        removed += 1
+    return removed
+
+
+def clear():
+    shutil.rmtree(cache_dir(), ignore_errors=True)
+
+
+# ===== 讀檔入口 =====
+def file_sha256(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def lookup(namespaces: Sequence[str], file_bytes: bytes) -> Optional[Dict[str, pd.DataFrame]]:
+    """依序查各讀法的快取（預覽用：不解析，只拿已存在的結果）"""
+    if cap_bytes() <= 0:
+        return None
+    sha = file_sha256(file_bytes)
+    for ns in namespaces:
+        sheets = load(ns, sha)
+        if sheets is not None:
+            return sheets
+    return None
+
+
+def cached_read(namespace: str, file_bytes: bytes, filename: str,
+                reader: Callable[[bytes, str], Dict[str, pd.DataFrame]]) -> Dict[str, pd.DataFrame]:
+    """
+    reader(bytes, 檔名) 的結果以內容 sha256 快取；命中時完全不解析。
+    reader 的結果不可依檔名而異（格式由 sheet_reader 看檔頭判斷，符合此條件）。
+    """
+    if cap_bytes() <= 0:
+        return reader(file_bytes, filename)
+    sha = file_sha256(file_bytes)
+    sheets = load(namespace, sha)
+    if sheets is not None:
+        return sheets
+    sheets = reader(file_bytes, filename)
+    try:
+        save(namespace, sha, sheets)
+    except Exception:
+        pass  # 快取寫入失敗不影響計算
+    return sheets